@@ -0,0 +1,50 @@
+"""add throughput settings to scheduled_broadcasts
+
+Revision ID: 20241114_01
+Revises: 20241113_01
+Create Date: 2024-11-14 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20241114_01"
+down_revision: Union[str, None] = "20241113_01"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("scheduled_broadcasts"):
+        return
+
+    columns = {col["name"] for col in inspector.get_columns("scheduled_broadcasts")}
+    if "messages_per_second" not in columns:
+        op.add_column(
+            "scheduled_broadcasts",
+            sa.Column("messages_per_second", sa.Float(), nullable=True),
+        )
+    if "concurrency" not in columns:
+        op.add_column(
+            "scheduled_broadcasts",
+            sa.Column("concurrency", sa.Integer(), nullable=True),
+        )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("scheduled_broadcasts"):
+        return
+
+    columns = {col["name"] for col in inspector.get_columns("scheduled_broadcasts")}
+    if "concurrency" in columns:
+        op.drop_column("scheduled_broadcasts", "concurrency")
+    if "messages_per_second" in columns:
+        op.drop_column("scheduled_broadcasts", "messages_per_second")
@@ -0,0 +1,77 @@
+"""add broadcast delivery ledger and checkpoint columns
+
+Revision ID: 20241115_01
+Revises: 20241114_01
+Create Date: 2024-11-15 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20241115_01"
+down_revision: Union[str, None] = "20241114_01"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if not inspector.has_table("scheduled_broadcasts"):
+        return
+
+    columns = {col["name"] for col in inspector.get_columns("scheduled_broadcasts")}
+    if "checkpoint_user_id" not in columns:
+        op.add_column(
+            "scheduled_broadcasts",
+            sa.Column("checkpoint_user_id", sa.Integer(), nullable=True),
+        )
+    if "heartbeat_at" not in columns:
+        op.add_column(
+            "scheduled_broadcasts",
+            sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=True),
+        )
+    if "claimed_by" not in columns:
+        op.add_column(
+            "scheduled_broadcasts",
+            sa.Column("claimed_by", sa.String(length=32), nullable=True),
+        )
+
+    if not inspector.has_table("broadcast_deliveries"):
+        op.create_table(
+            "broadcast_deliveries",
+            sa.Column(
+                "broadcast_id",
+                sa.Integer(),
+                sa.ForeignKey("scheduled_broadcasts.id", ondelete="CASCADE"),
+                primary_key=True,
+            ),
+            sa.Column("user_id", sa.Integer(), primary_key=True),
+            sa.Column("telegram_id", sa.BigInteger(), nullable=False),
+            sa.Column("status", sa.String(length=16), nullable=False),
+            sa.Column("error", sa.String(length=255), nullable=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if inspector.has_table("broadcast_deliveries"):
+        op.drop_table("broadcast_deliveries")
+
+    if not inspector.has_table("scheduled_broadcasts"):
+        return
+
+    columns = {col["name"] for col in inspector.get_columns("scheduled_broadcasts")}
+    if "claimed_by" in columns:
+        op.drop_column("scheduled_broadcasts", "claimed_by")
+    if "heartbeat_at" in columns:
+        op.drop_column("scheduled_broadcasts", "heartbeat_at")
+    if "checkpoint_user_id" in columns:
+        op.drop_column("scheduled_broadcasts", "checkpoint_user_id")
@@ -0,0 +1,51 @@
+"""add users.channels_kick_pending
+
+Revision ID: 20241115_02
+Revises: 20241115_01
+Create Date: 2024-11-15 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20241115_02"
+down_revision: Union[str, None] = "20241115_01"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    columns = {column["name"] for column in inspector.get_columns("users")}
+    if "channels_kick_pending" not in columns:
+        op.add_column(
+            "users",
+            sa.Column(
+                "channels_kick_pending",
+                sa.Boolean(),
+                nullable=False,
+                server_default=sa.false(),
+            ),
+        )
+
+    indexes = {index["name"] for index in inspector.get_indexes("users")}
+    if "ix_users_channels_kick_pending" not in indexes:
+        op.create_index("ix_users_channels_kick_pending", "users", ["channels_kick_pending"])
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    indexes = {index["name"] for index in inspector.get_indexes("users")}
+    if "ix_users_channels_kick_pending" in indexes:
+        op.drop_index("ix_users_channels_kick_pending", table_name="users")
+    columns = {column["name"] for column in inspector.get_columns("users")}
+    if "channels_kick_pending" in columns:
+        op.drop_column("users", "channels_kick_pending")
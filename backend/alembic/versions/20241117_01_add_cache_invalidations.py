@@ -0,0 +1,45 @@
+"""add cache invalidations journal
+
+Revision ID: 20241117_01
+Revises: 20241116_01
+Create Date: 2024-11-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20241117_01"
+down_revision: Union[str, None] = "20241116_01"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if inspector.has_table("cache_invalidations"):
+        return
+
+    op.create_table(
+        "cache_invalidations",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("scope", sa.String(length=16), nullable=False),
+        sa.Column("key", sa.String(length=64), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sqlite_autoincrement=True,
+    )
+    op.create_index(
+        "ix_cache_invalidations_created_at", "cache_invalidations", ["created_at"]
+    )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if inspector.has_table("cache_invalidations"):
+        op.drop_index("ix_cache_invalidations_created_at", table_name="cache_invalidations")
+        op.drop_table("cache_invalidations")
@@ -0,0 +1,61 @@
+"""add payment events inbox
+
+Revision ID: 20241118_01
+Revises: 20241117_01
+Create Date: 2024-11-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20241118_01"
+down_revision: Union[str, None] = "20241117_01"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if inspector.has_table("payment_events"):
+        return
+
+    op.create_table(
+        "payment_events",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("provider", sa.String(length=16), nullable=False),
+        sa.Column("idempotency_key", sa.String(length=255), nullable=False),
+        sa.Column("event", sa.String(length=64), nullable=False),
+        sa.Column("external_id", sa.String(length=255), nullable=False),
+        sa.Column(
+            "payload",
+            sa.JSON().with_variant(postgresql.JSONB(), "postgresql"),
+            nullable=False,
+        ),
+        sa.Column("status", sa.String(length=16), nullable=False, server_default="PENDING"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("available_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column("locked_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column("processed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.UniqueConstraint("idempotency_key", name="uq_payment_events_idempotency_key"),
+    )
+    op.create_index("ix_payment_events_external_id", "payment_events", ["external_id"])
+    op.create_index("ix_payment_events_status", "payment_events", ["status"])
+    op.create_index("ix_payment_events_processed_at", "payment_events", ["processed_at"])
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if inspector.has_table("payment_events"):
+        op.drop_index("ix_payment_events_processed_at", table_name="payment_events")
+        op.drop_index("ix_payment_events_status", table_name="payment_events")
+        op.drop_index("ix_payment_events_external_id", table_name="payment_events")
+        op.drop_table("payment_events")
@@ -0,0 +1,65 @@
+"""add bot daily stats rollups
+
+Revision ID: 20241119_01
+Revises: 20241118_01
+Create Date: 2024-11-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20241119_01"
+down_revision: Union[str, None] = "20241118_01"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    payment_indexes = {index["name"] for index in inspector.get_indexes("payments")}
+    if "ix_payments_paid_at" not in payment_indexes:
+        op.create_index("ix_payments_paid_at", "payments", ["paid_at"])
+    if "ix_payments_user_paid_at" not in payment_indexes:
+        op.create_index("ix_payments_user_paid_at", "payments", ["user_id", "paid_at"])
+
+    if inspector.has_table("bot_daily_stats"):
+        return
+
+    # Заполняет фоновая задача refresh_daily_rollups при первом запуске
+    op.create_table(
+        "bot_daily_stats",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "bot_id",
+            sa.Integer(),
+            sa.ForeignKey("bots.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("revenue", sa.Numeric(14, 2), nullable=False, server_default="0"),
+        sa.Column("payments_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("new_subscriptions", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("renewals", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("churned", sa.Integer(), nullable=False, server_default="0"),
+        sa.UniqueConstraint("bot_id", "day", name="uq_bot_daily_stats_bot_day"),
+    )
+    op.create_index("ix_bot_daily_stats_day", "bot_daily_stats", ["day"])
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if inspector.has_table("bot_daily_stats"):
+        op.drop_index("ix_bot_daily_stats_day", table_name="bot_daily_stats")
+        op.drop_table("bot_daily_stats")
+    payment_indexes = {index["name"] for index in inspector.get_indexes("payments")}
+    if "ix_payments_user_paid_at" in payment_indexes:
+        op.drop_index("ix_payments_user_paid_at", table_name="payments")
+    if "ix_payments_paid_at" in payment_indexes:
+        op.drop_index("ix_payments_paid_at", table_name="payments")
@@ -1,34 +1,58 @@
 from __future__ import annotations
 
+import json
+from collections.abc import AsyncIterator
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+import hmac
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ....api.deps import get_db
+from ....core.config import settings
+from ....db.session import AsyncSessionLocal
+from ....models.cache_invalidation import CacheScope
+from ....models.subscription import Subscription
 from ....models.user import User
 from ....schemas.bot import (
     BotUserRegisterRequest,
+    BotTenant,
     BotUserUpdateRequest,
+    CacheInvalidationsResponse,
     ChannelPublic,
     PaymentConfirmResponse,
     PaymentCreateRequest,
     PaymentCreateResponse,
+    SubscriptionStatusBatchItem,
+    SubscriptionStatusBatchRequest,
     SubscriptionStatusResponse,
 )
 from ....schemas.user import UserRead
+from ....services.bots import BotService
+from ....services.cache_invalidation import CacheInvalidationService
 from ....services.channels import ChannelService
 from ....services.payments import PaymentService
 from ....services.promo_codes import PromoCodeService
 from ....services.users import UserService
-from ....services.notifications import send_admin_message
+from ....services.notifications import (
+    KIND_PAYMENT_CREATED,
+    KIND_PAYMENT_SUCCEEDED,
+    KIND_REGISTRATION,
+    KIND_SUBSCRIPTION_CANCELED,
+    send_admin_message,
+)
 from ....services.subscription_plans import SubscriptionPlanService
 
 router = APIRouter()
 
+# Размер страницы при потоковой выдаче истекших подписок (format=ndjson)
+_EXPIRED_STREAM_BATCH_SIZE = 1000
+
 
 @router.post("/users/register", response_model=UserRead, summary="Регистрация участницы через бота")
 async def bot_register_user(
@@ -41,7 +65,8 @@ async def bot_register_user(
     except ValueError as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
     await send_admin_message(
-        f"Новая регистрация: {user.first_name or user.username or user.telegram_id}"
+        f"Новая регистрация: {user.first_name or user.username or user.telegram_id}",
+        KIND_REGISTRATION,
     )
     return UserRead.model_validate(user)
 
@@ -63,6 +88,26 @@ async def bot_update_user(
     return UserRead.model_validate(user)
 
 
+@router.post(
+    "/users/status:batch",
+    response_model=list[SubscriptionStatusBatchItem],
+    summary="Статусы подписок для списка Telegram ID",
+)
+async def bot_subscription_statuses(
+    payload: SubscriptionStatusBatchRequest,
+    session: AsyncSession = Depends(get_db),
+) -> list[SubscriptionStatusBatchItem]:
+    service = UserService(session)
+    statuses = await service.get_subscription_statuses_for_telegram(
+        payload.telegram_ids,
+        bot_id=payload.bot_id,
+    )
+    return [
+        SubscriptionStatusBatchItem(telegram_id=telegram_id, **status.model_dump())
+        for telegram_id, status in statuses.items()
+    ]
+
+
 @router.get(
     "/users/{telegram_id}/status",
     response_model=SubscriptionStatusResponse,
@@ -80,6 +125,56 @@ async def bot_subscription_status(
     )
 
 
+def _require_service_token(token: str | None) -> None:
+    expected = settings.bot_service_token
+    if expected is None or token is None or not hmac.compare_digest(
+        token.encode(), expected.get_secret_value().encode()
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Доступ запрещен")
+
+
+@router.get(
+    "/bots/active",
+    response_model=list[BotTenant],
+    summary="Активные боты с токенами для процесса бота",
+)
+async def bot_active_bots(
+    session: AsyncSession = Depends(get_db),
+    x_bot_service_token: str | None = Header(default=None),
+) -> list[BotTenant]:
+    """Отдает расшифрованные токены, поэтому требует BOT_SERVICE_TOKEN в заголовке X-Bot-Service-Token."""
+    _require_service_token(x_bot_service_token)
+    service = BotService(session)
+    return [
+        BotTenant(id=bot.id, slug=bot.slug, name=bot.name, token=token)
+        for bot, token in await service.list_active_with_tokens()
+    ]
+
+
+@router.get(
+    "/cache/invalidations",
+    response_model=CacheInvalidationsResponse,
+    summary="Инвалидации кэша бота",
+)
+async def bot_cache_invalidations(
+    session: AsyncSession = Depends(get_db),
+    after: int | None = Query(default=None, ge=0, description="курсор из предыдущего ответа"),
+    limit: int = Query(default=1000, ge=1, le=5000),
+) -> CacheInvalidationsResponse:
+    """
+    События инвалидации кэша после курсора `after`.
+
+    Бот опрашивает этот метод и удаляет из кэша записи с указанными `scope` и `key`
+    (`key = null` — вся область). При `reset=true` кэш нужно сбросить целиком.
+    Недавние события с `id <= after` приходят повторно, их различают по `id`.
+    """
+    service = CacheInvalidationService(session)
+    page = await service.list_since(
+        after, limit, timedelta(seconds=settings.cache_invalidation_lookback_seconds)
+    )
+    return CacheInvalidationsResponse.model_validate(page)
+
+
 @router.get("/channels", response_model=list[ChannelPublic], summary="Список каналов для бота")
 async def bot_channels(
     session: AsyncSession = Depends(get_db),
@@ -103,37 +198,34 @@ async def bot_create_payment(
     payload: PaymentCreateRequest,
     session: AsyncSession = Depends(get_db),
 ) -> PaymentCreateResponse:
-    user_service = UserService(session)
     payment_service = PaymentService(session)
 
-    user: User | None = None
-    if payload.user_id is not None:
-        user = await session.get(User, payload.user_id)
-    if user is None:
-        user = await user_service.get_by_telegram(
-            payload.telegram_id,
-            bot_id=payload.bot_id,
-        )
+    # Тариф, пользователь и промокод — одним запросом к БД
+    checkout = await payment_service.load_checkout(
+        plan_id=payload.plan_id,
+        telegram_id=payload.telegram_id,
+        user_id=payload.user_id,
+        bot_id=payload.bot_id,
+        promo_code=payload.promo_code,
+    )
+    if checkout is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Тариф не найден")
+    plan = checkout.plan
+    user = checkout.user
 
     if user is None:
         # Автоматически создаем пользователь если не найден
         user_data = {
             "telegram_id": payload.telegram_id,
-            "bot_id": payload.bot_id,
+            "bot_id": payload.bot_id if payload.bot_id is not None else plan.bot_id,
             "first_name": "Пользователь",
             "last_name": f"ID:{payload.telegram_id}",
         }
         try:
-            user = await user_service.register_from_bot(user_data)
+            user = await UserService(session).register_from_bot(user_data)
         except ValueError as exc:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
 
-    plan_service = SubscriptionPlanService(session)
-    try:
-        plan = await plan_service.get_plan(payload.plan_id)
-    except ValueError as exc:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(exc)) from exc
-
     if plan.bot_id != user.bot_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -151,28 +243,28 @@ async def bot_create_payment(
     discount_info: dict | None = None
     
     if payload.promo_code:
-        promo_service = PromoCodeService(session)
+        promo_code = checkout.promo_code
         try:
-            promo_code, discounted_price = await promo_service.validate_promo_code(
-                payload.promo_code, user.bot_id, plan.price_amount
-            )
-            promo_code_id = promo_code.id
-            final_amount = discounted_price
-            discount_amount = plan.price_amount - discounted_price
-            discount_info = {
-                "promo_code": promo_code.code,
-                "promo_code_id": promo_code.id,
-                "discount_type": promo_code.discount_type.value,
-                "discount_value": str(promo_code.discount_value),
-                "original_price": str(plan.price_amount),
-                "discount_amount": str(discount_amount),
-                "final_price": str(discounted_price),
-            }
+            if promo_code is None:
+                raise ValueError("Промокод не найден")
+            discounted_price = PromoCodeService.check_promo_code(promo_code, plan.price_amount)
         except ValueError as exc:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Ошибка промокода: {exc}",
             ) from exc
+        promo_code_id = promo_code.id
+        final_amount = discounted_price
+        discount_amount = plan.price_amount - discounted_price
+        discount_info = {
+            "promo_code": promo_code.code,
+            "promo_code_id": promo_code.id,
+            "discount_type": promo_code.discount_type.value,
+            "discount_value": str(promo_code.discount_value),
+            "original_price": str(plan.price_amount),
+            "discount_amount": str(discount_amount),
+            "final_price": str(discounted_price),
+        }
 
     payment = await payment_service.ensure_yookassa_payment(
         user=user,
@@ -182,8 +274,10 @@ async def bot_create_payment(
         promo_code_id=promo_code_id,
         promo_code_info=discount_info,
     )
+    # Только постановка в очередь: в Telegram уведомление уйдет после ответа боту
     await send_admin_message(
-        f"Создан счёт #{payment['payment_id']} на {payment['amount_formatted']}"
+        f"Создан счёт #{payment['payment_id']} на {payment['amount_formatted']}",
+        KIND_PAYMENT_CREATED,
     )
     return PaymentCreateResponse(**payment)
 
@@ -232,7 +326,8 @@ async def bot_confirm_payment(
         subscription_end=subscription.expires_at if subscription else None,
     )
     await send_admin_message(
-        f"Оплата #{payment_id} подтверждена. Статус: {response.status}"
+        f"Оплата #{payment_id} подтверждена. Статус: {response.status}",
+        KIND_PAYMENT_SUCCEEDED,
     )
     return response
 
@@ -281,10 +376,12 @@ async def bot_cancel_auto_renew(
     # Отменяем автопродление
     subscription.auto_renew = False
     session.add(subscription)
+    await CacheInvalidationService(session).publish(CacheScope.STATUS, [user.telegram_id])
     await session.commit()
     
     await send_admin_message(
-        f"Отменено автопродление подписки для пользователя {user.telegram_id}"
+        f"Отменено автопродление подписки для пользователя {user.telegram_id}",
+        KIND_SUBSCRIPTION_CANCELED,
     )
     
     return {
@@ -356,10 +453,12 @@ async def bot_cancel_subscription(
     
     removed_count = sum(1 for r in remove_results if r.get("success"))
     
+    await CacheInvalidationService(session).publish(CacheScope.STATUS, [user.telegram_id])
     await session.commit()
     
     await send_admin_message(
-        f"Пользователь {user.telegram_id} отменил подписку. Удален из {removed_count} каналов."
+        f"Пользователь {user.telegram_id} отменил подписку. Удален из {removed_count} каналов.",
+        KIND_SUBSCRIPTION_CANCELED,
     )
     
     return {
@@ -416,22 +515,22 @@ async def bot_get_expiring_subscriptions(
     return users_data
 
 
-@router.get(
-    "/subscriptions/expired",
-    summary="Получить пользователей с истекшими подписками",
-)
-async def bot_get_expired_subscriptions(
-    session: AsyncSession = Depends(get_db),
-    bot_id: int | None = Query(default=None),
-    hours_ago: int = Query(default=24, ge=0, le=168),
+async def _expired_subscriptions_page(
+    session: AsyncSession,
+    *,
+    now: datetime,
+    cutoff_date: datetime,
+    bot_id: int | None,
+    cursor: int | None,
+    limit: int | None,
+    plan_channels: dict[int, list[dict[str, Any]]],
 ) -> list[dict[str, Any]]:
-    """Возвращает список пользователей, у которых подписка истекла в течение указанного количества часов."""
-    from backend.app.models.subscription import Subscription
-    from backend.app.models.user import User
-    
-    now = datetime.now(timezone.utc)
-    cutoff_date = now - timedelta(hours=hours_ago)
-    
+    """
+    Страница истекших подписок с id подписки больше `cursor`.
+
+    Каналы тарифов загружаются одним запросом на страницу и только для тарифов,
+    которых еще нет в `plan_channels` (кэш общий для всех страниц запроса).
+    """
     stmt = (
         select(User, Subscription)
         .join(Subscription, Subscription.user_id == User.id)
@@ -441,14 +540,39 @@ async def bot_get_expired_subscriptions(
             Subscription.expires_at >= cutoff_date,
             User.is_blocked.is_(False),
         )
+        .order_by(Subscription.id)
     )
     if bot_id is not None:
         stmt = stmt.where(User.bot_id == bot_id)
+    if cursor is not None:
+        stmt = stmt.where(Subscription.id > cursor)
+    if limit is not None:
+        stmt = stmt.limit(limit)
     
     result = await session.execute(stmt)
-    users_data = []
-    for user, subscription in result.all():
-        users_data.append({
+    rows = result.all()
+    
+    missing_plan_ids = {
+        subscription.plan_id
+        for _, subscription in rows
+        if subscription.plan_id and subscription.plan_id not in plan_channels
+    }
+    if missing_plan_ids:
+        channels_by_plan = await SubscriptionPlanService(session).get_channels_by_plan(
+            missing_plan_ids
+        )
+        for plan_id, channels in channels_by_plan.items():
+            plan_channels[plan_id] = [
+                {
+                    "channel_id": channel.channel_id,
+                    "channel_name": channel.channel_name,
+                }
+                for channel in channels
+            ]
+    
+    return [
+        {
+            "subscription_id": subscription.id,
             "telegram_id": user.telegram_id,
             "user_id": user.id,
             "bot_id": user.bot_id,
@@ -456,23 +580,79 @@ async def bot_get_expired_subscriptions(
             "first_name": user.first_name,
             "subscription_end": subscription.expires_at.isoformat(),
             "plan_id": subscription.plan_id,
-            "channels": [],  # Будет заполнено на фронтенде или в боте
-        })
+            "channels": plan_channels.get(subscription.plan_id, []) if subscription.plan_id else [],
+        }
+        for user, subscription in rows
+    ]
+
+
+@router.get(
+    "/subscriptions/expired",
+    summary="Получить пользователей с истекшими подписками",
+)
+async def bot_get_expired_subscriptions(
+    response: Response,
+    session: AsyncSession = Depends(get_db),
+    bot_id: int | None = Query(default=None),
+    hours_ago: int = Query(default=24, ge=0, le=168),
+    cursor: int | None = Query(default=None, ge=0, description="id подписки из X-Next-Cursor"),
+    limit: int | None = Query(default=None, ge=1, le=5000),
+    response_format: str = Query(default="json", alias="format", pattern="^(json|ndjson)$"),
+) -> Any:
+    """
+    Возвращает список пользователей, у которых подписка истекла в течение указанного количества часов.
+
+    С `limit` ответ постраничный: если страница заполнена, заголовок `X-Next-Cursor`
+    содержит курсор следующей страницы. `format=ndjson` отдает все строки после
+    `cursor` потоком, по одному JSON-объекту на строку.
+    """
+    now = datetime.now(timezone.utc)
+    cutoff_date = now - timedelta(hours=hours_ago)
     
-    # Загружаем каналы для каждого плана
-    for user_data in users_data:
-        if user_data["plan_id"]:
-            plan_service = SubscriptionPlanService(session)
-            try:
-                plan = await plan_service.get_plan(user_data["plan_id"])
-                user_data["channels"] = [
-                    {
-                        "channel_id": channel.channel_id,
-                        "channel_name": channel.channel_name,
-                    }
-                    for channel in plan.channels
-                ]
-            except ValueError:
-                pass
+    if response_format == "ndjson":
+        return StreamingResponse(
+            _stream_expired_subscriptions(now, cutoff_date, bot_id, cursor),
+            media_type="application/x-ndjson",
+        )
     
+    users_data = await _expired_subscriptions_page(
+        session,
+        now=now,
+        cutoff_date=cutoff_date,
+        bot_id=bot_id,
+        cursor=cursor,
+        limit=limit,
+        plan_channels={},
+    )
+    if limit is not None and len(users_data) == limit:
+        response.headers["X-Next-Cursor"] = str(users_data[-1]["subscription_id"])
     return users_data
+
+
+async def _stream_expired_subscriptions(
+    now: datetime,
+    cutoff_date: datetime,
+    bot_id: int | None,
+    cursor: int | None,
+) -> AsyncIterator[bytes]:
+    # Своя сессия: сессия из зависимости закрывается до начала отправки тела ответа
+    plan_channels: dict[int, list[dict[str, Any]]] = {}
+    async with AsyncSessionLocal() as session:
+        while True:
+            users_data = await _expired_subscriptions_page(
+                session,
+                now=now,
+                cutoff_date=cutoff_date,
+                bot_id=bot_id,
+                cursor=cursor,
+                limit=_EXPIRED_STREAM_BATCH_SIZE,
+                plan_channels=plan_channels,
+            )
+            if not users_data:
+                return
+            yield "".join(
+                json.dumps(user_data, ensure_ascii=False) + "\n" for user_data in users_data
+            ).encode()
+            if len(users_data) < _EXPIRED_STREAM_BATCH_SIZE:
+                return
+            cursor = users_data[-1]["subscription_id"]
@@ -1,5 +1,8 @@
 from fastapi import APIRouter
 
+from ....integrations.telegram import telegram_gateway
+from ....services.notifications import admin_notifications
+
 router = APIRouter()
 
 
@@ -12,3 +15,13 @@ async def healthcheck() -> dict[str, str]:
 async def db_healthcheck() -> dict[str, str]:
     return {"status": "ok"}
 
+
+
+@router.get("/telegram", summary="Метрики клиента Telegram Bot API")
+async def telegram_healthcheck() -> dict[str, float | int]:
+    return telegram_gateway.metrics()
+
+
+@router.get("/notifications", summary="Состояние очереди уведомлений администратору")
+async def notifications_healthcheck() -> dict[str, int]:
+    return admin_notifications.metrics()
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import httpx
 import logging
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
@@ -9,7 +8,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ....api.deps import get_db
-from ....core.crypto import decrypt_secret
+from ....integrations.telegram import telegram_gateway
 from ....models.bot import Bot
 from ....models.payment import Payment
 
@@ -18,17 +17,10 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-async def _get_bot_username(bot: Bot) -> str:
+async def _get_bot_username(session: AsyncSession, bot: Bot) -> str:
     """Получает username бота из токена через Telegram API."""
-    token = None
-    
-    # Сначала пробуем получить username из токена бота в базе данных
-    if bot.telegram_bot_token_encrypted:
-        try:
-            encrypted_str = bot.telegram_bot_token_encrypted.decode() if isinstance(bot.telegram_bot_token_encrypted, bytes) else bot.telegram_bot_token_encrypted
-            token = decrypt_secret(encrypted_str)
-        except Exception as exc:
-            logger.debug("Не удалось расшифровать токен бота из БД: %s", exc)
+    # Сначала пробуем получить токен бота из кэша общего клиента Telegram
+    token = await telegram_gateway.get_bot_token(session, bot.id)
     
     # Если не удалось расшифровать, пробуем использовать токен из настроек
     if not token:
@@ -42,14 +34,13 @@ async def _get_bot_username(bot: Bot) -> str:
     # Получаем username через Telegram API
     if token:
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"https://api.telegram.org/bot{token}/getMe")
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get("ok") and data.get("result", {}).get("username"):
-                        username = data["result"]["username"]
-                        logger.info("Получен username бота из Telegram API: %s", username)
-                        return username
+            response = await telegram_gateway.call(token, "getMe", timeout=5.0)
+            if response.status_code == 200:
+                data = response.json()
+                if data.get("ok") and data.get("result", {}).get("username"):
+                    username = data["result"]["username"]
+                    logger.info("Получен username бота из Telegram API: %s", username)
+                    return username
         except Exception as exc:
             logger.debug("Не удалось получить username бота из Telegram API: %s", exc)
     
@@ -82,7 +73,7 @@ async def payment_return(
         result = await session.execute(stmt)
         bot = result.scalar_one_or_none()
         if bot:
-            bot_username = await _get_bot_username(bot)
+            bot_username = await _get_bot_username(session, bot)
             return RedirectResponse(
                 url=f"https://t.me/{bot_username}?start=payment_return",
                 status_code=status.HTTP_302_FOUND,
@@ -101,7 +92,7 @@ async def payment_return(
         result = await session.execute(stmt)
         bot = result.scalar_one_or_none()
         if bot:
-            bot_username = await _get_bot_username(bot)
+            bot_username = await _get_bot_username(session, bot)
         else:
             bot_username = "lumenpay"
         return RedirectResponse(
@@ -114,7 +105,7 @@ async def payment_return(
     result = await session.execute(stmt)
     bot = result.scalar_one_or_none()
     if bot:
-        bot_username = await _get_bot_username(bot)
+        bot_username = await _get_bot_username(session, bot)
     else:
         bot_username = "lumenpay"
 
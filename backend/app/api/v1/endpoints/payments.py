@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import csv
+import hmac
 import io
 from base64 import b64decode
 from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
@@ -8,9 +9,12 @@ from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ....api.deps import get_current_admin, get_db
+from ....background.payment_events import payment_event_processor
+from ....core.config import settings
 from ....schemas.admin import PaymentListItem
 from ....schemas.auth import MeResponse
 from ....schemas.base import PaginatedResponse
+from ....services.payment_events import PaymentEventService
 from ....services.payments import PaymentService
 from ....services.payment_providers import PaymentProviderSettingsService
 
@@ -75,6 +79,14 @@ async def export_payments(
     )
 
 
+def _credentials_match(
+    auth_shop_id: str, auth_api_key: str, shop_id: str, api_key: str
+) -> bool:
+    shop_ok = hmac.compare_digest(auth_shop_id.encode(), shop_id.encode())
+    key_ok = hmac.compare_digest(auth_api_key.encode(), api_key.encode())
+    return shop_ok and key_ok
+
+
 @router.post(
     "/yookassa/webhook",
     status_code=status.HTTP_204_NO_CONTENT,
@@ -112,8 +124,13 @@ async def yookassa_webhook(
             detail="YooKassa is not configured",
         ) from exc
 
-    if auth_shop_id != shop_id or auth_api_key != api_key:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Access denied")
+    if not _credentials_match(auth_shop_id, auth_api_key, shop_id, api_key):
+        # Ключ могли сменить в другом процессе: перечитываем, но не чаще recheck-интервала
+        shop_id, api_key = await provider_service.get_yookassa_credentials(
+            max_age=settings.yookassa_credentials_recheck_seconds
+        )
+        if not _credentials_match(auth_shop_id, auth_api_key, shop_id, api_key):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Access denied")
 
     try:
         payload = await request.json()
@@ -121,8 +138,12 @@ async def yookassa_webhook(
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON payload"
         ) from exc
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON payload")
 
-    service = PaymentService(session)
-    await service.handle_yookassa_notification(payload)
+    # Только сохраняем событие: долгая обработка (Telegram, уведомления) задерживала
+    # бы ответ, и YooKassa доставляла бы уведомление повторно
+    if await PaymentEventService(session).record_yookassa_event(payload):
+        payment_event_processor.notify()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timezone
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from ..core.config import settings
+from ..db.session import AsyncSessionLocal
+from ..services.rollups import DailyRollupService
+
+logger = logging.getLogger(__name__)
+
+
+async def _refresh_daily_rollups() -> None:
+    async with AsyncSessionLocal() as session:
+        try:
+            written = await DailyRollupService(session).refresh(
+                recent_days=settings.analytics_rollup_refresh_days,
+                chunk_days=settings.analytics_rollup_chunk_days,
+            )
+        except Exception as exc:
+            logger.exception("Не удалось пересчитать суточные сводки: %s", exc)
+            return
+    logger.debug("Пересчитаны суточные сводки: %d строк", written)
+
+
+def setup_analytics_jobs(scheduler: AsyncIOScheduler) -> None:
+    scheduler.add_job(
+        _refresh_daily_rollups,
+        trigger="interval",
+        minutes=settings.analytics_rollup_refresh_minutes,
+        # Первый запуск сразу: на пустой таблице он заполняет сводки за всю историю
+        next_run_time=datetime.now(timezone.utc),
+        id="refresh_daily_rollups",
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True,
+    )
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 import logging
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from sqlalchemy import select
+from sqlalchemy import and_, or_, select
 
+from ..core.config import settings
 from ..db.session import AsyncSessionLocal
 from ..models.scheduled_broadcast import BroadcastStatus, ScheduledBroadcast
 from ..services.broadcasts import BroadcastService
@@ -20,16 +21,31 @@ async def process_scheduled_broadcasts() -> None:
     async with AsyncSessionLocal() as session:
         service = BroadcastService(session)
         
-        # Получаем все рассылки со статусом PENDING, у которых scheduled_at <= сейчас
+        # Получаем все рассылки со статусом PENDING, у которых scheduled_at <= сейчас,
+        # а также прерванные рассылки в статусе SENDING, чей heartbeat устарел
         # Используем UTC для сравнения, так как scheduled_at хранится с timezone
         now = datetime.now(timezone.utc)
+        stale_before = now - timedelta(seconds=settings.broadcast_stale_after_seconds)
         stmt = (
             select(ScheduledBroadcast)
             .where(
-                ScheduledBroadcast.status == BroadcastStatus.PENDING,
-                ScheduledBroadcast.scheduled_at.isnot(None),  # scheduled_at должен быть указан
-                ScheduledBroadcast.scheduled_at <= now,
+                or_(
+                    and_(
+                        ScheduledBroadcast.status == BroadcastStatus.PENDING,
+                        ScheduledBroadcast.scheduled_at.isnot(None),  # scheduled_at должен быть указан
+                        ScheduledBroadcast.scheduled_at <= now,
+                    ),
+                    and_(
+                        ScheduledBroadcast.status == BroadcastStatus.SENDING,
+                        ScheduledBroadcast.channel_id.is_(None),
+                        or_(
+                            ScheduledBroadcast.heartbeat_at.is_(None),
+                            ScheduledBroadcast.heartbeat_at < stale_before,
+                        ),
+                    ),
+                )
             )
+            .order_by(ScheduledBroadcast.id)
         )
         result = await session.execute(stmt)
         broadcasts = result.scalars().all()
@@ -42,7 +58,10 @@ async def process_scheduled_broadcasts() -> None:
         
         for broadcast in broadcasts:
             try:
-                logger.info(f"Отправка рассылки {broadcast.id}")
+                if broadcast.status == BroadcastStatus.SENDING:
+                    logger.info(f"Возобновление прерванной рассылки {broadcast.id}")
+                else:
+                    logger.info(f"Отправка рассылки {broadcast.id}")
                 result = await service.send_broadcast_now(broadcast.id)
                 logger.info(
                     f"Рассылка {broadcast.id} отправлена: {result.get('sent')} отправлено, "
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import logging
+from datetime import timedelta
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from ..core.config import settings
+from ..db.session import AsyncSessionLocal
+from ..services.cache_invalidation import CacheInvalidationService
+
+logger = logging.getLogger(__name__)
+
+
+async def _prune_cache_invalidations() -> None:
+    async with AsyncSessionLocal() as session:
+        service = CacheInvalidationService(session)
+        try:
+            removed = await service.prune(
+                timedelta(hours=settings.cache_invalidation_retention_hours)
+            )
+        except Exception as exc:
+            logger.exception("Не удалось очистить журнал инвалидаций кэша: %s", exc)
+            return
+        if removed:
+            logger.info("Удалено %d устаревших инвалидаций кэша", removed)
+
+
+def setup_cache_jobs(scheduler: AsyncIOScheduler) -> None:
+    scheduler.add_job(
+        _prune_cache_invalidations,
+        trigger="interval",
+        hours=1,
+        id="prune_cache_invalidations",
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True,
+    )
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import zlib
+from datetime import timedelta
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from ..core.config import settings
+from ..db.session import AsyncSessionLocal
+from ..services.payment_events import PaymentEventService
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentEventProcessor:
+    """
+    Пул обработчиков сохраненных уведомлений о платежах.
+
+    Опрашивающая задача захватывает готовые события пачками и раскладывает их по
+    очередям обработчиков по id платежа: события одного платежа попадают в одну
+    очередь и обрабатываются последовательно в порядке поступления, события
+    разных платежей — параллельно. Вебхук будит опрос через `notify`, поэтому
+    новое событие берется в работу сразу, а не по таймеру. Между репликами
+    обработку одного платежа сериализует блокировка его строки в
+    `handle_yookassa_notification`.
+    """
+
+    def __init__(self, workers: int, batch_size: int, poll_interval: float) -> None:
+        self._workers_count = max(1, workers)
+        self._batch_size = batch_size
+        self._poll_interval = poll_interval
+        self._queues: list[asyncio.Queue[int]] = []
+        self._tasks: list[asyncio.Task[None]] = []
+        self._wakeup: asyncio.Event | None = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def notify(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._queues = [asyncio.Queue() for _ in range(self._workers_count)]
+        self._tasks = [
+            asyncio.create_task(self._worker(queue), name=f"payment-event-worker-{idx}")
+            for idx, queue in enumerate(self._queues)
+        ]
+        self._tasks.append(
+            asyncio.create_task(self._poll(self._wakeup), name="payment-event-poller")
+        )
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Дожидается обработки захваченных событий, остальные возвращает в очередь."""
+        if not self.running:
+            return
+        poller = self._tasks.pop()
+        poller.cancel()
+        await asyncio.gather(poller, return_exceptions=True)
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)), timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Не дождались обработки уведомлений о платежах при остановке")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        unprocessed = [
+            queue.get_nowait() for queue in self._queues for _ in range(queue.qsize())
+        ]
+        self._tasks = []
+        self._wakeup = None
+        if unprocessed:
+            with contextlib.suppress(Exception):
+                async with AsyncSessionLocal() as session:
+                    await PaymentEventService(session).release(unprocessed)
+
+    def _queued(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def _poll(self, wakeup: asyncio.Event) -> None:
+        while True:
+            claimed: list[tuple[int, str]] = []
+            # Не захватываем больше, чем успеваем обработать: остальное дождется в БД
+            free = self._batch_size - self._queued()
+            if free > 0:
+                try:
+                    async with AsyncSessionLocal() as session:
+                        claimed = await PaymentEventService(session).claim(free)
+                except Exception as exc:
+                    logger.exception("Не удалось получить уведомления о платежах: %s", exc)
+            for event_id, external_id in claimed:
+                queue = self._queues[zlib.crc32(external_id.encode()) % len(self._queues)]
+                queue.put_nowait(event_id)
+            if len(claimed) == free and free > 0:
+                continue
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(wakeup.wait(), timeout=self._poll_interval)
+            wakeup.clear()
+
+    async def _worker(self, queue: asyncio.Queue[int]) -> None:
+        while True:
+            event_id = await queue.get()
+            try:
+                async with AsyncSessionLocal() as session:
+                    await PaymentEventService(session).process(event_id)
+            except Exception as exc:
+                logger.warning("Ошибка обработки уведомления о платеже %s: %s", event_id, exc)
+            finally:
+                queue.task_done()
+
+
+payment_event_processor = PaymentEventProcessor(
+    workers=settings.payment_event_workers,
+    batch_size=settings.payment_event_batch_size,
+    poll_interval=settings.payment_event_poll_seconds,
+)
+
+
+async def _prune_payment_events() -> None:
+    async with AsyncSessionLocal() as session:
+        try:
+            removed = await PaymentEventService(session).prune(
+                timedelta(days=settings.payment_event_retention_days)
+            )
+        except Exception as exc:
+            logger.exception("Не удалось очистить обработанные уведомления о платежах: %s", exc)
+            return
+    if removed:
+        logger.info("Удалено обработанных уведомлений о платежах: %d", removed)
+
+
+def setup_payment_event_jobs(scheduler: AsyncIOScheduler) -> None:
+    scheduler.add_job(
+        _prune_payment_events,
+        trigger="interval",
+        hours=6,
+        id="prune_payment_events",
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True,
+    )
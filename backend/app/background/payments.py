@@ -1,32 +1,49 @@
 from __future__ import annotations
 
 import logging
+import time
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
+from ..core.config import settings
 from ..db.session import AsyncSessionLocal
 from ..services.payments import PaymentService
 
 logger = logging.getLogger(__name__)
 
+# Размер пачки сверки: растет вдвое, пока пачки заполняются целиком, и
+# уменьшается, когда очередь разобрана
+_batch_size = settings.payment_reconcile_min_batch
+
 
 async def _sync_pending_payments() -> None:
-    async with AsyncSessionLocal() as session:
-        service = PaymentService(session)
-        try:
-            await service.sync_pending_yookassa_payments()
-        except Exception as exc:  # noqa: BLE001
-            logger.exception("Не удалось синхронизировать платежи YooKassa: %s", exc)
+    global _batch_size
+    deadline = time.monotonic() + settings.payment_reconcile_run_budget_seconds
+    while True:
+        async with AsyncSessionLocal() as session:
+            service = PaymentService(session)
+            try:
+                stats = await service.sync_pending_yookassa_payments(limit=_batch_size)
+            except Exception as exc:
+                logger.exception("Не удалось синхронизировать платежи YooKassa: %s", exc)
+                return
+
+        backlog = stats.claimed >= _batch_size
+        if backlog:
+            _batch_size = min(_batch_size * 2, settings.payment_reconcile_max_batch)
+        elif stats.claimed < _batch_size // 2:
+            _batch_size = max(_batch_size // 2, settings.payment_reconcile_min_batch)
+        if not backlog or time.monotonic() >= deadline:
+            return
 
 
 def setup_payment_jobs(scheduler: AsyncIOScheduler) -> None:
     scheduler.add_job(
         _sync_pending_payments,
         trigger="interval",
-        minutes=2,
+        seconds=settings.payment_reconcile_interval_seconds,
         id="sync_yookassa_payments",
         max_instances=1,
         coalesce=True,
         replace_existing=True,
     )
-
@@ -3,8 +3,11 @@ from __future__ import annotations
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from ..core.config import settings
+from .analytics import setup_analytics_jobs
 from .backups import setup_backup_job
 from .broadcasts import setup_broadcast_jobs
+from .cache import setup_cache_jobs
+from .payment_events import setup_payment_event_jobs
 from .payments import setup_payment_jobs
 from .subscriptions import setup_subscription_jobs
 
@@ -15,8 +18,11 @@ def start_scheduler() -> None:
     if not scheduler.running:
         setup_backup_job(scheduler)
         setup_payment_jobs(scheduler)
+        setup_payment_event_jobs(scheduler)
         setup_subscription_jobs(scheduler)
         setup_broadcast_jobs(scheduler)
+        setup_cache_jobs(scheduler)
+        setup_analytics_jobs(scheduler)
         scheduler.start()
 
 
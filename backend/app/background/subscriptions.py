@@ -1,105 +1,190 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+from collections import defaultdict
+from collections.abc import Sequence
 from datetime import datetime, timedelta, timezone
+from typing import Any
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Row, and_, case, or_, select, update
 from sqlalchemy.orm import joinedload
 
+from ..core.config import settings
 from ..db.session import AsyncSessionLocal
+from ..models.cache_invalidation import CacheScope
 from ..models.subscription import Subscription
+from ..models.subscription_notification import NotificationKind
 from ..models.user import User
+from ..services.cache_invalidation import CacheInvalidationService
 from ..services.channel_access import ChannelAccessService
+from ..services.notification_outbox import NotificationOutbox
 from ..services.user_notifications import UserNotificationService
 
 logger = logging.getLogger(__name__)
 
-# Отслеживаем, какие уведомления уже были отправлены
-# Формат: {(user_id, days_left): timestamp}
-_sent_notifications: dict[tuple[int, int], datetime] = {}
+
+# За сколько дней до истечения подписки отправляем напоминания
+REMINDER_DAYS = (7, 3, 1)
+
+
+def _notification_rows(
+    subscriptions: Sequence[tuple[Any, NotificationKind]],
+) -> list[dict[str, Any]]:
+    """
+    Строки outbox для уведомлений: не больше одной на пользователя и вид уведомления.
+
+    У пользователя может быть несколько подписок (по одной на канал плана) —
+    уведомление привязываем к подписке с наименьшим id, чтобы повторные запуски
+    выбирали ту же самую подписку и уникальный ключ outbox срабатывал.
+    Подписка — объект `Subscription` или строка запроса с полями id, user_id, expires_at.
+    """
+    rows: dict[tuple[int, NotificationKind], dict[str, Any]] = {}
+    for subscription, kind in sorted(subscriptions, key=lambda item: item[0].id):
+        rows.setdefault(
+            (subscription.user_id, kind),
+            {
+                "user_id": subscription.user_id,
+                "subscription_id": subscription.id,
+                "kind": kind,
+                "expires_at": subscription.expires_at,
+            },
+        )
+    return list(rows.values())
+
+
+async def _send_reminders(reminders: Sequence[tuple[int, Row]]) -> tuple[list[int], list[int]]:
+    """
+    Отправляет напоминания пулом воркеров (не больше `subscription_notification_concurrency`
+    одновременно). У каждого воркера своя сессия: AsyncSession нельзя использовать
+    из нескольких задач сразу, а сервис уведомлений обращается к ней за токеном бота.
+
+    Returns:
+        (id отправленных строк outbox, id неотправленных строк outbox)
+    """
+    sent_ids: list[int] = []
+    failed_ids: list[int] = []
+    pending = iter(reminders)
+
+    async def worker() -> None:
+        async with AsyncSessionLocal() as session:
+            notification_service = UserNotificationService(session)
+            # Общий итератор: каждый воркер берет следующее напоминание, когда освободится
+            for outbox_id, reminder in pending:
+                try:
+                    success = await notification_service.send_subscription_expiring_notification(
+                        user=reminder.User,
+                        days_left=reminder.days_left,
+                        subscription_end=reminder.expires_at,
+                    )
+                except Exception as exc:
+                    success = False
+                    logger.exception(
+                        "Ошибка при отправке напоминания об истечении подписки: %s",
+                        exc,
+                        extra={
+                            "user_id": reminder.user_id,
+                            "subscription_id": reminder.id,
+                            "days_left": reminder.days_left,
+                        },
+                    )
+                if success:
+                    sent_ids.append(outbox_id)
+                    logger.info(
+                        "Отправлено напоминание об истечении подписки",
+                        extra={
+                            "user_id": reminder.user_id,
+                            "subscription_id": reminder.id,
+                            "days_left": reminder.days_left,
+                        },
+                    )
+                else:
+                    failed_ids.append(outbox_id)
+
+    workers = min(settings.subscription_notification_concurrency, len(reminders))
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return sent_ids, failed_ids
 
 
 async def _check_expiring_subscriptions() -> None:
     """Проверяет истекающие подписки и отправляет напоминания."""
     async with AsyncSessionLocal() as session:
         now = datetime.now(timezone.utc)
+        outbox = NotificationOutbox(session)
         
-        # Проверяем подписки, которые истекают через 7, 3 и 1 день
-        reminder_days = [7, 3, 1]
-        
-        for days_left in reminder_days:
-            target_date = now + timedelta(days=days_left)
-            # Проверяем подписки, которые истекают в диапазоне ±12 часов от целевой даты
-            start_date = target_date - timedelta(hours=12)
-            end_date = target_date + timedelta(hours=12)
-            
-            stmt = (
-                select(Subscription)
-                .options(joinedload(Subscription.user))
-                .where(
-                    Subscription.is_active == True,  # noqa: E712
-                    Subscription.expires_at >= start_date,
-                    Subscription.expires_at <= end_date,
+        # Одним запросом выбираем подписки, которые истекают через 7, 3 и 1 день.
+        # Подписка попадает в корзину N, если до истечения от N до N+1 суток
+        # (целое число дней, как в тексте напоминания)
+        windows = {
+            days: (now + timedelta(days=days), now + timedelta(days=days + 1))
+            for days in REMINDER_DAYS
+        }
+        days_left = case(
+            *(
+                (
+                    and_(Subscription.expires_at >= start, Subscription.expires_at < end),
+                    days,
                 )
+                for days, (start, end) in windows.items()
+            ),
+        ).label("days_left")
+        
+        stmt = (
+            select(
+                Subscription.id,
+                Subscription.user_id,
+                Subscription.expires_at,
+                days_left,
+                User,
             )
+            .join(User, User.id == Subscription.user_id)
+            .where(
+                Subscription.is_active == True,  # noqa: E712
+                or_(
+                    *(
+                        and_(Subscription.expires_at >= start, Subscription.expires_at < end)
+                        for start, end in windows.values()
+                    )
+                ),
+            )
+        )
+        
+        result = await session.execute(stmt)
+        subscriptions = result.all()
+        by_id = {subscription.id: subscription for subscription in subscriptions}
+        
+        # Захватываем уведомления пачками: один запрос на пачку, уже
+        # отправленные (в том числе другой репликой) не возвращаются
+        rows = _notification_rows(
+            [
+                (subscription, NotificationKind.for_days_left(subscription.days_left))
+                for subscription in subscriptions
+            ]
+        )
+        batch_size = settings.subscription_notification_batch_size
+        sent_total = 0
+        for offset in range(0, len(rows), batch_size):
+            claimed = await outbox.claim(rows[offset:offset + batch_size])
             
-            result = await session.execute(stmt)
-            subscriptions = result.scalars().unique().all()
-            
-            notification_service = UserNotificationService(session)
+            sent_ids, failed_ids = await _send_reminders(
+                [
+                    (outbox_id, by_id[subscription_id])
+                    for (subscription_id, _kind), outbox_id in claimed.items()
+                ]
+            )
+            sent_total += len(sent_ids)
             
-            for subscription in subscriptions:
-                if subscription.user is None:
-                    continue
-                
-                # Вычисляем точное количество дней до истечения
-                actual_days_left = (subscription.expires_at - now).days
-                
-                # Проверяем, нужно ли отправить уведомление для этого количества дней
-                if actual_days_left not in reminder_days:
-                    continue
-                
-                # Проверяем, не отправляли ли мы уже уведомление для этого пользователя и количества дней
-                notification_key = (subscription.user_id, actual_days_left)
-                last_sent = _sent_notifications.get(notification_key)
-                
-                # Отправляем уведомление, если:
-                # 1. Еще не отправляли для этого пользователя и количества дней
-                # 2. Или последнее уведомление было более 20 часов назад (чтобы не спамить при повторных запусках)
-                should_send = (
-                    last_sent is None or 
-                    (now - last_sent) > timedelta(hours=20)
-                )
-                
-                if should_send:
-                    try:
-                        success = await notification_service.send_subscription_expiring_notification(
-                            user=subscription.user,
-                            days_left=actual_days_left,
-                            subscription_end=subscription.expires_at,
-                        )
-                        if success:
-                            _sent_notifications[notification_key] = now
-                            logger.info(
-                                "Отправлено напоминание об истечении подписки",
-                                extra={
-                                    "user_id": subscription.user_id,
-                                    "subscription_id": subscription.id,
-                                    "days_left": actual_days_left,
-                                },
-                            )
-                    except Exception as exc:
-                        logger.exception(
-                            "Ошибка при отправке напоминания об истечении подписки: %s",
-                            exc,
-                            extra={
-                                "user_id": subscription.user_id,
-                                "subscription_id": subscription.id,
-                                "days_left": actual_days_left,
-                            },
-                        )
+            await outbox.mark_sent(sent_ids)
+            await outbox.release(failed_ids)
+            await session.commit()
+        
+        if rows:
+            logger.info(
+                "Напоминания об истечении подписок: найдено %d, отправлено %d",
+                len(rows),
+                sent_total,
+            )
 
 
 async def _remove_users_without_subscriptions() -> None:
@@ -107,55 +192,92 @@ async def _remove_users_without_subscriptions() -> None:
     async with AsyncSessionLocal() as session:
         now = datetime.now(timezone.utc)
         
-        # Получаем всех пользователей, у которых нет активных подписок
-        # но они помечены как premium или имеют subscription_end в будущем
+        # Одним UPDATE снимаем premium со всех, у кого нет активной подписки.
+        # RETURNING отдает только измененные строки - им и ставим задачу удаления
+        # из каналов, поэтому работа пропорциональна числу изменившихся пользователей
+        has_active_subscription = (
+            select(Subscription.id)
+            .where(
+                Subscription.user_id == User.id,
+                Subscription.is_active == True,  # noqa: E712
+                Subscription.expires_at > now,
+            )
+            .exists()
+        )
         stmt = (
-            select(User)
-            .options(joinedload(User.subscriptions))
+            update(User)
             .where(
                 User.is_premium == True,  # noqa: E712
+                ~has_active_subscription,
             )
+            .values(is_premium=False, subscription_end=None, channels_kick_pending=True)
+            .returning(User.id, User.telegram_id, User.bot_id)
+            .execution_options(synchronize_session=False)
         )
-        
         result = await session.execute(stmt)
-        users = result.scalars().unique().all()
+        demoted = result.all()
+        demoted_count = len(demoted)
+        
+        # Фиксируем снятие premium до вызовов Telegram, чтобы не держать
+        # блокировки строк users на время удаления из каналов. Флаг
+        # channels_kick_pending сохраняет задачу удаления до его успеха
+        invalidations = CacheInvalidationService(session)
+        await invalidations.publish(
+            CacheScope.STATUS, [telegram_id for _user_id, telegram_id, _bot_id in demoted]
+        )
+        await session.commit()
         
+        # Удаляем из каналов и только что разжалованных, и тех, кого не удалось
+        # удалить в прошлые запуски
+        pending = await session.execute(
+            select(User.id, User.telegram_id, User.bot_id)
+            .where(
+                User.channels_kick_pending == True,  # noqa: E712
+                User.is_premium == False,  # noqa: E712
+            )
+            .order_by(User.id)
+        )
         channel_service = ChannelAccessService(session)
         removed_count = 0
+        failed_count = 0
         
-        for user in users:
-            # Проверяем, есть ли у пользователя активные подписки
-            active_subscriptions = [
-                sub for sub in user.subscriptions
-                if sub.is_active and sub.expires_at > now
-            ]
+        # Пачками: каналы и токен загружаются один раз на бота в пачке
+        for batch in pending.partitions(settings.subscription_kick_batch_size):
+            users_by_bot: dict[int, list[tuple[int, int]]] = defaultdict(list)
+            for user_id, telegram_id, bot_id in batch:
+                users_by_bot[bot_id].append((user_id, telegram_id))
             
-            # Если нет активных подписок, но пользователь помечен как premium
-            if not active_subscriptions:
-                # Обновляем статус пользователя
-                user.is_premium = False
-                user.subscription_end = None
-                session.add(user)
-                
-                # Удаляем пользователя из всех каналов, требующих подписку
-                remove_results = await channel_service.remove_user_from_channels(
-                    user=user,
-                    channel_ids=None,  # Удаляем из всех каналов
+            removed_ids: list[int] = []
+            for bot_id, users in users_by_bot.items():
+                removed = await channel_service.remove_users_from_channels(
+                    bot_id, [telegram_id for _user_id, telegram_id in users]
                 )
-                
-                success_count = sum(1 for r in remove_results if r.get("success"))
-                if success_count > 0:
-                    removed_count += 1
-                    logger.info(
-                        "Пользователь %s (telegram_id: %s) удален из %d каналов (нет активных подписок)",
-                        user.id,
-                        user.telegram_id,
-                        success_count,
-                    )
+                removed_ids.extend(
+                    user_id for user_id, telegram_id in users if removed.get(telegram_id)
+                )
+            removed_count += len(removed_ids)
+            failed_count += len(batch) - len(removed_ids)
+            
+            if removed_ids:
+                await session.execute(
+                    update(User)
+                    .where(User.id.in_(removed_ids))
+                    .values(channels_kick_pending=False)
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
         
-        if removed_count > 0:
-            await session.commit()
-            logger.info("Удалено %d пользователей без активных подписок из каналов", removed_count)
+        if failed_count > 0:
+            logger.warning(
+                "Не удалось удалить из каналов %d пользователей, повтор при следующем запуске",
+                failed_count,
+            )
+        if demoted_count > 0 or removed_count > 0:
+            logger.info(
+                "Снят premium у %d пользователей без активных подписок, удалено из каналов: %d",
+                demoted_count,
+                removed_count,
+            )
         else:
             logger.debug("Нет пользователей без активных подписок для удаления из каналов")
 
@@ -183,72 +305,80 @@ async def _check_expired_subscriptions() -> None:
         subscriptions = result.scalars().unique().all()
         
         notification_service = UserNotificationService(session)
+        outbox = NotificationOutbox(session)
+        
+        # Захватываем уведомления об истечении одним запросом; подписки,
+        # уведомление по которым уже отправлено, только деактивируются
+        claimed = await outbox.claim(
+            _notification_rows(
+                [
+                    (subscription, NotificationKind.EXPIRED)
+                    for subscription in subscriptions
+                    if subscription.user is not None
+                ]
+            )
+        )
         
         for subscription in subscriptions:
             if subscription.user is None:
                 continue
             
-            # Проверяем, не отправляли ли мы уже уведомление об истечении
-            notification_key = (subscription.user_id, 0)  # 0 означает истекшая подписка
-            last_sent = _sent_notifications.get(notification_key)
-            
-            # Отправляем уведомление, если еще не отправляли или прошло более 20 часов
-            should_send = (
-                last_sent is None or 
-                (now - last_sent) > timedelta(hours=20)
-            )
-            
-            if should_send:
-                try:
-                    # Деактивируем подписку
-                    subscription.is_active = False
-                    if subscription.user:
-                        subscription.user.is_premium = False
-                    session.add(subscription)
-                    if subscription.user:
-                        session.add(subscription.user)
+            outbox_id = claimed.get((subscription.id, NotificationKind.EXPIRED))
+            try:
+                # Деактивируем подписку
+                subscription.is_active = False
+                if subscription.user:
+                    subscription.user.is_premium = False
+                session.add(subscription)
+                if subscription.user:
+                    session.add(subscription.user)
+                    await CacheInvalidationService(session).publish(
+                        CacheScope.STATUS, [subscription.user.telegram_id]
+                    )
+                
+                # Удаляем пользователя из каналов, если у него нет других активных подписок
+                if subscription.user:
+                    # Проверяем, есть ли у пользователя другие активные подписки
+                    other_active_stmt = (
+                        select(Subscription)
+                        .where(
+                            Subscription.user_id == subscription.user_id,
+                            Subscription.id != subscription.id,
+                            Subscription.is_active == True,  # noqa: E712
+                            Subscription.expires_at > now,
+                        )
+                    )
+                    other_active_result = await session.execute(other_active_stmt)
+                    other_active = other_active_result.scalars().all()
                     
-                    # Удаляем пользователя из каналов, если у него нет других активных подписок
-                    if subscription.user:
-                        # Проверяем, есть ли у пользователя другие активные подписки
-                        other_active_stmt = (
-                            select(Subscription)
-                            .where(
-                                Subscription.user_id == subscription.user_id,
-                                Subscription.id != subscription.id,
-                                Subscription.is_active == True,  # noqa: E712
-                                Subscription.expires_at > now,
-                            )
+                    # Если нет других активных подписок, удаляем пользователя из каналов
+                    if not other_active:
+                        channel_service = ChannelAccessService(session)
+                        # Получаем каналы, связанные с истекшей подпиской
+                        channel_ids = None
+                        if subscription.channel_id:
+                            channel_ids = [subscription.channel_id]
+                        
+                        remove_results = await channel_service.remove_user_from_channels(
+                            user=subscription.user,
+                            channel_ids=channel_ids,
                         )
-                        other_active_result = await session.execute(other_active_stmt)
-                        other_active = other_active_result.scalars().all()
                         
-                        # Если нет других активных подписок, удаляем пользователя из каналов
-                        if not other_active:
-                            channel_service = ChannelAccessService(session)
-                            # Получаем каналы, связанные с истекшей подпиской
-                            channel_ids = None
-                            if subscription.channel_id:
-                                channel_ids = [subscription.channel_id]
-                            
-                            remove_results = await channel_service.remove_user_from_channels(
-                                user=subscription.user,
-                                channel_ids=channel_ids,
-                            )
-                            
-                            removed_count = sum(1 for r in remove_results if r.get("success"))
-                            logger.info(
-                                "Пользователь %s удален из %d каналов после истечения подписки",
-                                subscription.user_id,
-                                removed_count,
-                            )
-                    
+                        removed_count = sum(1 for r in remove_results if r.get("success"))
+                        logger.info(
+                            "Пользователь %s удален из %d каналов после истечения подписки",
+                            subscription.user_id,
+                            removed_count,
+                        )
+                
+                # Уведомление отправляет только тот, кто его захватил
+                if outbox_id is not None:
                     success = await notification_service.send_subscription_expired_notification(
                         user=subscription.user,
                     )
-                    
+
                     if success:
-                        _sent_notifications[notification_key] = now
+                        await outbox.mark_sent([outbox_id])
                         logger.info(
                             "Отправлено уведомление об истечении подписки",
                             extra={
@@ -256,18 +386,23 @@ async def _check_expired_subscriptions() -> None:
                                 "subscription_id": subscription.id,
                             },
                         )
-                    
+                    else:
+                        await outbox.release([outbox_id])
+
+                await session.commit()
+            except Exception as exc:
+                await session.rollback()
+                if outbox_id is not None:
+                    await outbox.release([outbox_id])
                     await session.commit()
-                except Exception as exc:
-                    await session.rollback()
-                    logger.exception(
-                        "Ошибка при обработке истекшей подписки: %s",
-                        exc,
-                        extra={
-                            "user_id": subscription.user_id,
-                            "subscription_id": subscription.id,
-                        },
-                    )
+                logger.exception(
+                    "Ошибка при обработке истекшей подписки: %s",
+                    exc,
+                    extra={
+                        "user_id": subscription.user_id,
+                        "subscription_id": subscription.id,
+                    },
+                )
 
 
 def setup_subscription_jobs(scheduler: AsyncIOScheduler) -> None:
@@ -3,6 +3,7 @@ from __future__ import annotations
 import json
 import secrets
 from functools import lru_cache
+from typing import Literal
 
 from pydantic import AnyHttpUrl, Field, SecretStr, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -42,7 +43,28 @@ class Settings(BaseSettings):
     bot_token_encryption_key: SecretStr = Field(
         default_factory=lambda: SecretStr(secrets.token_urlsafe(32))
     )
+    # Прежние ключи шифрования: секреты ими расшифровываются, пока не перешифрованы
+    # scripts/rotate_encryption_keys.py
+    bot_token_encryption_previous_keys: list[SecretStr] = Field(default_factory=list)
+    # Сколько расшифрованных секретов держать в памяти процесса
+    secret_cache_max_entries: int = 256
+    # Учетные данные YooKassa в памяти процесса; при неверной подписи вебхука
+    # перечитываются из БД не чаще раза в recheck-интервал
+    yookassa_credentials_cache_ttl_seconds: float = 300.0
+    yookassa_credentials_recheck_seconds: float = 5.0
     telegram_bot_token: SecretStr | None = None
+    telegram_timeout_seconds: float = 30.0
+    telegram_max_connections: int = 100
+    telegram_max_keepalive_connections: int = 20
+    telegram_http2: bool = True
+    telegram_token_cache_ttl_seconds: float = 300.0
+    telegram_max_retry_after_seconds: float = 30.0
+    # Сколько раз повторять вызов после 429; затем вызывающему отдается сам ответ 429
+    telegram_max_retries: int = 5
+    # 429 в чат, куда писали не раньше этого срока, — лимит чата; иначе лимит всего бота
+    telegram_chat_flood_window_seconds: float = 3.0
+    # Общий секрет процесса бота для служебных методов (токены ботов)
+    bot_service_token: SecretStr | None = None
 
     backup_enabled: bool = True
     backup_daily_time: str = "03:00"
@@ -51,6 +73,36 @@ class Settings(BaseSettings):
     backup_yandex_token: SecretStr | None = None
     backup_send_to_telegram: bool = False
     backup_admin_chat_id: int | None = None
+    # Очередь уведомлений администратору: однотипные события за окно сводятся в одно сообщение
+    admin_notify_coalesce_seconds: float = 5.0
+    admin_notify_queue_size: int = 1000
+    # При переполнении: вытеснить старые, отбросить новое или подождать места
+    admin_notify_overflow: Literal["drop_oldest", "drop_new", "block"] = "drop_oldest"
+    admin_notify_block_timeout_seconds: float = 1.0
+    admin_notify_digest_max_lines: int = 20
+
+    broadcast_messages_per_second: float = 30.0
+    broadcast_concurrency: int = 16
+    broadcast_per_chat_interval_seconds: float = 1.0
+    broadcast_min_messages_per_second: float = 1.0
+    broadcast_additive_increase: float = 1.0
+    broadcast_multiplicative_decrease: float = 0.5
+    broadcast_max_attempts: int = 5
+    broadcast_recipients_batch_size: int = 1000
+    broadcast_ledger_batch_size: int = 500
+    broadcast_checkpoint_interval_seconds: float = 5.0
+    broadcast_stale_after_seconds: int = 120
+    broadcast_heartbeat_interval_seconds: float = 15.0
+
+    subscription_kick_batch_size: int = 500
+    subscription_kick_concurrency: int = 10
+    subscription_notification_batch_size: int = 500
+    subscription_notification_concurrency: int = 10
+
+    cache_invalidation_retention_hours: int = 24
+    # События моложе этого срока отдаются повторно: транзакция, начатая раньше,
+    # могла получить меньший id и зафиксироваться уже после продвижения курсора
+    cache_invalidation_lookback_seconds: int = 60
 
     check_db_on_startup: bool = True
     shutdown_graceful: bool = True
@@ -61,6 +113,36 @@ class Settings(BaseSettings):
     yookassa_return_url: AnyHttpUrl | None = None
     yookassa_success_url: AnyHttpUrl | None = None
     yookassa_failure_url: AnyHttpUrl | None = None
+    # API YooKassa; для локальной разработки — scripts/yookassa_stub_server.py
+    yookassa_api_url: str = "https://api.yookassa.ru/v3"
+    yookassa_timeout_seconds: float = 10.0
+    yookassa_connect_timeout_seconds: float = 5.0
+    yookassa_max_connections: int = 20
+    yookassa_max_retries: int = 3
+    yookassa_retry_backoff_seconds: float = 0.5
+    # Обработка сохраненных уведомлений YooKassa (таблица payment_events)
+    payment_event_workers: int = 4
+    payment_event_batch_size: int = 100
+    payment_event_poll_seconds: float = 2.0
+    payment_event_max_attempts: int = 8
+    payment_event_retry_base_seconds: float = 10.0
+    # Событие в обработке дольше этого срока считается брошенным (процесс упал)
+    payment_event_stale_seconds: int = 300
+    payment_event_retention_days: int = 30
+    # Сверка ожидающих платежей с YooKassa: размер пачки подстраивается под очередь
+    payment_reconcile_interval_seconds: int = 60
+    payment_reconcile_min_batch: int = 20
+    payment_reconcile_max_batch: int = 500
+    payment_reconcile_concurrency: int = 16
+    # Один запуск сверяет пачки, пока есть очередь, но не дольше этого времени
+    payment_reconcile_run_budget_seconds: float = 50.0
+    payment_reconcile_recheck_seconds: int = 60
+    # Неоплаченный платеж старше этого срока отменяется
+    yookassa_pending_ttl_hours: int = 24
+    # Суточные сводки для дашборда (bot_daily_stats): пересчет закрытых дней и оттока
+    analytics_rollup_refresh_minutes: int = 60
+    analytics_rollup_refresh_days: int = 2
+    analytics_rollup_chunk_days: int = 31
 
     stripe_api_key: SecretStr | None = None
 
@@ -2,14 +2,21 @@ from __future__ import annotations
 
 import base64
 import hashlib
+import threading
+from collections import OrderedDict
 
-from cryptography.fernet import Fernet, InvalidToken
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 
 from .config import settings
 
+_lock = threading.Lock()
+# (исходные ключи, MultiFernet): набор пересобирается только при смене ключей в настройках
+_fernet_cache: tuple[tuple[bytes, ...], MultiFernet] | None = None
+# sha256(шифртекст) -> открытый текст; bytearray, чтобы затереть его при вытеснении
+_secrets: OrderedDict[bytes, bytearray] = OrderedDict()
 
-def _get_fernet() -> Fernet:
-    raw_key = settings.bot_token_encryption_key.get_secret_value().encode()
+
+def _fernet_for_key(raw_key: bytes) -> Fernet:
     try:
         return Fernet(raw_key)
     except (TypeError, ValueError):
@@ -17,6 +24,47 @@ def _get_fernet() -> Fernet:
         return Fernet(derived)
 
 
+def _configured_keys() -> tuple[bytes, ...]:
+    """Текущий ключ и предыдущие, которыми еще могут быть зашифрованы секреты."""
+    return tuple(
+        key.get_secret_value().encode()
+        for key in (
+            settings.bot_token_encryption_key,
+            *settings.bot_token_encryption_previous_keys,
+        )
+    )
+
+
+def _get_fernet() -> MultiFernet:
+    global _fernet_cache
+    raw_keys = _configured_keys()
+    cached = _fernet_cache
+    if cached is not None and cached[0] == raw_keys:
+        return cached[1]
+    with _lock:
+        if _fernet_cache is None or _fernet_cache[0] != raw_keys:
+            # После смены ключей расшифрованные ранее значения больше не гарантированы
+            _clear_secrets()
+            _fernet_cache = (raw_keys, MultiFernet([_fernet_for_key(key) for key in raw_keys]))
+        return _fernet_cache[1]
+
+
+def _zeroize(buffer: bytearray) -> None:
+    buffer[:] = bytes(len(buffer))
+
+
+def _clear_secrets() -> None:
+    for buffer in _secrets.values():
+        _zeroize(buffer)
+    _secrets.clear()
+
+
+def clear_secret_cache() -> None:
+    """Затирает и удаляет все расшифрованные секреты из памяти процесса."""
+    with _lock:
+        _clear_secrets()
+
+
 def encrypt_secret(value: str | None) -> str | None:
     if not value:
         return None
@@ -25,9 +73,48 @@ def encrypt_secret(value: str | None) -> str | None:
 
 
 def decrypt_secret(token: str | None) -> str | None:
+    """
+    Расшифровывает секрет любым из настроенных ключей.
+
+    Результаты кэшируются по sha256 шифртекста (не более
+    `secret_cache_max_entries`); вытесняемые значения затираются нулями.
+    Возвращаемая строка — копия, ее время жизни определяет вызывающий код.
+    """
     if not token:
         return None
+    fernet = _get_fernet()
+    encoded = token.encode()
+    digest = hashlib.sha256(encoded).digest()
+    with _lock:
+        cached = _secrets.get(digest)
+        if cached is not None:
+            _secrets.move_to_end(digest)
+            return cached.decode()
+
     try:
-        return _get_fernet().decrypt(token.encode()).decode()
+        plaintext = bytearray(fernet.decrypt(encoded))
     except InvalidToken as exc:  # pragma: no cover - повреждённый токен
         raise RuntimeError("Не удалось расшифровать секрет") from exc
+    value = plaintext.decode()
+
+    max_entries = settings.secret_cache_max_entries
+    if max_entries <= 0:
+        _zeroize(plaintext)
+        return value
+    with _lock:
+        previous = _secrets.pop(digest, None)
+        if previous is not None:
+            _zeroize(previous)
+        _secrets[digest] = plaintext
+        while len(_secrets) > max_entries:
+            _, evicted = _secrets.popitem(last=False)
+            _zeroize(evicted)
+    return value
+
+
+def rotate_secret(token: str) -> str:
+    """Перешифровывает секрет текущим ключом (для смены ключа, см. MultiFernet.rotate)."""
+    try:
+        return _get_fernet().rotate(token.encode()).decode()
+    except InvalidToken as exc:
+        raise RuntimeError("Не удалось расшифровать секрет") from exc
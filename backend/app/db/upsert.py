@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from typing import Any
+
+from sqlalchemy import Insert, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def insert_ignore_conflicts(session: AsyncSession, model: Any) -> Insert:
+    """INSERT ... ON CONFLICT DO NOTHING для PostgreSQL и SQLite."""
+    dialect_name = session.get_bind().dialect.name
+    if dialect_name == "postgresql":
+        return postgresql.insert(model).on_conflict_do_nothing()
+    if dialect_name == "sqlite":
+        return sqlite.insert(model).on_conflict_do_nothing()
+    return insert(model)
+
+
+def insert_or_increment(
+    session: AsyncSession,
+    model: Any,
+    *,
+    index_elements: list[str],
+    values: dict[str, Any],
+    increments: Iterable[str],
+) -> Insert:
+    """
+    INSERT ... ON CONFLICT DO UPDATE для счетчиков: при конфликте по
+    `index_elements` колонки `increments` увеличиваются на вставляемые значения.
+    """
+    dialect_name = session.get_bind().dialect.name
+    if dialect_name == "postgresql":
+        stmt = postgresql.insert(model).values(**values)
+    elif dialect_name == "sqlite":
+        stmt = sqlite.insert(model).values(**values)
+    else:
+        return insert(model).values(**values)
+    return stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={name: getattr(model, name) + stmt.excluded[name] for name in increments},
+    )
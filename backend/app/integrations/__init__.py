@@ -1,4 +1,10 @@
-from .yookassa import YooKassaClient
-
-__all__ = ["YooKassaClient"]
+from .telegram import TelegramGateway, telegram_gateway
+from .yookassa import YooKassaClient, YooKassaError, yookassa_clients
 
+__all__ = [
+    "TelegramGateway",
+    "YooKassaClient",
+    "YooKassaError",
+    "telegram_gateway",
+    "yookassa_clients",
+]
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any
+
+import httpx
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.config import settings
+from ..core.crypto import decrypt_secret
+from ..models.bot import Bot
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+
+
+def get_retry_after(response: httpx.Response) -> float:
+    """Достаёт `parameters.retry_after` из ответа 429 Telegram (по умолчанию 1 сек.)."""
+    try:
+        retry_after = response.json().get("parameters", {}).get("retry_after")
+    except ValueError:
+        retry_after = None
+    if retry_after is None:
+        retry_after = response.headers.get("Retry-After")
+    try:
+        return max(float(retry_after), 0.0) if retry_after is not None else 1.0
+    except (TypeError, ValueError):
+        return 1.0
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class TelegramGateway:
+    """
+    Общий на процесс клиент Telegram Bot API.
+
+    Держит один пул соединений (HTTP/2, если установлен пакет `h2`) и кэш
+    расшифрованных токенов ботов с TTL, чтобы не читать строку `Bot` и не
+    расшифровывать токен на каждый вызов.
+
+    Ответы 429 ставят на паузу полосу чата ровно на `retry_after`. Если в этот
+    чат не писали последние `telegram_chat_flood_window_seconds` (или chat_id
+    нет), лимит чата ни при чем — это ограничение всего бота, и на паузу
+    встает полоса бота, которую ждут вызовы во все чаты. Запрос повторяется,
+    если пауза не длиннее `telegram_max_retry_after_seconds`, но не больше
+    `telegram_max_retries` раз.
+    """
+
+    def __init__(self, api_url: str = TELEGRAM_API_URL) -> None:
+        self.api_url = api_url
+        self._client: httpx.AsyncClient | None = None
+        self._tokens: dict[int, tuple[str, float]] = {}
+        self._lanes_paused_until: dict[tuple[str, int | str | None], float] = {}
+        self._lanes_last_sent: dict[tuple[str, int | str | None], float] = {}
+        self.throttled_total = 0
+        self.retried_total = 0
+        self.throttled_seconds_total = 0.0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=settings.telegram_timeout_seconds,
+                limits=httpx.Limits(
+                    max_connections=settings.telegram_max_connections,
+                    max_keepalive_connections=settings.telegram_max_keepalive_connections,
+                ),
+                http2=settings.telegram_http2 and _http2_available(),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def method_url(self, token: str, method: str) -> str:
+        return f"{self.api_url}/bot{token}/{method}"
+
+    async def call(
+        self,
+        token: str,
+        method: str,
+        payload: dict[str, Any] | None = None,
+        *,
+        data: dict[str, Any] | None = None,
+        files: dict[str, Any] | None = None,
+        timeout: float | None = None,
+    ) -> httpx.Response:
+        """Вызывает метод Bot API. Статус ответа проверяет вызывающий код."""
+        url = self.method_url(token, method)
+        extra: dict[str, Any] = {}
+        if timeout is not None:
+            extra["timeout"] = timeout
+        chat_id = (payload or data or {}).get("chat_id")
+
+        attempt = 0
+        while True:
+            await self._wait_for_lane(token, chat_id)
+            previous_sent_at = self._mark_sent(token, chat_id)
+            if data is not None or files is not None:
+                response = await self.client.post(url, data=data, files=files, **extra)
+            else:
+                response = await self.client.post(url, json=payload or {}, **extra)
+            if response.status_code != 429:
+                return response
+
+            retry_after = get_retry_after(response)
+            chat_flood = (
+                chat_id is not None
+                and previous_sent_at is not None
+                and time.monotonic() - previous_sent_at
+                < settings.telegram_chat_flood_window_seconds
+            )
+            self.throttled_total += 1
+            paused = self._pause_lane(token, chat_id, retry_after)
+            if not chat_flood:
+                paused = max(paused, self._pause_lane(token, None, retry_after))
+            self.throttled_seconds_total += paused
+            # Файлы уже прочитаны, повторить такой запрос нельзя
+            if (
+                files is not None
+                or retry_after > settings.telegram_max_retry_after_seconds
+                or attempt >= settings.telegram_max_retries
+            ):
+                logger.warning(
+                    "Telegram ограничил частоту вызова %s на %.1f сек., запрос не повторяется",
+                    method,
+                    retry_after,
+                )
+                return response
+            attempt += 1
+            self.retried_total += 1
+
+    async def _wait_for_lane(self, token: str, chat_id: int | str | None) -> None:
+        now = time.monotonic()
+        paused_until = max(
+            self._lanes_paused_until.get((token, None), 0.0),
+            self._lanes_paused_until.get((token, chat_id), 0.0),
+        )
+        if paused_until > now:
+            await asyncio.sleep(paused_until - now)
+
+    def _pause_lane(self, token: str, chat_id: int | str | None, retry_after: float) -> float:
+        """Ставит полосу на паузу; возвращает, на сколько секунд пауза продлилась."""
+        now = time.monotonic()
+        key = (token, chat_id)
+        until = now + retry_after
+        current = self._lanes_paused_until.get(key, 0.0)
+        self._lanes_paused_until[key] = max(current, until)
+        # Снятые паузы больше не нужны
+        if len(self._lanes_paused_until) > 1000:
+            self._lanes_paused_until = {
+                lane: paused_until
+                for lane, paused_until in self._lanes_paused_until.items()
+                if paused_until > now
+            }
+        return max(0.0, until - max(now, current))
+
+    def _mark_sent(self, token: str, chat_id: int | str | None) -> float | None:
+        """Запоминает время отправки в чат; возвращает время предыдущей отправки."""
+        now = time.monotonic()
+        previous = self._lanes_last_sent.get((token, chat_id))
+        self._lanes_last_sent[(token, chat_id)] = now
+        if len(self._lanes_last_sent) > 10_000:
+            window = settings.telegram_chat_flood_window_seconds
+            self._lanes_last_sent = {
+                lane: sent_at
+                for lane, sent_at in self._lanes_last_sent.items()
+                if now - sent_at < window
+            }
+        return previous
+
+    def metrics(self) -> dict[str, float | int]:
+        return {
+            "throttled_total": self.throttled_total,
+            "retried_total": self.retried_total,
+            "throttled_seconds_total": round(self.throttled_seconds_total, 3),
+            "cached_tokens": len(self._tokens),
+        }
+
+    async def get_bot_token(self, session: AsyncSession, bot_id: int) -> str | None:
+        """Возвращает расшифрованный токен бота из кэша или из БД."""
+        cached = self._tokens.get(bot_id)
+        now = time.monotonic()
+        if cached is not None and cached[1] > now:
+            return cached[0]
+
+        bot = await session.get(Bot, bot_id)
+        if bot is None:
+            logger.warning("Бот с id=%s не найден", bot_id)
+            return None
+        if not bot.telegram_bot_token_encrypted:
+            logger.warning("Токен бота %s не настроен", bot_id)
+            return None
+
+        try:
+            # telegram_bot_token_encrypted это bytes, нужно декодировать в строку перед расшифровкой
+            encrypted_str = (
+                bot.telegram_bot_token_encrypted.decode()
+                if isinstance(bot.telegram_bot_token_encrypted, bytes)
+                else bot.telegram_bot_token_encrypted
+            )
+            token = decrypt_secret(encrypted_str)
+        except Exception as exc:
+            logger.warning("Ошибка при расшифровке токена бота %s: %s", bot_id, exc)
+            return None
+        if not token:
+            logger.warning("Не удалось расшифровать токен бота %s", bot_id)
+            return None
+
+        self._tokens[bot_id] = (token, now + settings.telegram_token_cache_ttl_seconds)
+        return token
+
+    def invalidate_token(self, bot_id: int) -> None:
+        self._tokens.pop(bot_id, None)
+
+
+telegram_gateway = TelegramGateway()
@@ -1,22 +1,126 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
+import logging
+import random
+import uuid
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from typing import Any
 
-import json
-from yookassa import Configuration, Payment
+import httpx
 
 from ..core.config import settings
 
+logger = logging.getLogger(__name__)
+
+YOOKASSA_API_URL = "https://api.yookassa.ru/v3"
+
+# Статусы, после которых запрос можно повторить (с тем же ключом идемпотентности)
+_RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class YooKassaError(Exception):
+    """Ответ API YooKassa с ошибкой или исчерпанные повторы."""
+
+    def __init__(
+        self, message: str, *, status_code: int | None = None, code: str | None = None
+    ) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+
+
+class YooKassaClientPool:
+    """
+    HTTP-клиенты YooKassa по магазинам: у каждого shop_id свой пул соединений с
+    keep-alive и своей Basic-авторизацией, поэтому несколько магазинов работают
+    одновременно, не мешая друг другу. При смене ключа магазина создается новый
+    клиент; прежний закрывается, как только на нем не остается запросов
+    (запросы идут через `lease`, который их считает).
+
+    `transport` подменяет сетевой транспорт новых клиентов (заглушка API в
+    тестах и бенчмарках).
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport | None = None) -> None:
+        self._clients: dict[str, tuple[str, httpx.AsyncClient]] = {}
+        self._retired: list[httpx.AsyncClient] = []
+        self._in_flight: dict[httpx.AsyncClient, int] = {}
+        self.transport = transport
+
+    def client_for(self, shop_id: str, api_key: str) -> httpx.AsyncClient:
+        key_digest = hashlib.sha256(api_key.encode()).hexdigest()
+        cached = self._clients.get(shop_id)
+        if cached is not None and cached[0] == key_digest and not cached[1].is_closed:
+            return cached[1]
+        if cached is not None:
+            # Запросы, начатые со старым ключом, должны завершиться
+            self._retired.append(cached[1])
+        client = httpx.AsyncClient(
+            base_url=settings.yookassa_api_url,
+            auth=(shop_id, api_key),
+            timeout=httpx.Timeout(
+                settings.yookassa_timeout_seconds,
+                connect=settings.yookassa_connect_timeout_seconds,
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.yookassa_max_connections,
+                max_keepalive_connections=settings.yookassa_max_connections,
+            ),
+            headers={"Content-Type": "application/json"},
+            transport=self.transport,
+        )
+        self._clients[shop_id] = (key_digest, client)
+        return client
+
+    @asynccontextmanager
+    async def lease(self, shop_id: str, api_key: str) -> AsyncIterator[httpx.AsyncClient]:
+        """Актуальный клиент магазина на время запроса."""
+        client = self.client_for(shop_id, api_key)
+        self._in_flight[client] = self._in_flight.get(client, 0) + 1
+        try:
+            yield client
+        finally:
+            remaining = self._in_flight.pop(client) - 1
+            if remaining:
+                self._in_flight[client] = remaining
+            await self._close_idle_retired()
+
+    async def _close_idle_retired(self) -> None:
+        idle = [client for client in self._retired if client not in self._in_flight]
+        if not idle:
+            return
+        self._retired = [client for client in self._retired if client in self._in_flight]
+        for client in idle:
+            await client.aclose()
+
+    async def aclose(self) -> None:
+        clients = [client for _, client in self._clients.values()] + self._retired
+        self._clients.clear()
+        self._retired.clear()
+        self._in_flight.clear()
+        for client in clients:
+            await client.aclose()
+
+
+yookassa_clients = YooKassaClientPool()
+
 
 class YooKassaClient:
     """
-    Асинхронная обертка над SDK YooKassa.
+    Асинхронный клиент API YooKassa поверх httpx.
+
+    Запросы повторяются при сетевых ошибках, 429 и 5xx, а также при ответе 202
+    (YooKassa еще обрабатывает запрос) — не более `yookassa_max_retries` раз
+    с растущей паузой. Создание платежа повторяется с тем же ключом
+    идемпотентности, поэтому повтор не создаст второй платеж.
     """
 
     def __init__(self, shop_id: str, api_key: str, return_url: str | None = None) -> None:
-        Configuration.account_id = shop_id
-        Configuration.secret_key = api_key
+        self._shop_id = shop_id
+        self._api_key = api_key
         # Преобразуем AnyHttpUrl в строку, если он не None
         default_return_url = str(settings.yookassa_return_url) if settings.yookassa_return_url else None
         self.return_url = return_url or default_return_url
@@ -28,6 +132,7 @@ class YooKassaClient:
         description: str,
         metadata: dict[str, Any],
         confirmation_return_url: str,
+        idempotence_key: str | None = None,
     ) -> dict[str, Any]:
         payload = {
             "amount": {"value": amount, "currency": "RUB"},
@@ -36,11 +141,82 @@ class YooKassaClient:
             "description": description,
             "metadata": metadata,
         }
+        response = await self._request(
+            "POST",
+            "/payments",
+            json=payload,
+            headers={"Idempotence-Key": idempotence_key or str(uuid.uuid4())},
+        )
+        return response.json()
+
+    async def get_payment(self, payment_id: str) -> dict[str, Any] | None:
+        """Платеж по id; None, если в YooKassa такого платежа нет."""
+        try:
+            response = await self._request("GET", f"/payments/{payment_id}")
+        except YooKassaError as exc:
+            if exc.status_code == 404:
+                return None
+            raise
+        return response.json()
+
+    async def _request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        attempt = 0
+        while True:
+            delay: float | None = None
+            try:
+                async with yookassa_clients.lease(self._shop_id, self._api_key) as http:
+                    response = await http.request(method, url, **kwargs)
+            except httpx.TransportError as exc:
+                if attempt >= settings.yookassa_max_retries:
+                    raise YooKassaError(f"YooKassa недоступна: {exc}") from exc
+                logger.info("YooKassa %s %s: %s, повтор", method, url, exc)
+            else:
+                if response.status_code == 202:
+                    # Запрос принят, но еще обрабатывается: YooKassa просит повторить его позже
+                    delay = _retry_after(response)
+                elif response.status_code < 400:
+                    return response
+                elif (
+                    response.status_code not in _RETRYABLE_STATUSES
+                    or attempt >= settings.yookassa_max_retries
+                ):
+                    raise _error_from(response)
+                else:
+                    delay = _retry_after(response) if response.status_code == 429 else None
+                if attempt >= settings.yookassa_max_retries:
+                    raise _error_from(response)
+            attempt += 1
+            if delay is None:
+                base = settings.yookassa_retry_backoff_seconds * 2 ** (attempt - 1)
+                delay = random.uniform(base / 2, base)  # noqa: S311 - разброс пауз, не криптография
+            await asyncio.sleep(delay)
+
 
-        payment = await asyncio.to_thread(Payment.create, payload)
-        return json.loads(payment.json())
+def _retry_after(response: httpx.Response) -> float | None:
+    try:
+        # В ответе 202 YooKassa указывает retry_after в миллисекундах
+        retry_after = response.json().get("retry_after")
+        if retry_after is not None:
+            return max(float(retry_after) / 1000, 0.0)
+    except (ValueError, AttributeError):
+        pass
+    header = response.headers.get("Retry-After")
+    try:
+        return max(float(header), 0.0) if header is not None else None
+    except ValueError:
+        return None
 
-    async def get_payment(self, payment_id: str) -> dict[str, Any]:
-        payment = await asyncio.to_thread(Payment.find_one, payment_id)
-        return json.loads(payment.json())
 
+def _error_from(response: httpx.Response) -> YooKassaError:
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+    if not isinstance(body, dict):
+        body = {}
+    description = body.get("description") or response.reason_phrase
+    return YooKassaError(
+        f"YooKassa ответила {response.status_code}: {description}",
+        status_code=response.status_code,
+        code=body.get("code"),
+    )
@@ -13,14 +13,21 @@ from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 
 from .api.router import api_router
+from .background.payment_events import payment_event_processor
 from .background.scheduler import shutdown_scheduler, start_scheduler
 from .core.config import settings
 from .core.logging import configure_logging
 from .core.rate_limit import limiter
 from .db.session import AsyncSessionLocal, async_engine
+from .integrations.telegram import telegram_gateway
+from .integrations.yookassa import yookassa_clients
 from .services.admins import AdminService
 from .services.bots import BotService
-from .services.payment_providers import PaymentProviderSettingsService
+from .services.notifications import admin_notifications
+from .services.payment_providers import (
+    PaymentProviderSettingsService,
+    ensure_payment_provider_schema,
+)
 
 logger = logging.getLogger("lumenpay.backend")
 
@@ -195,14 +202,22 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
             raise
 
     await ensure_default_admin()
+    await ensure_payment_provider_schema(async_engine)
     await ensure_yookassa_settings()
     await ensure_bot_token()
+    payment_event_processor.start()
+    admin_notifications.start()
 
     yield
 
     if settings.shutdown_graceful:
         await asyncio.sleep(settings.shutdown_delay_seconds)
+    await payment_event_processor.stop()
     shutdown_scheduler()
+    # Дослать накопленные уведомления, пока клиент Telegram еще открыт
+    await admin_notifications.stop()
+    await telegram_gateway.aclose()
+    await yookassa_clients.aclose()
 
 
 def create_app() -> FastAPI:
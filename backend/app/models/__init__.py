@@ -1,9 +1,13 @@
 from .access_log import AccessLog
 from .admin import Admin
 from .bot import Bot
+from .bot_daily_stats import BotDailyStats
+from .broadcast_delivery import BroadcastDelivery, DeliveryStatus
 from .bot_message import BotMessage
+from .cache_invalidation import CacheInvalidation, CacheScope
 from .channel import Channel
 from .payment import Payment, PaymentProvider, PaymentStatus
+from .payment_event import PaymentEvent, PaymentEventStatus
 from .payment_provider_credential import PaymentProviderCredential
 from .subscription_plan import SubscriptionPlan, subscription_plan_channels
 from .promo_code import DiscountType, PromoCode
@@ -14,6 +18,11 @@ from .scheduled_broadcast import (
     ScheduledBroadcast,
 )
 from .subscription import Subscription
+from .subscription_notification import (
+    NotificationKind,
+    NotificationStatus,
+    SubscriptionNotification,
+)
 from .subscription_plan import SubscriptionPlan
 from .user import User
 
@@ -21,9 +30,16 @@ __all__ = [
     "AccessLog",
     "Admin",
     "Bot",
+    "BotDailyStats",
+    "BroadcastDelivery",
+    "DeliveryStatus",
     "BotMessage",
+    "CacheInvalidation",
+    "CacheScope",
     "Channel",
     "Payment",
+    "PaymentEvent",
+    "PaymentEventStatus",
     "PaymentProvider",
     "SubscriptionPlan",
     "PaymentProviderCredential",
@@ -36,6 +52,9 @@ __all__ = [
     "BroadcastStatus",
     "ParseMode",
     "Subscription",
+    "SubscriptionNotification",
+    "NotificationKind",
+    "NotificationStatus",
     "User",
 ]
 
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import Date, ForeignKey, Integer, Numeric, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..db.base import Base
+
+
+class BotDailyStats(Base):
+    """
+    Сводка по боту за сутки (UTC): выручка, новые подписки, продления и отток.
+
+    Оплаты учитываются сразу при активации подписки (`DailyRollupService.record_payment`),
+    закрытые дни и отток пересчитывает фоновая задача. Дашборд читает только
+    эти строки, поэтому его скорость не зависит от размера таблицы платежей.
+    """
+
+    __tablename__ = "bot_daily_stats"
+    __table_args__ = (UniqueConstraint("bot_id", "day", name="uq_bot_daily_stats_bot_day"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    bot_id: Mapped[int] = mapped_column(ForeignKey("bots.id", ondelete="CASCADE"), nullable=False)
+    day: Mapped[date] = mapped_column(Date, nullable=False, index=True)
+    revenue: Mapped[Decimal] = mapped_column(Numeric(14, 2), default=Decimal("0"), nullable=False)
+    payments_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # Первая оплата пользователя — новая подписка, последующие — продления
+    new_subscriptions: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    renewals: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # Пользователи, чья подписка закончилась в этот день и не была продлена
+    churned: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<BotDailyStats bot_id={self.bot_id} day={self.day} revenue={self.revenue}>"
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import enum
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, Enum, ForeignKey, Integer, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..db.base import Base
+
+
+class DeliveryStatus(str, enum.Enum):
+    SENT = "sent"
+    FAILED = "failed"
+
+
+class BroadcastDelivery(Base):
+    """Журнал доставки рассылки: одна строка на получателя."""
+
+    __tablename__ = "broadcast_deliveries"
+
+    broadcast_id: Mapped[int] = mapped_column(
+        ForeignKey("scheduled_broadcasts.id", ondelete="CASCADE"), primary_key=True
+    )
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    telegram_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    status: Mapped[DeliveryStatus] = mapped_column(
+        Enum(DeliveryStatus, name="broadcast_delivery_status", native_enum=False),
+        nullable=False,
+    )
+    error: Mapped[str | None] = mapped_column(String(255))
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"<BroadcastDelivery broadcast_id={self.broadcast_id} user_id={self.user_id} "
+            f"status={self.status}>"
+        )
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import enum
+from datetime import datetime
+
+from sqlalchemy import DateTime, Enum, Integer, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..db.base import Base
+
+
+class CacheScope(str, enum.Enum):
+    STATUS = "status"
+    PLANS = "plans"
+    CHANNELS = "channels"
+
+
+class CacheInvalidation(Base):
+    """
+    Журнал инвалидаций кэша бота: одна строка на изменившиеся данные.
+
+    Бот опрашивает журнал по возрастанию `id` и удаляет из своего кэша записи
+    с той же областью (`scope`) и ключом; `key = NULL` сбрасывает всю область.
+    """
+
+    __tablename__ = "cache_invalidations"
+    # id — курсор клиентов, поэтому SQLite не должен переиспользовать id удаленных строк
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    scope: Mapped[CacheScope] = mapped_column(
+        Enum(CacheScope, name="cache_scope", native_enum=False), nullable=False
+    )
+    key: Mapped[str | None] = mapped_column(String(64))
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False, index=True
+    )
+
+    def __repr__(self) -> str:
+        return f"<CacheInvalidation id={self.id} scope={self.scope} key={self.key}>"
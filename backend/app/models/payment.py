@@ -10,6 +10,7 @@ from sqlalchemy import (
     DateTime,
     Enum,
     ForeignKey,
+    Index,
     Integer,
     Numeric,
     String,
@@ -55,6 +56,8 @@ class Payment(TimestampMixin, Base):
     __tablename__ = "payments"
     __table_args__ = (
         UniqueConstraint("payment_provider", "external_id", name="uq_payments_provider_ext"),
+        # Поиск предыдущих оплат пользователя (новая подписка или продление)
+        Index("ix_payments_user_paid_at", "user_id", "paid_at"),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
@@ -76,7 +79,7 @@ class Payment(TimestampMixin, Base):
     payload: Mapped[dict | None] = mapped_column(
         JSON().with_variant(JSONB, "postgresql"), default=dict
     )
-    paid_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    paid_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), index=True)
     plan_id: Mapped[int | None] = mapped_column(
         ForeignKey("subscription_plans.id", ondelete="SET NULL"), nullable=True
     )
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import enum
+from datetime import datetime
+
+from sqlalchemy import JSON, DateTime, Enum, Integer, String, Text, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..db.base import Base
+from .payment import PaymentProvider
+
+
+class PaymentEventStatus(str, enum.Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    PROCESSED = "processed"
+    FAILED = "failed"
+
+
+class PaymentEvent(Base):
+    """
+    Входящие уведомления платежных провайдеров (inbox).
+
+    Вебхук только сохраняет событие и сразу отвечает провайдеру; обрабатывает
+    его `PaymentEventProcessor`. `idempotency_key` (событие + id объекта)
+    уникален, поэтому повторная доставка того же уведомления отбрасывается
+    при вставке.
+    """
+
+    __tablename__ = "payment_events"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    provider: Mapped[PaymentProvider] = mapped_column(
+        Enum(PaymentProvider, native_enum=False), nullable=False
+    )
+    idempotency_key: Mapped[str] = mapped_column(String(255), nullable=False, unique=True)
+    event: Mapped[str] = mapped_column(String(64), nullable=False)
+    external_id: Mapped[str] = mapped_column(String(255), nullable=False, index=True)
+    payload: Mapped[dict] = mapped_column(JSON().with_variant(JSONB, "postgresql"), nullable=False)
+    status: Mapped[PaymentEventStatus] = mapped_column(
+        Enum(PaymentEventStatus, name="payment_event_status", native_enum=False),
+        default=PaymentEventStatus.PENDING,
+        nullable=False,
+        index=True,
+    )
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_error: Mapped[str | None] = mapped_column(Text)
+    # Событие не берется в обработку раньше этого времени (пауза между попытками)
+    available_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    locked_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    processed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), index=True)
+
+    def __repr__(self) -> str:
+        return f"<PaymentEvent id={self.id} key={self.idempotency_key} status={self.status}>"
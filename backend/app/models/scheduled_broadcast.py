@@ -9,6 +9,7 @@ from sqlalchemy import (
     JSON,
     DateTime,
     Enum,
+    Float,
     ForeignKey,
     Integer,
     String,
@@ -88,6 +89,14 @@ class ScheduledBroadcast(TimestampMixin, Base):
     buttons: Mapped[dict | None] = mapped_column(
         JSON().with_variant(JSONB, "postgresql"), default=dict
     )
+    # Пропускная способность рассылки; None - используются значения из настроек
+    messages_per_second: Mapped[float | None] = mapped_column(Float, nullable=True)
+    concurrency: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # Контрольная точка отправки: все получатели с users.id <= checkpoint_user_id обработаны
+    checkpoint_user_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    heartbeat_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    # Метка процесса, который сейчас отправляет рассылку
+    claimed_by: Mapped[str | None] = mapped_column(String(32), nullable=True)
 
     bot: Mapped["Bot"] = relationship(back_populates="broadcasts")
     channel: Mapped["Channel | None"] = relationship(back_populates="broadcasts")
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import enum
+from datetime import datetime
+
+from sqlalchemy import DateTime, Enum, ForeignKey, Integer, UniqueConstraint, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from ..db.base import Base
+
+
+class NotificationKind(str, enum.Enum):
+    EXPIRING_7D = "expiring_7d"
+    EXPIRING_3D = "expiring_3d"
+    EXPIRING_1D = "expiring_1d"
+    EXPIRED = "expired"
+
+    @classmethod
+    def for_days_left(cls, days_left: int) -> "NotificationKind":
+        return cls(f"expiring_{days_left}d")
+
+
+class NotificationStatus(str, enum.Enum):
+    PENDING = "pending"
+    SENT = "sent"
+
+
+class SubscriptionNotification(Base):
+    """
+    Outbox уведомлений о подписках: одна строка на уведомление.
+
+    Уникальный ключ не дает отправить одно и то же уведомление дважды, в том числе
+    с разных реплик. `expires_at` входит в ключ, потому что продление обновляет
+    срок существующей подписки, и напоминания для нового срока должны уйти снова.
+    """
+
+    __tablename__ = "subscription_notifications"
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id",
+            "subscription_id",
+            "kind",
+            "expires_at",
+            name="uq_subscription_notifications_key",
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    subscription_id: Mapped[int] = mapped_column(
+        ForeignKey("subscriptions.id", ondelete="CASCADE"), nullable=False
+    )
+    kind: Mapped[NotificationKind] = mapped_column(
+        Enum(NotificationKind, name="subscription_notification_kind", native_enum=False),
+        nullable=False,
+    )
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    status: Mapped[NotificationStatus] = mapped_column(
+        Enum(NotificationStatus, name="subscription_notification_status", native_enum=False),
+        default=NotificationStatus.PENDING,
+        nullable=False,
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+    def __repr__(self) -> str:
+        return (
+            f"<SubscriptionNotification user_id={self.user_id} "
+            f"subscription_id={self.subscription_id} kind={self.kind}>"
+        )
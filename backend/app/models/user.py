@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import date, datetime
 from typing import TYPE_CHECKING
 
-from sqlalchemy import Boolean, Date, DateTime, ForeignKey, Integer, String, UniqueConstraint
+from sqlalchemy import Boolean, Date, DateTime, ForeignKey, Integer, String, UniqueConstraint, false
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from ..db.base import Base, TimestampMixin
@@ -33,6 +33,10 @@ class User(TimestampMixin, Base):
     is_premium: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     subscription_end: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
     is_blocked: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    # Premium снят, но пользователь еще не удален из всех каналов бота
+    channels_kick_pending: Mapped[bool] = mapped_column(
+        Boolean, default=False, server_default=false(), nullable=False, index=True
+    )
 
     bot: Mapped["Bot"] = relationship(back_populates="users")
     subscriptions: Mapped[list["Subscription"]] = relationship(
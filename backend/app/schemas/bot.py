@@ -89,6 +89,15 @@ class SubscriptionStatusResponse(ORMModel):
     plan: SubscriptionPlanPublic | None = None
 
 
+class SubscriptionStatusBatchRequest(ORMModel):
+    telegram_ids: list[int] = Field(min_length=1, max_length=5000)
+    bot_id: int | None = None
+
+
+class SubscriptionStatusBatchItem(SubscriptionStatusResponse):
+    telegram_id: int
+
+
 class PaymentCreateRequest(ORMModel):
     user_id: int | None = None
     telegram_id: int
@@ -125,3 +134,22 @@ class PaymentConfirmResponse(ORMModel):
     status: str
     subscription_end: datetime | None
 
+
+
+class BotTenant(ORMModel):
+    id: int
+    slug: str
+    name: str
+    token: str
+
+
+class CacheInvalidationEvent(ORMModel):
+    id: int
+    scope: str
+    key: str | None = None
+
+
+class CacheInvalidationsResponse(ORMModel):
+    cursor: int
+    reset: bool = False
+    events: list[CacheInvalidationEvent] = Field(default_factory=list)
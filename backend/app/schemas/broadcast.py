@@ -20,6 +20,8 @@ class BroadcastBase(ORMModel):
     media_files: list[dict[str, Any]] | None = Field(default_factory=list)
     scheduled_at: datetime | None = None
     buttons: dict[str, Any] | None = Field(default_factory=dict)
+    messages_per_second: float | None = Field(default=None, gt=0, le=1000)
+    concurrency: int | None = Field(default=None, ge=1, le=256)
 
     @field_validator("parse_mode")
     @classmethod
@@ -75,6 +77,8 @@ class BroadcastUpdate(ORMModel):
     scheduled_at: datetime | None = None
     status: str | None = None
     buttons: dict[str, Any] | None = None
+    messages_per_second: float | None = Field(default=None, gt=0, le=1000)
+    concurrency: int | None = Field(default=None, ge=1, le=256)
 
     @field_validator("message_text")
     @classmethod
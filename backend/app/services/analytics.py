@@ -1,12 +1,14 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta, timezone
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
 from decimal import Decimal
 from typing import Sequence
 
 from sqlalchemy import Select, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..models.bot_daily_stats import BotDailyStats
 from ..models.payment import Payment, PaymentStatus
 from ..models.subscription import Subscription
 from ..schemas.admin import (
@@ -17,14 +19,23 @@ from ..schemas.admin import (
 )
 
 
+@dataclass(slots=True)
+class _DayTotals:
+    revenue: Decimal
+    new_subscriptions: int
+    renewals: int
+    churned: int
+
+
 class AnalyticsService:
     def __init__(self, session: AsyncSession) -> None:
         self.session = session
 
     async def dashboard_summary(self) -> DashboardSummary:
         now = datetime.now(timezone.utc)
-        month_ago = now - timedelta(days=30)
-        week_ago = now - timedelta(days=7)
+        today = now.date()
+        month_start = today - timedelta(days=29)
+        week_start = today - timedelta(days=6)
 
         active_subscriptions = await self._scalar(
             select(func.count())
@@ -32,18 +43,14 @@ class AnalyticsService:
             .where(Subscription.is_active.is_(True))
         )
 
-        monthly_revenue = await self._scalar(
-            select(func.coalesce(func.sum(Payment.amount), 0))
-            .where(Payment.status == PaymentStatus.SUCCEEDED)
-            .where(Payment.paid_at.isnot(None))
-            .where(Payment.paid_at >= month_ago)
-        )
-
-        renewals_today = await self._scalar(
-            select(func.count())
-            .select_from(Subscription)
-            .where(Subscription.started_at >= datetime(now.year, now.month, now.day, tzinfo=timezone.utc))
-        )
+        # Выручка, оплаты и отток — из суточных сводок, а не из таблицы платежей
+        days = await self._daily_totals(month_start)
+        monthly_revenue = sum((item.revenue for item in days.values()), Decimal("0"))
+        churned_month = sum(item.churned for item in days.values())
+        # Оплаты подписок за сегодня: первые оплаты пользователей и продления
+        today_totals = days.get(today)
+        new_today = today_totals.new_subscriptions if today_totals else 0
+        renewals_today = today_totals.renewals if today_totals else 0
 
         recent_payments = await self.session.execute(
             select(Payment)
@@ -53,7 +60,13 @@ class AnalyticsService:
         )
         payment_rows: Sequence[Payment] = recent_payments.scalars().all()
 
-        revenue_points = await self._revenue_trend(week_ago, now)
+        revenue_points = [
+            RevenuePoint(
+                date=day.strftime("%d.%m"),
+                value=days[day].revenue if day in days else Decimal("0"),
+            )
+            for day in (week_start + timedelta(days=offset) for offset in range(7))
+        ]
 
         metrics = [
             DashboardMetric(
@@ -71,12 +84,19 @@ class AnalyticsService:
                 icon="credit-card",
             ),
             DashboardMetric(
-                id="renewals_today",
-                title="Продлений сегодня",
-                value=str(renewals_today),
-                change=None,
+                id="subscription_payments_today",
+                title="Оплат подписок сегодня",
+                value=str(new_today + renewals_today),
+                change=f"{new_today} новых, {renewals_today} продлений",
                 icon="arrow-up-right",
             ),
+            DashboardMetric(
+                id="churn_30d",
+                title="Отток за 30 дней",
+                value=str(churned_month),
+                change=None,
+                icon="users",
+            ),
         ]
 
         activities = [
@@ -95,28 +115,28 @@ class AnalyticsService:
             recent_activity=activities,
         )
 
-    async def _revenue_trend(self, start: datetime, end: datetime) -> list[RevenuePoint]:
-        stmt = (
-            select(Payment)
-            .where(Payment.status == PaymentStatus.SUCCEEDED)
-            .where(Payment.paid_at >= start)
-            .where(Payment.paid_at <= end)
-            .order_by(Payment.paid_at.asc())
+    async def _daily_totals(self, start: date) -> dict[date, _DayTotals]:
+        """Суммы суточных сводок всех ботов начиная с `start`."""
+        result = await self.session.execute(
+            select(
+                BotDailyStats.day,
+                func.sum(BotDailyStats.revenue),
+                func.sum(BotDailyStats.new_subscriptions),
+                func.sum(BotDailyStats.renewals),
+                func.sum(BotDailyStats.churned),
+            )
+            .where(BotDailyStats.day >= start)
+            .group_by(BotDailyStats.day)
         )
-        result = await self.session.execute(stmt)
-        rows: Sequence[Payment] = result.scalars().all()
-
-        distribution: dict[str, Decimal] = {}
-        for payment in rows:
-            if not payment.paid_at:
-                continue
-            key = payment.paid_at.strftime("%d.%m")
-            distribution[key] = distribution.get(key, Decimal("0")) + payment.amount
-
-        return [
-            RevenuePoint(date=key, value=value)
-            for key, value in sorted(distribution.items())
-        ]
+        return {
+            day: _DayTotals(
+                revenue=Decimal(str(revenue or 0)),
+                new_subscriptions=int(new_subscriptions or 0),
+                renewals=int(renewals or 0),
+                churned=int(churned or 0),
+            )
+            for day, revenue, new_subscriptions, renewals, churned in result
+        }
 
     async def _scalar(self, stmt: Select) -> int | Decimal:
         result = await self.session.execute(stmt)
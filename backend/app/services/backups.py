@@ -14,6 +14,7 @@ from sqlalchemy.inspection import inspect
 
 from ..core.config import settings
 from ..db.session import AsyncSessionLocal
+from ..integrations.telegram import telegram_gateway
 from ..models import Payment, Subscription, User
 
 logger = logging.getLogger("lumenpay.backups")
@@ -103,17 +104,17 @@ async def _send_telegram_document(file_path: Path, caption: str) -> None:
 
     token = settings.telegram_bot_token.get_secret_value()
     chat_id = settings.backup_admin_chat_id
-    url = f"https://api.telegram.org/bot{token}/sendDocument"
 
-    async with httpx.AsyncClient(timeout=60) as client:
-        with file_path.open("rb") as document:
-            form = {
-                "chat_id": str(chat_id),
-                "caption": caption,
-            }
-            files = {"document": (file_path.name, document, "application/zip")}
-            response = await client.post(url, data=form, files=files)
-            response.raise_for_status()
+    with file_path.open("rb") as document:
+        form = {
+            "chat_id": str(chat_id),
+            "caption": caption,
+        }
+        files = {"document": (file_path.name, document, "application/zip")}
+        response = await telegram_gateway.call(
+            token, "sendDocument", data=form, files=files, timeout=60
+        )
+        response.raise_for_status()
 
     logger.info("Резервная копия отправлена администратору в Telegram")
 
@@ -165,11 +166,9 @@ async def notify_failure(message: str) -> None:
 
     token = settings.telegram_bot_token.get_secret_value()
     chat_id = settings.backup_admin_chat_id
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        response = await client.post(url, json={"chat_id": chat_id, "text": message})
-        response.raise_for_status()
+    response = await telegram_gateway.call(token, "sendMessage", {"chat_id": chat_id, "text": message})
+    response.raise_for_status()
 
 
 async def run_backup_job() -> None:
@@ -5,7 +5,8 @@ import logging
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..core.crypto import encrypt_secret
+from ..core.crypto import decrypt_secret, encrypt_secret
+from ..integrations.telegram import telegram_gateway
 from ..models.bot import Bot
 
 logger = logging.getLogger(__name__)
@@ -19,6 +20,27 @@ class BotService:
         result = await self.session.execute(select(Bot))
         return result.scalars().all()
 
+    async def list_active_with_tokens(self) -> list[tuple[Bot, str]]:
+        """Активные боты с настроенным токеном и сам расшифрованный токен."""
+        result = await self.session.execute(
+            select(Bot)
+            .where(Bot.is_active.is_(True), Bot.telegram_bot_token_encrypted.is_not(None))
+            .order_by(Bot.id)
+        )
+        bots: list[tuple[Bot, str]] = []
+        for bot in result.scalars():
+            encrypted = bot.telegram_bot_token_encrypted
+            try:
+                token = decrypt_secret(
+                    encrypted.decode() if isinstance(encrypted, bytes) else encrypted
+                )
+            except Exception as exc:
+                logger.warning("Ошибка при расшифровке токена бота %s: %s", bot.id, exc)
+                continue
+            if token:
+                bots.append((bot, token))
+        return bots
+
     async def get_bot(self, bot_id: int) -> Bot:
         bot = await self.session.get(Bot, bot_id)
         if bot is None:
@@ -31,6 +53,7 @@ class BotService:
         self.session.add(bot)
         await self.session.commit()
         await self.session.refresh(bot)
+        telegram_gateway.invalidate_token(bot_id)
         logger.info(
             "Обновлён токен бота",
             extra={
@@ -103,6 +126,7 @@ class BotService:
         bot = await self.get_bot(bot_id)
         await self.session.delete(bot)
         await self.session.commit()
+        telegram_gateway.invalidate_token(bot_id)
         logger.info(
             "Удалён бот",
             extra={
@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterable, Callable, Iterable
+from dataclasses import dataclass, field
+from typing import Any
+
+import httpx
+
+from ..core.config import settings
+from ..integrations.telegram import TELEGRAM_API_URL, get_retry_after
+
+logger = logging.getLogger(__name__)
+
+# Вызывается после окончательного результата отправки: (задание, None при успехе или текст ошибки)
+ResultCallback = Callable[["DeliveryJob", "str | None"], None]
+
+# Сколько ошибок сохраняем в статистике рассылки
+_MAX_STORED_ERRORS = 10
+# При каком размере чистим таблицу времени последней отправки по чатам
+_CHAT_LANES_PRUNE_THRESHOLD = 10_000
+
+
+@dataclass(slots=True)
+class ThroughputSettings:
+    """Параметры пропускной способности для одной рассылки."""
+
+    messages_per_second: float
+    concurrency: int
+    per_chat_interval: float
+
+    @classmethod
+    def resolve(
+        cls,
+        messages_per_second: float | None = None,
+        concurrency: int | None = None,
+    ) -> "ThroughputSettings":
+        """Собирает настройки рассылки, подставляя глобальные значения по умолчанию."""
+        return cls(
+            messages_per_second=messages_per_second or settings.broadcast_messages_per_second,
+            concurrency=concurrency or settings.broadcast_concurrency,
+            per_chat_interval=settings.broadcast_per_chat_interval_seconds,
+        )
+
+
+@dataclass(slots=True)
+class DeliveryJob:
+    """Одно сообщение для отправки через Bot API."""
+
+    chat_id: int | str
+    method: str
+    payload: dict[str, Any]
+    recipient_id: int | None = None
+    attempts: int = 0
+
+
+@dataclass(slots=True)
+class DeliveryReport:
+    sent: int = 0
+    failed: int = 0
+    errors: list[str] = field(default_factory=list)
+    elapsed: float = 0.0
+    # Ответы 429 от Telegram и повторные постановки сообщений в очередь
+    throttled: int = 0
+    requeued: int = 0
+    throttled_seconds: float = 0.0
+    final_rate: float = 0.0
+
+    @property
+    def total(self) -> int:
+        return self.sent + self.failed
+
+    @property
+    def messages_per_second(self) -> float:
+        if self.elapsed <= 0:
+            return 0.0
+        return self.total / self.elapsed
+
+    def add_error(self, error: str) -> None:
+        if len(self.errors) < _MAX_STORED_ERRORS:
+            self.errors.append(error)
+
+
+class TokenBucket:
+    """Классический token bucket: `rate` токенов в секунду, не больше `capacity` в запасе."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        if rate <= 0:
+            raise ValueError("rate должен быть положительным")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated_at
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+
+    def pause(self, seconds: float) -> float:
+        """Останавливает выдачу токенов на `seconds`. Возвращает добавленное время паузы."""
+        now = time.monotonic()
+        until = now + seconds
+        added = max(0.0, until - max(now, self._paused_until))
+        if until > self._paused_until:
+            self._paused_until = until
+            # После паузы не выпускаем накопленный запас разом
+            self._tokens = 0.0
+            self._updated_at = until
+        return added
+
+    async def acquire(self) -> None:
+        # Lock держится во время ожидания, поэтому ожидающие обслуживаются по очереди
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class BroadcastRateLimiter:
+    """
+    Общий лимит бота (token bucket) плюс минимальный интервал между сообщениями в один чат.
+
+    Скорость подстраивается по AIMD: каждый успешный ответ добавляет к скорости
+    `additive_increase / rate` (то есть примерно `additive_increase` сообщений/сек
+    за секунду), а ответ 429 уменьшает её в `multiplicative_decrease` раз — не чаще
+    одного раза за окно `retry_after`, чтобы пачка одновременных 429 не обрушила скорость.
+    """
+
+    def __init__(self, throughput: ThroughputSettings) -> None:
+        self.bucket = TokenBucket(throughput.messages_per_second)
+        self.max_rate = throughput.messages_per_second
+        self.min_rate = min(settings.broadcast_min_messages_per_second, self.max_rate)
+        self.additive_increase = settings.broadcast_additive_increase
+        self.multiplicative_decrease = settings.broadcast_multiplicative_decrease
+        self.per_chat_interval = throughput.per_chat_interval
+        self._chat_next_allowed: dict[int | str, float] = {}
+        self._decrease_blocked_until = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    async def acquire(self, chat_id: int | str) -> None:
+        now = time.monotonic()
+        next_allowed = self._chat_next_allowed.get(chat_id, now)
+        if self.per_chat_interval > 0:
+            self._chat_next_allowed[chat_id] = max(now, next_allowed) + self.per_chat_interval
+            if len(self._chat_next_allowed) > _CHAT_LANES_PRUNE_THRESHOLD:
+                self._prune(now)
+        if next_allowed > now:
+            await asyncio.sleep(next_allowed - now)
+        await self.bucket.acquire()
+
+    def on_success(self) -> None:
+        if self.bucket.rate < self.max_rate:
+            self.bucket.rate = min(
+                self.max_rate, self.bucket.rate + self.additive_increase / self.bucket.rate
+            )
+
+    def on_throttled(self, chat_id: int | str, retry_after: float) -> float:
+        """
+        Обрабатывает 429: ставит на паузу полосу чата и бота ровно на `retry_after`
+        и уменьшает скорость. Возвращает, на сколько секунд продлилась пауза бота.
+        """
+        now = time.monotonic()
+        self._chat_next_allowed[chat_id] = max(
+            self._chat_next_allowed.get(chat_id, now), now + retry_after
+        )
+        if now >= self._decrease_blocked_until:
+            self.bucket.rate = max(self.min_rate, self.bucket.rate * self.multiplicative_decrease)
+            self._decrease_blocked_until = now + retry_after
+            logger.warning(
+                "Telegram ограничил частоту отправки: пауза %.1f сек., скорость снижена до %.1f/сек",
+                retry_after,
+                self.bucket.rate,
+            )
+        return self.bucket.pause(retry_after)
+
+    def _prune(self, now: float) -> None:
+        self._chat_next_allowed = {
+            chat_id: next_allowed
+            for chat_id, next_allowed in self._chat_next_allowed.items()
+            if next_allowed > now
+        }
+
+
+class BroadcastDeliveryEngine:
+    """
+    Отправляет сообщения пулом конкурентных воркеров.
+
+    Источник заданий может быть ленивым (генератор/стрим из БД): одновременно в
+    работе держится не больше `2 * concurrency` сообщений. Сообщения, получившие
+    429, возвращаются в очередь после `retry_after` и не считаются ошибкой, пока не
+    исчерпан лимит повторов.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        token: str,
+        throughput: ThroughputSettings,
+        *,
+        api_url: str = TELEGRAM_API_URL,
+    ) -> None:
+        self.client = client
+        self.throughput = throughput
+        self.limiter = BroadcastRateLimiter(throughput)
+        self.max_attempts = settings.broadcast_max_attempts
+        self._base_url = f"{api_url}/bot{token}"
+
+    async def deliver(
+        self,
+        jobs: Iterable[DeliveryJob] | AsyncIterable[DeliveryJob],
+        on_result: ResultCallback | None = None,
+    ) -> DeliveryReport:
+        report = DeliveryReport()
+        # Очередь не ограничена: объём работы ограничивает семафор, а повторные
+        # постановки после 429 не должны блокироваться
+        queue: asyncio.Queue[DeliveryJob] = asyncio.Queue()
+        slots = asyncio.Semaphore(self.throughput.concurrency * 2)
+        started_at = time.monotonic()
+
+        workers = [
+            asyncio.create_task(self._worker(queue, slots, report, on_result))
+            for _ in range(self.throughput.concurrency)
+        ]
+        try:
+            if isinstance(jobs, AsyncIterable):
+                async for job in jobs:
+                    await slots.acquire()
+                    queue.put_nowait(job)
+            else:
+                for job in jobs:
+                    await slots.acquire()
+                    queue.put_nowait(job)
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        report.elapsed = time.monotonic() - started_at
+        report.final_rate = self.limiter.rate
+        logger.info(
+            "Рассылка доставлена: %d отправлено, %d ошибок, %.1f сообщений/сек, "
+            "429: %d, повторов: %d, пауза: %.1f сек.",
+            report.sent,
+            report.failed,
+            report.messages_per_second,
+            report.throttled,
+            report.requeued,
+            report.throttled_seconds,
+        )
+        return report
+
+    async def _worker(
+        self,
+        queue: asyncio.Queue[DeliveryJob],
+        slots: asyncio.Semaphore,
+        report: DeliveryReport,
+        on_result: ResultCallback | None,
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await queue.get()
+            try:
+                await self.limiter.acquire(job.chat_id)
+                job.attempts += 1
+                error, retry_after = await self._send(job)
+                if retry_after is not None:
+                    report.throttled += 1
+                    report.throttled_seconds += self.limiter.on_throttled(job.chat_id, retry_after)
+                    if job.attempts < self.max_attempts:
+                        report.requeued += 1
+                        # task_done вызовется после повторной постановки, чтобы
+                        # queue.join() не завершился раньше времени
+                        loop.call_later(retry_after, self._requeue, queue, job)
+                        continue
+            except Exception as exc:
+                error = f"User {job.chat_id}: {exc}"
+
+            if error is None:
+                report.sent += 1
+                self.limiter.on_success()
+            else:
+                report.failed += 1
+                if error:
+                    report.add_error(error)
+            try:
+                if on_result is not None:
+                    on_result(job, error)
+            finally:
+                slots.release()
+                queue.task_done()
+
+    @staticmethod
+    def _requeue(queue: asyncio.Queue[DeliveryJob], job: DeliveryJob) -> None:
+        queue.put_nowait(job)
+        queue.task_done()
+
+    async def _send(self, job: DeliveryJob) -> tuple[str | None, float | None]:
+        """
+        Возвращает (ошибка, retry_after). Ошибка None — успех, пустая строка —
+        ожидаемый отказ (пользователь заблокировал бота).
+        """
+        try:
+            response = await self.client.post(f"{self._base_url}/{job.method}", json=job.payload)
+            if response.status_code == 429:
+                return f"User {job.chat_id}: HTTP 429", get_retry_after(response)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as exc:
+            if exc.response.status_code == 403:
+                # Пользователь заблокировал бота - это нормально
+                return "", None
+            return f"User {job.chat_id}: HTTP {exc.response.status_code}", None
+        except Exception as exc:
+            return f"User {job.chat_id}: {exc}", None
+        return None, None
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import copy
+import logging
+from typing import Any
+
+from .broadcast_delivery import DeliveryJob
+
+logger = logging.getLogger(__name__)
+
+# Ограничения Bot API
+MEDIA_GROUP_LIMIT = 10
+
+_SEND_METHODS = {
+    "photo": ("sendPhoto", "photo"),
+    "video": ("sendVideo", "video"),
+    "document": ("sendDocument", "document"),
+    "animation": ("sendAnimation", "animation"),
+    "audio": ("sendAudio", "audio"),
+}
+# Какие типы можно объединить в один альбом (sendMediaGroup)
+_MEDIA_GROUP_KINDS = ({"photo", "video"}, {"document"}, {"audio"})
+
+# (bot_id, url) -> file_id. file_id в Telegram привязан к боту, поэтому ключ включает бота
+_file_id_cache: dict[tuple[int, str], str] = {}
+
+
+def _extract_file_id(message: dict[str, Any], media_type: str) -> str | None:
+    """Достаёт file_id загруженного файла из отправленного сообщения"""
+    if media_type == "photo":
+        sizes = message.get("photo") or []
+        # Последний размер — самый крупный
+        return sizes[-1].get("file_id") if sizes else None
+    attachment = message.get(media_type) or message.get("document") or {}
+    return attachment.get("file_id")
+
+
+class BroadcastContent:
+    """
+    Сообщение рассылки: текст и вложения, собранные в вызовы Bot API.
+
+    Вложение описывается словарём `{"type": ..., "url": ..., "file_id": ...}`.
+    Файл по `url` загружается в Telegram один раз на бота — первой отправкой — и
+    дальше всем получателям уходит ссылка по `file_id`. Полученные `file_id`
+    сохраняются в `media_files` рассылки (`file_ids` по id бота) и в кэше процесса.
+    """
+
+    def __init__(
+        self,
+        bot_id: int,
+        message_text: str,
+        parse_mode: str | None,
+        media_files: list[dict[str, Any]] | None,
+    ) -> None:
+        self.bot_id = bot_id
+        self.message_text = message_text
+        self.parse_mode = parse_mode
+        self._media_files = copy.deepcopy(media_files or [])
+        self._items = self._select_items(self._media_files)
+
+    @staticmethod
+    def _select_items(media_files: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        items = []
+        for item in media_files:
+            if item.get("type") not in _SEND_METHODS:
+                logger.warning(f"Неподдерживаемый тип вложения рассылки: {item.get('type')}")
+                continue
+            if not item.get("file_id") and not item.get("url"):
+                # Файл не загружен (нет ни file_id, ни url) — отправить его нечем
+                logger.warning(f"У вложения рассылки нет file_id или url: {item}")
+                continue
+            items.append(item)
+
+        if len(items) <= 1:
+            return items
+        kinds = {item["type"] for item in items}
+        if not any(kinds <= group for group in _MEDIA_GROUP_KINDS):
+            logger.warning(
+                f"Вложения типов {sorted(kinds)} нельзя отправить одним альбомом, "
+                "отправляется только первое"
+            )
+            return items[:1]
+        if len(items) > MEDIA_GROUP_LIMIT:
+            logger.warning(
+                f"В альбоме не больше {MEDIA_GROUP_LIMIT} вложений, лишние не отправляются"
+            )
+        return items[:MEDIA_GROUP_LIMIT]
+
+    @property
+    def media_files(self) -> list[dict[str, Any]]:
+        """Вложения рассылки с сохранёнными file_id для записи обратно в БД"""
+        return copy.deepcopy(self._media_files)
+
+    @property
+    def needs_upload(self) -> bool:
+        """Есть ли вложения, которые этот бот ещё не загружал в Telegram"""
+        return any(self._file_id(item) is None for item in self._items)
+
+    def _file_id(self, item: dict[str, Any]) -> str | None:
+        file_id = (item.get("file_ids") or {}).get(str(self.bot_id))
+        if file_id:
+            return file_id
+        url = item.get("url")
+        if url and (self.bot_id, url) in _file_id_cache:
+            return _file_id_cache[(self.bot_id, url)]
+        if item.get("file_id"):
+            return item["file_id"]
+        return None
+
+    def _media_ref(self, item: dict[str, Any]) -> str:
+        return self._file_id(item) or item["url"]
+
+    def build_job(self, chat_id: int | str) -> DeliveryJob:
+        """Формирует вызов Bot API для одного получателя"""
+        if not self._items:
+            payload: dict[str, Any] = {"chat_id": chat_id, "text": self.message_text}
+            if self.parse_mode:
+                payload["parse_mode"] = self.parse_mode
+            return DeliveryJob(chat_id=chat_id, method="sendMessage", payload=payload)
+
+        if len(self._items) == 1:
+            item = self._items[0]
+            method, field_name = _SEND_METHODS[item["type"]]
+            payload = {
+                "chat_id": chat_id,
+                field_name: self._media_ref(item),
+                "caption": self.message_text,
+            }
+            if self.parse_mode:
+                payload["parse_mode"] = self.parse_mode
+            return DeliveryJob(chat_id=chat_id, method=method, payload=payload)
+
+        media = []
+        for idx, item in enumerate(self._items):
+            entry: dict[str, Any] = {"type": item["type"], "media": self._media_ref(item)}
+            # Подпись альбома — подпись его первого элемента
+            if idx == 0:
+                entry["caption"] = self.message_text
+                if self.parse_mode:
+                    entry["parse_mode"] = self.parse_mode
+            media.append(entry)
+        return DeliveryJob(
+            chat_id=chat_id,
+            method="sendMediaGroup",
+            payload={"chat_id": chat_id, "media": media},
+        )
+
+    def remember_uploads(self, response_data: dict[str, Any]) -> int:
+        """
+        Сохраняет file_id из ответа на отправку с загрузкой.
+        Возвращает, сколько вложений теперь доступно по ссылке.
+        """
+        result = response_data.get("result")
+        messages = result if isinstance(result, list) else [result]
+        remembered = 0
+        for item, message in zip(self._items, messages):
+            if not isinstance(message, dict):
+                continue
+            file_id = _extract_file_id(message, item["type"])
+            if not file_id:
+                continue
+            item.setdefault("file_ids", {})[str(self.bot_id)] = file_id
+            if item.get("url"):
+                _file_id_cache[(self.bot_id, item["url"])] = file_id
+            remembered += 1
+        return remembered
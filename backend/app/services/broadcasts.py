@@ -2,16 +2,23 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import time
+import uuid
+from collections.abc import AsyncIterator, Sequence
 from datetime import date, datetime, timedelta, timezone
 from typing import Any
 
 import httpx
-from sqlalchemy import Select, func, select
+from sqlalchemy import ColumnElement, Row, Select, func, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
-from ..core.crypto import decrypt_secret
+from ..core.config import settings
+from ..db.upsert import insert_ignore_conflicts
+from ..integrations.telegram import telegram_gateway
 from ..models.bot import Bot
+from ..models.broadcast_delivery import BroadcastDelivery, DeliveryStatus
 from ..models.channel import Channel
 from ..models.scheduled_broadcast import (
     BroadcastAudience,
@@ -22,10 +29,138 @@ from ..models.scheduled_broadcast import (
 from ..models.subscription import Subscription
 from ..models.user import User
 from ..schemas.broadcast import BroadcastCreate, BroadcastRead, BroadcastUpdate
+from .broadcast_delivery import BroadcastDeliveryEngine, DeliveryJob, ThroughputSettings
+from .broadcast_media import BroadcastContent
 
 logger = logging.getLogger(__name__)
 
 
+class _DeliveryLedger:
+    """
+    Журнал доставки рассылки с пакетной записью.
+
+    Результаты копятся в памяти и сбрасываются одним INSERT вместе с контрольной
+    точкой и heartbeat рассылки. Контрольная точка — наибольший users.id, до которого
+    все отправленные получатели уже имеют запись в журнале. Контрольная точка
+    записывается, только пока рассылка закреплена за этим процессом (claimed_by);
+    иначе журнал помечается потерянным и отправка останавливается.
+    """
+
+    def __init__(
+        self, session: AsyncSession, broadcast: ScheduledBroadcast, owner: str
+    ) -> None:
+        self.session = session
+        self.broadcast = broadcast
+        self.owner = owner
+        self.lost = False
+        self._pending: list[dict[str, Any]] = []
+        self._in_flight: set[int] = set()
+        self._last_dispatched_id = broadcast.checkpoint_user_id or 0
+        self._flushed_at = time.monotonic()
+
+    def dispatch(self, user_id: int) -> None:
+        self._in_flight.add(user_id)
+        self._last_dispatched_id = user_id
+
+    def record(self, job: DeliveryJob, error: str | None) -> None:
+        self._in_flight.discard(job.recipient_id)
+        self._pending.append(
+            {
+                "broadcast_id": self.broadcast.id,
+                "user_id": job.recipient_id,
+                "telegram_id": job.chat_id,
+                "status": DeliveryStatus.SENT if error is None else DeliveryStatus.FAILED,
+                "error": error[:255] if error else None,
+            }
+        )
+
+    def should_flush(self) -> bool:
+        return (
+            len(self._pending) >= settings.broadcast_ledger_batch_size
+            or time.monotonic() - self._flushed_at >= settings.broadcast_checkpoint_interval_seconds
+        )
+
+    async def flush(self) -> None:
+        # Забираем буфер и считаем контрольную точку до первого await: воркеры
+        # продолжают дописывать результаты, пока идёт запись
+        rows, self._pending = self._pending, []
+        if self._in_flight:
+            checkpoint = min(self._in_flight) - 1
+        else:
+            checkpoint = self._last_dispatched_id
+        self._flushed_at = time.monotonic()
+
+        if rows:
+            await self.session.execute(
+                insert_ignore_conflicts(self.session, BroadcastDelivery), rows
+            )
+        result = await self.session.execute(
+            update(ScheduledBroadcast)
+            .where(
+                ScheduledBroadcast.id == self.broadcast.id,
+                ScheduledBroadcast.claimed_by == self.owner,
+            )
+            .values(checkpoint_user_id=checkpoint, heartbeat_at=datetime.now(timezone.utc))
+            .execution_options(synchronize_session=False)
+        )
+        await self.session.commit()
+        if result.rowcount:
+            set_committed_value(self.broadcast, "checkpoint_user_id", checkpoint)
+        else:
+            self.mark_lost()
+
+    def mark_lost(self) -> None:
+        if not self.lost:
+            logger.warning(
+                f"Рассылку {self.broadcast.id} перехватил другой процесс, отправка останавливается"
+            )
+        self.lost = True
+
+    async def keep_alive(self, bind: Any) -> None:
+        """
+        Обновляет heartbeat рассылки по таймеру, пока идёт отправка.
+
+        Работает в отдельной сессии: основная занята генератором получателей, а
+        heartbeat должен обновляться и пока воркеры ждут слоты, паузы после 429 или
+        дорабатывают очередь. Обновление условное (claimed_by), поэтому перехват
+        рассылки другим процессом здесь же и обнаруживается.
+        """
+        interval = settings.broadcast_heartbeat_interval_seconds
+        async with AsyncSession(bind=bind, expire_on_commit=False) as session:
+            while not self.lost:
+                await asyncio.sleep(interval)
+                try:
+                    result = await session.execute(
+                        update(ScheduledBroadcast)
+                        .where(
+                            ScheduledBroadcast.id == self.broadcast.id,
+                            ScheduledBroadcast.claimed_by == self.owner,
+                        )
+                        .values(heartbeat_at=datetime.now(timezone.utc))
+                        .execution_options(synchronize_session=False)
+                    )
+                    await session.commit()
+                except Exception as exc:
+                    await session.rollback()
+                    logger.warning(
+                        f"Не удалось обновить heartbeat рассылки {self.broadcast.id}: {exc}"
+                    )
+                    continue
+                if not result.rowcount:
+                    self.mark_lost()
+
+    async def totals(self) -> tuple[int, int]:
+        """Возвращает (отправлено, ошибок) по всему журналу рассылки"""
+        stmt = (
+            select(BroadcastDelivery.status, func.count())
+            .where(BroadcastDelivery.broadcast_id == self.broadcast.id)
+            .group_by(BroadcastDelivery.status)
+        )
+        result = await self.session.execute(stmt)
+        counts = dict(result.all())
+        return counts.get(DeliveryStatus.SENT, 0), counts.get(DeliveryStatus.FAILED, 0)
+
+
 class BroadcastService:
     def __init__(self, session: AsyncSession) -> None:
         self.session = session
@@ -120,6 +255,8 @@ class BroadcastService:
             scheduled_at=scheduled_at,
             status=BroadcastStatus(payload.status or "draft"),
             buttons=payload.buttons or {},
+            messages_per_second=payload.messages_per_second,
+            concurrency=payload.concurrency,
         )
         self.session.add(broadcast)
         await self.session.commit()
@@ -180,6 +317,10 @@ class BroadcastService:
             broadcast.status = BroadcastStatus(payload.status)
         if payload.buttons is not None:
             broadcast.buttons = payload.buttons
+        if payload.messages_per_second is not None:
+            broadcast.messages_per_second = payload.messages_per_second
+        if payload.concurrency is not None:
+            broadcast.concurrency = payload.concurrency
 
         await self.session.commit()
         await self.session.refresh(broadcast)
@@ -198,63 +339,11 @@ class BroadcastService:
         self, broadcast: ScheduledBroadcast
     ) -> int:
         """Подсчитывает количество получателей рассылки"""
-        # Начинаем с базового запроса пользователей
-        base_query = select(User.id).where(User.bot_id == broadcast.bot_id)
-
-        # Фильтр по дню рождения
-        if broadcast.birthday_only:
-            today = date.today()
-            base_query = base_query.where(
-                func.date_part("month", User.birthday) == today.month,
-                func.date_part("day", User.birthday) == today.day,
-            )
-
-        # Фильтр по статусу подписки
-        if broadcast.target_audience == BroadcastAudience.ALL:
-            pass  # Без фильтра
-        elif broadcast.target_audience == BroadcastAudience.SUBSCRIBERS:
-            base_query = base_query.join(Subscription, User.id == Subscription.user_id).where(
-                Subscription.is_active == True
-            )
-        elif broadcast.target_audience == BroadcastAudience.ACTIVE_SUBSCRIBERS:
-            now = datetime.now(timezone.utc)
-            base_query = base_query.join(Subscription, User.id == Subscription.user_id).where(
-                Subscription.is_active == True, Subscription.expires_at > now
-            )
-        elif broadcast.target_audience == BroadcastAudience.EXPIRED_SUBSCRIBERS:
-            now = datetime.now(timezone.utc)
-            base_query = base_query.join(Subscription, User.id == Subscription.user_id).where(
-                Subscription.is_active == False, Subscription.expires_at < now
-            )
-        elif broadcast.target_audience == BroadcastAudience.EXPIRING_SOON:
-            now = datetime.now(timezone.utc)
-            three_days_later = now + timedelta(days=3)
-            base_query = base_query.join(Subscription, User.id == Subscription.user_id).where(
-                Subscription.is_active == True,
-                Subscription.expires_at > now,
-                Subscription.expires_at <= three_days_later,
-            )
-        elif broadcast.target_audience == BroadcastAudience.NON_SUBSCRIBERS:
-            base_query = base_query.outerjoin(Subscription, User.id == Subscription.user_id).where(
-                Subscription.id == None
-            )
-        elif broadcast.target_audience == BroadcastAudience.BIRTHDAY:
-            today = date.today()
-            base_query = base_query.where(
-                func.date_part("month", User.birthday) == today.month,
-                func.date_part("day", User.birthday) == today.day,
-            )
-        elif broadcast.target_audience == BroadcastAudience.CUSTOM:
-            if broadcast.user_ids:
-                base_query = base_query.where(User.id.in_(broadcast.user_ids))
-            else:
-                return 0
-
-        # Исключаем заблокированных пользователей
-        base_query = base_query.where(User.is_blocked == False)
+        conditions = self._recipient_conditions(broadcast)
+        if conditions is None:
+            return 0
 
-        # Подсчитываем количество уникальных пользователей
-        count_stmt = select(func.count()).select_from(base_query.distinct().subquery())
+        count_stmt = select(func.count(User.id)).where(*conditions)
         result = await self.session.execute(count_stmt)
         return result.scalar_one() or 0
 
@@ -275,11 +364,18 @@ class BroadcastService:
         if broadcast.status == BroadcastStatus.COMPLETED:
             raise ValueError("Рассылка уже была отправлена")
 
-        # Получаем список получателей (только если не указан канал)
-        recipients = []
+        # Рассылка в статусе SENDING продолжается с контрольной точки, если её
+        # отправка была прервана (heartbeat давно не обновлялся). Окончательно
+        # это решает атомарный захват ниже, здесь - только быстрый отказ
+        resuming = broadcast.status == BroadcastStatus.SENDING
+        if resuming and not self.is_stale(broadcast):
+            raise ValueError("Рассылка уже отправляется")
+
+        # Проверяем наличие получателей (только если не указан канал)
+        recipients_count = 0
         if not broadcast.channel_id:
-            recipients = await self._get_recipients(broadcast)
-            if not recipients:
+            recipients_count = await self.get_recipients_count(broadcast)
+            if not recipients_count:
                 raise ValueError("Нет получателей для рассылки")
         else:
             # Если указан канал, проверяем, что канал существует
@@ -288,23 +384,11 @@ class BroadcastService:
                 raise ValueError(f"Канал с ID {broadcast.channel_id} не найден")
             logger.info(f"Рассылка будет отправлена в канал {channel.channel_name} (ID: {channel.id})")
 
-        # Получаем токен бота
-        bot = await self.session.get(Bot, broadcast.bot_id)
-        if not bot or not bot.telegram_bot_token_encrypted:
+        # Получаем токен бота (из кэша общего клиента Telegram)
+        token = await telegram_gateway.get_bot_token(self.session, broadcast.bot_id)
+        if not token:
             raise ValueError("Токен бота не настроен")
 
-        try:
-            encrypted_str = (
-                bot.telegram_bot_token_encrypted.decode()
-                if isinstance(bot.telegram_bot_token_encrypted, bytes)
-                else bot.telegram_bot_token_encrypted
-            )
-            token = decrypt_secret(encrypted_str)
-            if not token:
-                raise ValueError("Не удалось расшифровать токен бота")
-        except Exception as exc:
-            raise ValueError(f"Ошибка при расшифровке токена: {exc}") from exc
-
         # Формируем текст сообщения
         message_text = broadcast.message_text
         if broadcast.message_title:
@@ -315,216 +399,155 @@ class BroadcastService:
         if broadcast.parse_mode and broadcast.parse_mode != ParseMode.NONE:
             parse_mode = broadcast.parse_mode.value.lower()
 
-        # Обновляем статус на "отправляется"
-        broadcast.status = BroadcastStatus.SENDING
-        broadcast.scheduled_at = datetime.now(timezone.utc)
-        await self.session.commit()
+        # Закрепляем рассылку за этим процессом и переводим в статус "отправляется"
+        owner = await self.claim(broadcast, resuming)
+        if resuming:
+            logger.info(
+                f"Возобновление рассылки {broadcast.id} с контрольной точки "
+                f"users.id > {broadcast.checkpoint_user_id}"
+            )
 
-        # Отправляем сообщения
-        url = f"https://api.telegram.org/bot{token}/sendMessage"
+        # Текст и вложения рассылки; файлы загружаются один раз и дальше идут по file_id
+        content = BroadcastContent(broadcast.bot_id, message_text, parse_mode, broadcast.media_files)
         
         sent_count = 0
         failed_count = 0
         errors = []
+        delivery_stats: dict[str, Any] = {}
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Если указан канал, отправляем сообщение в канал
-            if broadcast.channel_id:
-                channel = await self.session.get(Channel, broadcast.channel_id)
-                if not channel:
-                    raise ValueError(f"Канал с ID {broadcast.channel_id} не найден")
-                
-                logger.info(f"Отправка в канал: id={channel.id}, channel_id={channel.channel_id}, username={channel.channel_username}")
-                
-                # Определяем chat_id для Telegram API
-                # Приоритет: 1) channel_username (если есть), 2) channel_id (если это числовой ID)
-                if channel.channel_username:
-                    chat_id = channel.channel_username
-                    if not chat_id.startswith("@"):
-                        chat_id = f"@{chat_id}"
-                    logger.info(f"Используется username для канала: {chat_id}")
-                else:
-                    # Используем channel_id - для Telegram API каналов это должен быть числовой ID
-                    # Пробуем преобразовать в int, если это число (Telegram API принимает и строку, и число)
-                    try:
-                        # Пробуем преобразовать в число для проверки формата
-                        chat_id_int = int(channel.channel_id)
-                        # Telegram API принимает числовой ID как строку или число
-                        # Используем строку для совместимости
-                        chat_id = str(chat_id_int)
-                        logger.info(f"Используется числовой channel_id для канала: {chat_id}")
-                    except ValueError:
-                        # Если не число, используем как есть (может быть username без @)
-                        chat_id = channel.channel_id
-                        logger.warning(f"channel_id не является числом, используется как строка: {chat_id}")
-                    
-                    channel_payload = {
-                        "chat_id": chat_id,
-                        "text": message_text,
-                    }
-                    if parse_mode:
-                        channel_payload["parse_mode"] = parse_mode
-                    
-                    # Если есть медиа файлы, отправляем их в канал
-                    if broadcast.media_files:
-                        first_media = broadcast.media_files[0]
-                        if first_media.get("type") == "photo" and first_media.get("file_id"):
-                            photo_url = f"https://api.telegram.org/bot{token}/sendPhoto"
-                            photo_payload = {
-                                "chat_id": chat_id,
-                                "photo": first_media["file_id"],
-                                "caption": message_text,
-                            }
-                            if parse_mode:
-                                photo_payload["parse_mode"] = parse_mode
-                            try:
-                                response = await client.post(photo_url, json=photo_payload)
-                                response.raise_for_status()
-                                sent_count += 1
-                                logger.info(f"Сообщение отправлено в канал {channel.channel_id}")
-                            except httpx.HTTPStatusError as exc:
-                                error_detail = exc.response.text if exc.response else str(exc)
-                                try:
-                                    error_json = exc.response.json() if exc.response else {}
-                                    error_description = error_json.get("description", error_detail)
-                                    error_code = error_json.get("error_code", "unknown")
-                                except Exception:
-                                    error_description = error_detail
-                                    error_code = "unknown"
-                                
-                                full_error = f"Channel {chat_id}: HTTP {exc.response.status_code if exc.response else 'unknown'} - {error_description} (code: {error_code})"
-                                errors.append(full_error)
-                                failed_count += 1
-                                logger.error(f"Ошибка отправки фото в канал {chat_id}: {full_error}")
-                                logger.error(f"Payload был: {photo_payload}")
-                                # Если это ошибка "chat not found" или "bot is not a member", выбрасываем исключение
-                                if "chat not found" in error_description.lower() or "not a member" in error_description.lower():
-                                    raise ValueError(f"Бот не является участником канала {chat_id} или канал не найден: {error_description}")
-                            except Exception as e:
-                                errors.append(f"Channel {chat_id}: {str(e)}")
-                                failed_count += 1
-                                logger.error(f"Ошибка отправки в канал {chat_id}: {e}")
-                        else:
-                            # Для других типов медиа отправляем обычное сообщение
-                            try:
-                                response = await client.post(url, json=channel_payload)
-                                response.raise_for_status()
-                                sent_count += 1
-                                logger.info(f"Сообщение отправлено в канал {chat_id}")
-                            except httpx.HTTPStatusError as exc:
-                                error_detail = exc.response.text if exc.response else str(exc)
-                                try:
-                                    error_json = exc.response.json() if exc.response else {}
-                                    error_description = error_json.get("description", error_detail)
-                                    error_code = error_json.get("error_code", "unknown")
-                                except Exception:
-                                    error_description = error_detail
-                                    error_code = "unknown"
-                                
-                                full_error = f"Channel {chat_id}: HTTP {exc.response.status_code if exc.response else 'unknown'} - {error_description} (code: {error_code})"
-                                errors.append(full_error)
-                                failed_count += 1
-                                logger.error(f"Ошибка отправки медиа в канал {chat_id}: {full_error}")
-                                logger.error(f"Payload был: {channel_payload}")
-                                # Если это ошибка "chat not found" или "bot is not a member", выбрасываем исключение
-                                if "chat not found" in error_description.lower() or "not a member" in error_description.lower():
-                                    raise ValueError(f"Бот не является участником канала {chat_id} или канал не найден: {error_description}")
-                            except Exception as e:
-                                errors.append(f"Channel {chat_id}: {str(e)}")
-                                failed_count += 1
-                                logger.error(f"Ошибка отправки в канал {chat_id}: {e}")
-                    else:
-                        # Отправляем текстовое сообщение в канал
-                        try:
-                            response = await client.post(url, json=channel_payload)
-                            response.raise_for_status()
-                            sent_count += 1
-                            logger.info(f"Сообщение отправлено в канал {chat_id}")
-                        except httpx.HTTPStatusError as exc:
-                            error_detail = exc.response.text if exc.response else str(exc)
-                            try:
-                                error_json = exc.response.json() if exc.response else {}
-                                error_description = error_json.get("description", error_detail)
-                                error_code = error_json.get("error_code", "unknown")
-                            except Exception:
-                                error_description = error_detail
-                                error_code = "unknown"
-                            
-                            full_error = f"Channel {chat_id}: HTTP {exc.response.status_code if exc.response else 'unknown'} - {error_description} (code: {error_code})"
-                            errors.append(full_error)
-                            failed_count += 1
-                            logger.error(f"Ошибка отправки в канал {chat_id}: {full_error}")
-                            logger.error(f"Payload был: {channel_payload}")
-                            # Если это ошибка "chat not found" или "bot is not a member", выбрасываем исключение
-                            if "chat not found" in error_description.lower() or "not a member" in error_description.lower():
-                                raise ValueError(f"Бот не является участником канала {chat_id} или канал не найден: {error_description}")
-                        except Exception as e:
-                            errors.append(f"Channel {chat_id}: {str(e)}")
-                            failed_count += 1
-                            logger.error(f"Ошибка отправки в канал {chat_id}: {e}")
-
-            # Отправляем сообщения пользователям
-            for idx, user in enumerate(recipients):
-                # Добавляем небольшую задержку между отправками (30 сообщений в секунду - лимит Telegram)
-                if idx > 0 and idx % 30 == 0:
-                    await asyncio.sleep(1)
-
-                payload = {
-                    "chat_id": user.telegram_id,
-                    "text": message_text,
-                }
-                if parse_mode:
-                    payload["parse_mode"] = parse_mode
-
-                # Если есть медиа файлы, отправляем их
-                if broadcast.media_files:
-                    # Для первой фотографии используем sendPhoto с caption
-                    first_media = broadcast.media_files[0]
-                    if first_media.get("type") == "photo" and first_media.get("file_id"):
-                        photo_url = f"https://api.telegram.org/bot{token}/sendPhoto"
-                        photo_payload = {
-                            "chat_id": user.telegram_id,
-                            "photo": first_media["file_id"],
-                            "caption": message_text,
-                        }
-                        if parse_mode:
-                            photo_payload["parse_mode"] = parse_mode
-                        try:
-                            response = await client.post(photo_url, json=photo_payload)
-                            response.raise_for_status()
-                            sent_count += 1
-                            continue
-                        except Exception as e:
-                            errors.append(f"User {user.telegram_id}: {str(e)}")
-                            failed_count += 1
-                            continue
-
+        client = telegram_gateway.client
+        # Если указан канал, отправляем сообщение в канал
+        if broadcast.channel_id:
+            channel = await self.session.get(Channel, broadcast.channel_id)
+            if not channel:
+                raise ValueError(f"Канал с ID {broadcast.channel_id} не найден")
+            
+            logger.info(f"Отправка в канал: id={channel.id}, channel_id={channel.channel_id}, username={channel.channel_username}")
+            
+            # Определяем chat_id для Telegram API
+            # Приоритет: 1) channel_username (если есть), 2) channel_id (если это числовой ID)
+            if channel.channel_username:
+                chat_id = channel.channel_username
+                if not chat_id.startswith("@"):
+                    chat_id = f"@{chat_id}"
+                logger.info(f"Используется username для канала: {chat_id}")
+            else:
+                # Используем channel_id - для Telegram API каналов это должен быть числовой ID
+                # Пробуем преобразовать в int, если это число (Telegram API принимает и строку, и число)
+                try:
+                    # Пробуем преобразовать в число для проверки формата
+                    chat_id_int = int(channel.channel_id)
+                    # Telegram API принимает числовой ID как строку или число
+                    # Используем строку для совместимости
+                    chat_id = str(chat_id_int)
+                    logger.info(f"Используется числовой channel_id для канала: {chat_id}")
+                except ValueError:
+                    # Если не число, используем как есть (может быть username без @)
+                    chat_id = channel.channel_id
+                    logger.warning(f"channel_id не является числом, используется как строка: {chat_id}")
+            
+            # Текст и вложения уходят одним вызовом; загруженные файлы
+            # запоминаются и дальше отправляются пользователям по file_id
+            channel_job = content.build_job(chat_id)
+            try:
+                response = await telegram_gateway.call(
+                    token, channel_job.method, channel_job.payload
+                )
+                response.raise_for_status()
+                sent_count += 1
+                logger.info(f"Сообщение отправлено в канал {chat_id}")
+                if content.needs_upload and content.remember_uploads(response.json()):
+                    broadcast.media_files = content.media_files
+            except httpx.HTTPStatusError as exc:
+                error_detail = exc.response.text if exc.response else str(exc)
                 try:
-                    response = await client.post(url, json=payload)
-                    response.raise_for_status()
-                    sent_count += 1
-                except httpx.HTTPStatusError as exc:
-                    if exc.response.status_code == 403:
-                        # Пользователь заблокировал бота - это нормально
-                        failed_count += 1
-                    else:
-                        errors.append(f"User {user.telegram_id}: HTTP {exc.response.status_code}")
-                        failed_count += 1
-                except Exception as e:
-                    errors.append(f"User {user.telegram_id}: {str(e)}")
-                    failed_count += 1
-
-        # Обновляем статус и статистику
-        broadcast.status = BroadcastStatus.COMPLETED
-        broadcast.sent_at = datetime.now(timezone.utc)
-        total_recipients = len(recipients) + (1 if broadcast.channel_id else 0)
-        broadcast.stats = {
+                    error_json = exc.response.json() if exc.response else {}
+                    error_description = error_json.get("description", error_detail)
+                    error_code = error_json.get("error_code", "unknown")
+                except Exception:
+                    error_description = error_detail
+                    error_code = "unknown"
+                
+                full_error = f"Channel {chat_id}: HTTP {exc.response.status_code if exc.response else 'unknown'} - {error_description} (code: {error_code})"
+                errors.append(full_error)
+                failed_count += 1
+                logger.error(f"Ошибка отправки ({channel_job.method}) в канал {chat_id}: {full_error}")
+                logger.error(f"Payload был: {channel_job.payload}")
+                # Если это ошибка "chat not found" или "bot is not a member", выбрасываем исключение
+                if "chat not found" in error_description.lower() or "not a member" in error_description.lower():
+                    raise ValueError(f"Бот не является участником канала {chat_id} или канал не найден: {error_description}")
+            except Exception as e:
+                errors.append(f"Channel {chat_id}: {str(e)}")
+                failed_count += 1
+                logger.error(f"Ошибка отправки в канал {chat_id}: {e}")
+
+        # Отправляем сообщения пользователям пулом воркеров с общим лимитом скорости
+        if recipients_count:
+            throughput = ThroughputSettings.resolve(
+                messages_per_second=broadcast.messages_per_second,
+                concurrency=broadcast.concurrency,
+            )
+            engine = BroadcastDeliveryEngine(client, token, throughput)
+            ledger = _DeliveryLedger(self.session, broadcast, owner)
+            keep_alive = asyncio.create_task(ledger.keep_alive(self.session.bind))
+            try:
+                report = await engine.deliver(
+                    self._iter_delivery_jobs(broadcast, content, token, ledger),
+                    on_result=ledger.record,
+                )
+            finally:
+                keep_alive.cancel()
+            await ledger.flush()
+            if ledger.lost:
+                raise ValueError("Рассылку продолжает другой процесс")
+            errors.extend(report.errors)
+            delivery_stats = {
+                "messages_per_second": round(report.messages_per_second, 2),
+                "final_rate": round(report.final_rate, 2),
+                "throttled": report.throttled,
+                "requeued": report.requeued,
+                "throttled_seconds": round(report.throttled_seconds, 2),
+            }
+
+            # Итог считаем по журналу, чтобы учесть и отправки до перезапуска
+            delivered, undelivered = await ledger.totals()
+            sent_count += delivered
+            failed_count += undelivered
+
+        # Обновляем статус и статистику, если рассылка всё ещё за этим процессом
+        total_recipients = sent_count + failed_count
+        stats = {
             "sent": sent_count,
             "failed": failed_count,
             "total": total_recipients,
             "errors": errors[:10],  # Сохраняем только первые 10 ошибок
+            **delivery_stats,
         }
+        result = await self.session.execute(
+            update(ScheduledBroadcast)
+            .where(
+                ScheduledBroadcast.id == broadcast.id,
+                ScheduledBroadcast.claimed_by == owner,
+            )
+            .values(
+                status=BroadcastStatus.COMPLETED,
+                sent_at=datetime.now(timezone.utc),
+                stats=stats,
+                claimed_by=None,
+            )
+            .returning(ScheduledBroadcast.id)
+            .execution_options(synchronize_session=False)
+        )
+        completed = result.scalar_one_or_none() is not None
         await self.session.commit()
+        if not completed:
+            raise ValueError("Рассылку продолжает другой процесс")
+        for key, value in (
+            ("status", BroadcastStatus.COMPLETED),
+            ("stats", stats),
+            ("claimed_by", None),
+        ):
+            set_committed_value(broadcast, key, value)
 
         return {
             "sent": sent_count,
@@ -532,64 +555,214 @@ class BroadcastService:
             "total": total_recipients,
         }
 
-    async def _get_recipients(self, broadcast: ScheduledBroadcast) -> list[User]:
-        """Получает список получателей рассылки"""
-        stmt = select(User).where(User.bot_id == broadcast.bot_id)
+    async def claim(self, broadcast: ScheduledBroadcast, resuming: bool) -> str:
+        """
+        Атомарно закрепляет рассылку за этим процессом и возвращает метку владельца.
+
+        Захват - условный UPDATE: рассылка должна быть не в статусе SENDING либо с
+        устаревшим (или пустым) heartbeat. Из двух процессов, одновременно решивших
+        возобновить рассылку, строку обновит только один.
+        """
+        now = datetime.now(timezone.utc)
+        stale_before = now - timedelta(seconds=settings.broadcast_stale_after_seconds)
+        owner = uuid.uuid4().hex
+        values: dict[str, Any] = {
+            "status": BroadcastStatus.SENDING,
+            "heartbeat_at": now,
+            "claimed_by": owner,
+        }
+        if not resuming:
+            values.update(scheduled_at=now, checkpoint_user_id=None)
+        result = await self.session.execute(
+            update(ScheduledBroadcast)
+            .where(
+                ScheduledBroadcast.id == broadcast.id,
+                ScheduledBroadcast.status != BroadcastStatus.COMPLETED,
+                or_(
+                    ScheduledBroadcast.status != BroadcastStatus.SENDING,
+                    ScheduledBroadcast.heartbeat_at.is_(None),
+                    ScheduledBroadcast.heartbeat_at < stale_before,
+                ),
+            )
+            .values(**values)
+            .returning(ScheduledBroadcast.id)
+            .execution_options(synchronize_session=False)
+        )
+        claimed = result.scalar_one_or_none() is not None
+        await self.session.commit()
+        if not claimed:
+            raise ValueError("Рассылка уже отправляется")
+        # Переносим значения в объект без пометки об изменении, чтобы следующий
+        # commit основной сессии не перезаписал heartbeat из keep_alive
+        for key, value in values.items():
+            set_committed_value(broadcast, key, value)
+        return owner
+
+    @staticmethod
+    def is_stale(broadcast: ScheduledBroadcast, now: datetime | None = None) -> bool:
+        """
+        Прервана ли отправка рассылки (heartbeat не обновлялся дольше допустимого).
+
+        Рассылка без heartbeat считается прерванной: его нет только у рассылок,
+        начатых до появления контрольных точек.
+        """
+        if broadcast.heartbeat_at is None:
+            return True
+        now = now or datetime.now(timezone.utc)
+        stale_after = timedelta(seconds=settings.broadcast_stale_after_seconds)
+        heartbeat_at = broadcast.heartbeat_at
+        if heartbeat_at.tzinfo is None:
+            heartbeat_at = heartbeat_at.replace(tzinfo=timezone.utc)
+        return now - heartbeat_at > stale_after
+
+    async def _upload_media(
+        self,
+        broadcast: ScheduledBroadcast,
+        content: BroadcastContent,
+        token: str,
+        job: DeliveryJob,
+        ledger: _DeliveryLedger,
+    ) -> None:
+        """
+        Отправляет сообщение с загрузкой файлов одному получателю и запоминает
+        полученные file_id, чтобы остальным получателям отправлять ссылки.
+        """
+        job.attempts += 1
+        error: str | None = None
+        try:
+            response = await telegram_gateway.call(token, job.method, job.payload)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as exc:
+            # 403 - пользователь заблокировал бота, загрузка повторится на следующем
+            error = "" if exc.response.status_code == 403 else f"User {job.chat_id}: HTTP {exc.response.status_code}"
+        except Exception as exc:
+            error = f"User {job.chat_id}: {exc}"
+        else:
+            if content.remember_uploads(response.json()):
+                broadcast.media_files = content.media_files
+        ledger.record(job, error)
+
+    async def _iter_delivery_jobs(
+        self,
+        broadcast: ScheduledBroadcast,
+        content: BroadcastContent,
+        token: str,
+        ledger: _DeliveryLedger,
+    ) -> AsyncIterator[DeliveryJob]:
+        async for batch in self._iter_recipient_batches(broadcast):
+            for user_id, telegram_id in batch:
+                if ledger.lost:
+                    return
+                job = content.build_job(telegram_id)
+                job.recipient_id = user_id
+                ledger.dispatch(user_id)
+                if content.needs_upload:
+                    # Пока файлы не загружены, отправляем по одному, без пула воркеров
+                    await self._upload_media(broadcast, content, token, job, ledger)
+                else:
+                    yield job
+                # Сессию использует только этот генератор, поэтому сбрасываем журнал здесь
+                if ledger.should_flush():
+                    await ledger.flush()
+
+    async def _iter_recipient_batches(
+        self,
+        broadcast: ScheduledBroadcast,
+        batch_size: int | None = None,
+    ) -> AsyncIterator[Sequence[Row[tuple[int, int]]]]:
+        """
+        Отдаёт получателей рассылки пачками (id, telegram_id).
+
+        Используется keyset-пагинация по users.id, поэтому ORM-объекты не создаются,
+        а память не зависит от размера аудитории. Выборка начинается после
+        контрольной точки и пропускает получателей, уже записанных в журнал доставки.
+        """
+        conditions = self._recipient_conditions(broadcast)
+        if conditions is None:
+            return
+
+        last_id = broadcast.checkpoint_user_id or 0
+        if broadcast.checkpoint_user_id is not None:
+            conditions.append(
+                ~select(BroadcastDelivery.user_id)
+                .where(
+                    BroadcastDelivery.broadcast_id == broadcast.id,
+                    BroadcastDelivery.user_id == User.id,
+                )
+                .exists()
+            )
+
+        batch_size = batch_size or settings.broadcast_recipients_batch_size
+        while True:
+            stmt = (
+                select(User.id, User.telegram_id)
+                .where(*conditions, User.id > last_id)
+                .order_by(User.id)
+                .limit(batch_size)
+            )
+            result = await self.session.execute(stmt)
+            batch = result.all()
+            if not batch:
+                return
+            yield batch
+            if len(batch) < batch_size:
+                return
+            last_id = batch[-1].id
+
+    def _recipient_conditions(
+        self, broadcast: ScheduledBroadcast
+    ) -> list[ColumnElement[bool]] | None:
+        """
+        Условия отбора получателей рассылки.
+
+        Общие для подсчёта и для выборки, чтобы они не расходились. Фильтры по
+        подпискам построены на EXISTS, поэтому пользователи не дублируются и DISTINCT
+        не нужен. Возвращает None, если получателей заведомо нет.
+        """
+        conditions: list[ColumnElement[bool]] = [User.bot_id == broadcast.bot_id]
 
         # Фильтр по дню рождения
-        if broadcast.birthday_only:
+        if broadcast.birthday_only or broadcast.target_audience == BroadcastAudience.BIRTHDAY:
             today = date.today()
-            stmt = stmt.where(
-                func.date_part("month", User.birthday) == today.month,
-                func.date_part("day", User.birthday) == today.day,
-            )
+            conditions.append(func.date_part("month", User.birthday) == today.month)
+            conditions.append(func.date_part("day", User.birthday) == today.day)
 
         # Фильтр по статусу подписки
-        if broadcast.target_audience == BroadcastAudience.ALL:
-            pass  # Без фильтра
-        elif broadcast.target_audience == BroadcastAudience.SUBSCRIBERS:
-            stmt = stmt.join(Subscription, User.id == Subscription.user_id).where(
-                Subscription.is_active == True
-            )
+        now = datetime.now(timezone.utc)
+        user_subscriptions = select(Subscription.id).where(Subscription.user_id == User.id)
+        if broadcast.target_audience == BroadcastAudience.SUBSCRIBERS:
+            conditions.append(user_subscriptions.where(Subscription.is_active == True).exists())
         elif broadcast.target_audience == BroadcastAudience.ACTIVE_SUBSCRIBERS:
-            now = datetime.now(timezone.utc)
-            stmt = stmt.join(Subscription, User.id == Subscription.user_id).where(
-                Subscription.is_active == True, Subscription.expires_at > now
+            conditions.append(
+                user_subscriptions.where(
+                    Subscription.is_active == True, Subscription.expires_at > now
+                ).exists()
             )
         elif broadcast.target_audience == BroadcastAudience.EXPIRED_SUBSCRIBERS:
-            now = datetime.now(timezone.utc)
-            stmt = stmt.join(Subscription, User.id == Subscription.user_id).where(
-                Subscription.is_active == False, Subscription.expires_at < now
+            conditions.append(
+                user_subscriptions.where(
+                    Subscription.is_active == False, Subscription.expires_at < now
+                ).exists()
             )
         elif broadcast.target_audience == BroadcastAudience.EXPIRING_SOON:
-            now = datetime.now(timezone.utc)
             three_days_later = now + timedelta(days=3)
-            stmt = stmt.join(Subscription, User.id == Subscription.user_id).where(
-                Subscription.is_active == True,
-                Subscription.expires_at > now,
-                Subscription.expires_at <= three_days_later,
+            conditions.append(
+                user_subscriptions.where(
+                    Subscription.is_active == True,
+                    Subscription.expires_at > now,
+                    Subscription.expires_at <= three_days_later,
+                ).exists()
             )
         elif broadcast.target_audience == BroadcastAudience.NON_SUBSCRIBERS:
-            stmt = stmt.outerjoin(Subscription, User.id == Subscription.user_id).where(
-                Subscription.id == None
-            )
-        elif broadcast.target_audience == BroadcastAudience.BIRTHDAY:
-            today = date.today()
-            stmt = stmt.where(
-                func.date_part("month", User.birthday) == today.month,
-                func.date_part("day", User.birthday) == today.day,
-            )
+            conditions.append(~user_subscriptions.exists())
         elif broadcast.target_audience == BroadcastAudience.CUSTOM:
-            if broadcast.user_ids:
-                stmt = stmt.where(User.id.in_(broadcast.user_ids))
-            else:
-                return []
+            if not broadcast.user_ids:
+                return None
+            conditions.append(User.id.in_(broadcast.user_ids))
 
         # Исключаем заблокированных пользователей
-        stmt = stmt.where(User.is_blocked == False).distinct()
-
-        result = await self.session.execute(stmt)
-        return list(result.scalars().unique().all())
+        conditions.append(User.is_blocked == False)
+        return conditions
 
     def _to_broadcast_read(self, broadcast: ScheduledBroadcast) -> BroadcastRead:
         return BroadcastRead(
@@ -608,6 +781,8 @@ class BroadcastService:
             status=broadcast.status.value,
             stats=broadcast.stats or {},
             buttons=broadcast.buttons or {},
+            messages_per_second=broadcast.messages_per_second,
+            concurrency=broadcast.concurrency,
             created_at=broadcast.created_at,
             updated_at=broadcast.updated_at,
         )
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import logging
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.cache_invalidation import CacheInvalidation, CacheScope
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class CacheInvalidationPage:
+    cursor: int
+    reset: bool = False
+    events: list[CacheInvalidation] = field(default_factory=list)
+
+
+class CacheInvalidationService:
+    """
+    Журнал инвалидаций кэша бота (таблица `cache_invalidations`).
+
+    `publish` пишет события в текущую транзакцию вызывающего кода, поэтому бот
+    увидит инвалидацию ровно тогда, когда станут видны сами изменения, и не
+    увидит её, если транзакция откатится.
+    """
+
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def publish(
+        self, scope: CacheScope, keys: Iterable[int | str] | None = None
+    ) -> None:
+        """
+        Добавляет инвалидацию области `scope`: по ключам `keys` или целиком, если ключи не заданы.
+        Изменения фиксирует вызывающий код.
+        """
+        if keys is None:
+            rows = [{"scope": scope, "key": None}]
+        else:
+            rows = [{"scope": scope, "key": str(key)} for key in dict.fromkeys(keys)]
+            if not rows:
+                return
+        await self.session.execute(insert(CacheInvalidation), rows)
+
+    async def list_since(
+        self, after: int | None, limit: int, lookback: timedelta | None = None
+    ) -> CacheInvalidationPage:
+        """
+        События с `id > after` по возрастанию.
+
+        id выдаются при вставке, а видны события после коммита, поэтому
+        транзакция, зафиксированная позже соседней, может появиться в журнале
+        уже за курсором. Такие события ловит `lookback`: перед новыми событиями
+        повторно отдаются события с `id <= after`, созданные за последние
+        `lookback`. Клиент отбрасывает уже примененные по `id`; курсор
+        продвигают только новые события.
+
+        Без `after` возвращает только текущий курсор: у нового клиента кэш пуст,
+        и прошлые события ему не нужны. `reset=True` означает, что часть событий
+        после `after` уже удалена из журнала и клиенту нужно сбросить кэш целиком.
+        """
+        if after is None:
+            latest = await self.session.scalar(select(func.max(CacheInvalidation.id)))
+            return CacheInvalidationPage(cursor=latest or 0)
+
+        oldest = await self.session.scalar(select(func.min(CacheInvalidation.id)))
+        if oldest is not None and after < oldest - 1:
+            latest = await self.session.scalar(select(func.max(CacheInvalidation.id)))
+            return CacheInvalidationPage(cursor=latest or after, reset=True)
+
+        result = await self.session.execute(
+            select(CacheInvalidation)
+            .where(CacheInvalidation.id > after)
+            .order_by(CacheInvalidation.id)
+            .limit(limit)
+        )
+        events = list(result.scalars())
+        cursor = events[-1].id if events else after
+
+        if lookback:
+            threshold = datetime.now(timezone.utc) - lookback
+            recent = await self.session.execute(
+                select(CacheInvalidation)
+                .where(CacheInvalidation.id <= after, CacheInvalidation.created_at >= threshold)
+                .order_by(CacheInvalidation.id)
+                .limit(limit)
+            )
+            events = list(recent.scalars()) + events
+        return CacheInvalidationPage(cursor=cursor, events=events)
+
+    async def prune(self, older_than: timedelta) -> int:
+        """Удаляет события старше `older_than`. Возвращает число удаленных строк."""
+        threshold = datetime.now(timezone.utc) - older_than
+        result = await self.session.execute(
+            delete(CacheInvalidation)
+            .where(CacheInvalidation.created_at < threshold)
+            .execution_options(synchronize_session=False)
+        )
+        await self.session.commit()
+        return result.rowcount or 0
@@ -7,9 +7,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from ..models.bot import Bot
+from ..models.cache_invalidation import CacheScope
 from ..models.channel import Channel
 from ..models.subscription_plan import SubscriptionPlan
 from ..schemas.channel import ChannelCreate, ChannelRead, ChannelUpdate
+from .cache_invalidation import CacheInvalidationService
 
 logger = logging.getLogger(__name__)
 
@@ -102,6 +104,7 @@ class ChannelService:
         data = payload.model_dump()
         channel = Channel(**data)
         self.session.add(channel)
+        await self._invalidate_bot_cache()
         await self.session.commit()
         await self.session.refresh(channel)
         logger.info(
@@ -123,6 +126,7 @@ class ChannelService:
         for field, value in data.items():
             setattr(channel, field, value)
         self.session.add(channel)
+        await self._invalidate_bot_cache()
         await self.session.commit()
         await self.session.refresh(channel)
         return ChannelRead.model_validate(channel)
@@ -132,6 +136,7 @@ class ChannelService:
         channel_name = channel.channel_name
         bot_id = channel.bot_id
         await self.session.delete(channel)
+        await self._invalidate_bot_cache()
         await self.session.commit()
         logger.info(
             "Удалён канал",
@@ -151,3 +156,9 @@ class ChannelService:
         if bot is None:
             raise ValueError("В системе отсутствуют боты. Создайте бота перед добавлением каналов.")
         return bot.id
+
+    async def _invalidate_bot_cache(self) -> None:
+        # Каналы входят и в список каналов бота, и в ответ о статусе подписки
+        invalidations = CacheInvalidationService(self.session)
+        await invalidations.publish(CacheScope.CHANNELS)
+        await invalidations.publish(CacheScope.STATUS)
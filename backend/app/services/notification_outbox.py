@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import logging
+from collections.abc import Sequence
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db.upsert import insert_ignore_conflicts
+from ..models.subscription_notification import (
+    NotificationKind,
+    NotificationStatus,
+    SubscriptionNotification,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationOutbox:
+    """
+    Захват уведомлений о подписках через таблицу `subscription_notifications`.
+
+    Уведомление отправляет только тот, кто вставил его строку: `claim` одним
+    INSERT ... ON CONFLICT DO NOTHING RETURNING захватывает всю пачку, и строки,
+    уже захваченные другим запуском или репликой, просто не возвращаются.
+    Неудачные отправки освобождаются (строка удаляется) и повторятся в следующий
+    запуск; захват, оборвавшийся падением процесса, не повторяется — лучше не
+    отправить напоминание, чем отправить его дважды.
+    """
+
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def claim(
+        self, rows: Sequence[dict[str, Any]]
+    ) -> dict[tuple[int, NotificationKind], int]:
+        """
+        Захватывает уведомления `rows` (user_id, subscription_id, kind, expires_at).
+
+        Returns:
+            Словарь {(subscription_id, kind): id строки outbox} только для захваченных строк
+        """
+        if not rows:
+            return {}
+        stmt = (
+            insert_ignore_conflicts(self.session, SubscriptionNotification)
+            .values([{**row, "status": NotificationStatus.PENDING} for row in rows])
+            .returning(
+                SubscriptionNotification.id,
+                SubscriptionNotification.subscription_id,
+                SubscriptionNotification.kind,
+            )
+        )
+        result = await self.session.execute(stmt)
+        claimed = {(row.subscription_id, row.kind): row.id for row in result}
+        # Фиксируем захват сразу, чтобы не держать блокировки на время отправки
+        await self.session.commit()
+        if len(claimed) < len(rows):
+            logger.debug("Пропущено %d уже отправленных уведомлений", len(rows) - len(claimed))
+        return claimed
+
+    async def mark_sent(self, ids: Sequence[int]) -> None:
+        if not ids:
+            return
+        await self.session.execute(
+            update(SubscriptionNotification)
+            .where(SubscriptionNotification.id.in_(ids))
+            .values(status=NotificationStatus.SENT, sent_at=datetime.now(timezone.utc))
+            .execution_options(synchronize_session=False)
+        )
+
+    async def release(self, ids: Sequence[int]) -> None:
+        """Освобождает захват неотправленных уведомлений, чтобы повторить их позже."""
+        if not ids:
+            return
+        await self.session.execute(
+            delete(SubscriptionNotification)
+            .where(SubscriptionNotification.id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
@@ -1,27 +1,256 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
 import logging
+from collections import deque
+from dataclasses import dataclass
 
 import httpx
 
 from ..core.config import settings
+from ..integrations.telegram import telegram_gateway
 
 logger = logging.getLogger("lumenpay.notifications")
 
+# Виды уведомлений: однотипные события за окно сводятся в одно сообщение
+KIND_MESSAGE = "message"
+KIND_REGISTRATION = "registration"
+KIND_PAYMENT_CREATED = "payment_created"
+KIND_PAYMENT_SUCCEEDED = "payment_succeeded"
+KIND_PAYMENT_CANCELED = "payment_canceled"
+KIND_SUBSCRIPTION_CANCELED = "subscription_canceled"
 
-async def send_admin_message(text: str) -> None:
+_DIGEST_TITLES = {
+    KIND_MESSAGE: "Уведомления",
+    KIND_REGISTRATION: "Новые регистрации",
+    KIND_PAYMENT_CREATED: "Созданы счета",
+    KIND_PAYMENT_SUCCEEDED: "Подтверждены оплаты",
+    KIND_PAYMENT_CANCELED: "Отменены оплаты",
+    KIND_SUBSCRIPTION_CANCELED: "Отмены подписок",
+}
+
+# Ограничение Telegram на длину текста сообщения
+_MAX_MESSAGE_LENGTH = 4096
+
+
+@dataclass(slots=True)
+class _Notice:
+    kind: str
+    text: str
+
+
+def _admin_chat_configured() -> bool:
     if not settings.backup_send_to_telegram:
-        return
+        return False
     if not settings.telegram_bot_token or not settings.backup_admin_chat_id:
         logger.debug("Админский чат или токен не настроены, уведомление пропущено")
-        return
+        return False
+    return True
+
+
+class AdminNotificationOutbox:
+    """
+    Очередь уведомлений в админский чат.
 
-    token = settings.telegram_bot_token.get_secret_value()
-    chat_id = settings.backup_admin_chat_id
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
+    `send_admin_message` только ставит уведомление в очередь и не ждет Telegram.
+    Единственная фоновая задача забирает уведомления, копит их
+    `coalesce_window` секунд и отправляет однотипные одним сводным сообщением
+    через общий `telegram_gateway` (постоянный пул соединений). При
+    переполнении очереди `overflow` решает, что делать: `drop_oldest` вытесняет
+    самые старые уведомления, `drop_new` отбрасывает новое, `block` ждет места
+    не дольше `block_timeout` и затем отбрасывает новое. О потерянных
+    уведомлениях сообщается в следующей отправке.
 
-    async with httpx.AsyncClient(timeout=30) as client:
+    Пока очередь не запущена (скрипты, тесты), уведомления отправляются сразу.
+    """
+
+    def __init__(
+        self,
+        *,
+        queue_size: int,
+        coalesce_window: float,
+        overflow: str = "drop_oldest",
+        block_timeout: float = 1.0,
+        digest_max_lines: int = 20,
+    ) -> None:
+        self._queue_size = max(1, queue_size)
+        self._coalesce_window = coalesce_window
+        self._overflow = overflow
+        self._block_timeout = block_timeout
+        self._digest_max_lines = max(1, digest_max_lines)
+        self._queue: deque[_Notice] = deque()
+        self._has_items = asyncio.Event()
+        self._has_room = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        # Собранные, но еще не отрисованные уведомления и готовые к отправке сообщения
+        self._collecting: list[_Notice] = []
+        self._outgoing: deque[str] = deque()
+        self._dropped_unreported = 0
+        self.enqueued_total = 0
+        self.dropped_total = 0
+        self.sent_total = 0
+        self.failed_total = 0
+        self.coalesced_total = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        if self.running:
+            return
+        # События пересоздаются: прежние могли быть привязаны к другому циклу событий
+        self._has_items = asyncio.Event()
+        self._has_room = asyncio.Event()
+        self._has_room.set()
+        self._task = asyncio.create_task(self._run(), name="admin-notifications")
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Останавливает отправителя и дослает накопленное не дольше `timeout` секунд."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        pending = self._collecting + list(self._queue)
+        self._collecting = []
+        self._queue.clear()
+        self._outgoing.extend(self._render(pending))
         try:
-            await client.post(url, json={"chat_id": chat_id, "text": text})
+            await asyncio.wait_for(self._flush(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Не успели отправить %d уведомлений администратору при остановке",
+                len(self._outgoing),
+            )
+        self._outgoing.clear()
+
+    async def enqueue(self, text: str, kind: str = KIND_MESSAGE) -> bool:
+        """Ставит уведомление в очередь; False, если оно отброшено."""
+        if not _admin_chat_configured():
+            return False
+        if not self.running:
+            await self._send(text)
+            return True
+
+        if len(self._queue) >= self._queue_size:
+            if self._overflow == "drop_oldest":
+                self._queue.popleft()
+                self._record_drop()
+            elif self._overflow == "block":
+                with contextlib.suppress(asyncio.TimeoutError):
+                    while len(self._queue) >= self._queue_size:
+                        self._has_room.clear()
+                        await asyncio.wait_for(self._has_room.wait(), self._block_timeout)
+            if len(self._queue) >= self._queue_size:
+                self._record_drop()
+                return False
+
+        self._queue.append(_Notice(kind, text))
+        self.enqueued_total += 1
+        self._has_items.set()
+        return True
+
+    def metrics(self) -> dict[str, int]:
+        return {
+            "queued": len(self._queue),
+            "enqueued_total": self.enqueued_total,
+            "dropped_total": self.dropped_total,
+            "sent_total": self.sent_total,
+            "failed_total": self.failed_total,
+            "coalesced_total": self.coalesced_total,
+        }
+
+    def _record_drop(self) -> None:
+        self.dropped_total += 1
+        self._dropped_unreported += 1
+
+    def _take(self) -> None:
+        self._collecting.extend(self._queue)
+        self._queue.clear()
+        self._has_items.clear()
+        self._has_room.set()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._has_items.wait()
+            self._take()
+            deadline = loop.time() + self._coalesce_window
+            while (remaining := deadline - loop.time()) > 0:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._has_items.wait(), remaining)
+                self._take()
+            notices, self._collecting = self._collecting, []
+            self._outgoing.extend(self._render(notices))
+            await self._flush()
+
+    def _render(self, notices: list[_Notice]) -> list[str]:
+        messages: list[str] = []
+        if self._dropped_unreported:
+            messages.append(
+                f"⚠️ Очередь уведомлений переполнена, пропущено: {self._dropped_unreported}"
+            )
+            self._dropped_unreported = 0
+
+        by_kind: dict[str, list[str]] = {}
+        for notice in notices:
+            by_kind.setdefault(notice.kind, []).append(notice.text)
+        for kind, texts in by_kind.items():
+            if len(texts) == 1:
+                messages.append(texts[0])
+                continue
+            self.coalesced_total += len(texts)
+            lines = [f"{_DIGEST_TITLES.get(kind, _DIGEST_TITLES[KIND_MESSAGE])}: {len(texts)}"]
+            lines.extend(f"• {text}" for text in texts[: self._digest_max_lines])
+            if len(texts) > self._digest_max_lines:
+                lines.append(f"… и еще {len(texts) - self._digest_max_lines}")
+            digest = "\n".join(lines)
+            if len(digest) > _MAX_MESSAGE_LENGTH:
+                digest = digest[: _MAX_MESSAGE_LENGTH - 1] + "…"
+            messages.append(digest)
+        return messages
+
+    async def _flush(self) -> None:
+        # Сообщение снимается с очереди до отправки: если остановка прервет
+        # отправку, оно не уйдет повторно при досылке
+        while self._outgoing:
+            await self._send(self._outgoing.popleft())
+
+    async def _send(self, text: str) -> None:
+        if not _admin_chat_configured():
+            return
+        if settings.telegram_bot_token is None:
+            return
+        token = settings.telegram_bot_token.get_secret_value()
+        payload = {"chat_id": settings.backup_admin_chat_id, "text": text}
+        try:
+            response = await telegram_gateway.call(token, "sendMessage", payload)
         except httpx.HTTPError as exc:  # pragma: no cover - внешние ошибки
+            self.failed_total += 1
             logger.warning("Не удалось отправить уведомление администратору: %s", exc)
+            return
+        if response.is_success:
+            self.sent_total += 1
+        else:
+            self.failed_total += 1
+            logger.warning(
+                "Telegram отклонил уведомление администратору: %s %s",
+                response.status_code,
+                response.text[:200],
+            )
+
+
+admin_notifications = AdminNotificationOutbox(
+    queue_size=settings.admin_notify_queue_size,
+    coalesce_window=settings.admin_notify_coalesce_seconds,
+    overflow=settings.admin_notify_overflow,
+    block_timeout=settings.admin_notify_block_timeout_seconds,
+    digest_max_lines=settings.admin_notify_digest_max_lines,
+)
+
+
+async def send_admin_message(text: str, kind: str = KIND_MESSAGE) -> None:
+    """Ставит уведомление администратору в очередь, не дожидаясь отправки."""
+    await admin_notifications.enqueue(text, kind)
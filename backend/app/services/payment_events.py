@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import logging
+from collections.abc import Sequence
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.config import settings
+from ..db.upsert import insert_ignore_conflicts
+from ..models.payment import PaymentProvider
+from ..models.payment_event import PaymentEvent, PaymentEventStatus
+from .payments import PaymentService
+
+logger = logging.getLogger(__name__)
+
+# Пауза между попытками растет вдвое, но не дольше часа
+_MAX_RETRY_DELAY = timedelta(hours=1)
+
+
+class PaymentEventService:
+    """Сохранение уведомлений провайдеров и их обработка по одному."""
+
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def record_yookassa_event(self, payload: dict[str, Any]) -> bool:
+        """
+        Сохраняет уведомление YooKassa. Возвращает False для повторной доставки
+        уже сохраненного события и для уведомления без id платежа.
+        """
+        event = str(payload.get("event") or "")
+        external_id = (payload.get("object") or {}).get("id")
+        if not external_id:
+            logger.warning("YooKassa notification without payment id: %s", payload)
+            return False
+        result = await self.session.execute(
+            insert_ignore_conflicts(self.session, PaymentEvent)
+            .values(
+                provider=PaymentProvider.YOOKASSA,
+                idempotency_key=f"{event}:{external_id}",
+                event=event,
+                external_id=str(external_id),
+                payload=payload,
+                status=PaymentEventStatus.PENDING,
+                attempts=0,
+            )
+            .returning(PaymentEvent.id)
+        )
+        inserted = result.scalar_one_or_none() is not None
+        await self.session.commit()
+        if not inserted:
+            logger.info("Повторное уведомление YooKassa %s:%s отброшено", event, external_id)
+        return inserted
+
+    async def claim(self, limit: int) -> list[tuple[int, str]]:
+        """
+        Захватывает до `limit` готовых к обработке событий (статус PROCESSING) и
+        возвращает их (id, external_id) по возрастанию id. События, брошенные
+        упавшим процессом, захватываются снова через `payment_event_stale_seconds`.
+        """
+        now = datetime.now(timezone.utc)
+        stale_before = now - timedelta(seconds=settings.payment_event_stale_seconds)
+        candidates = (
+            select(PaymentEvent.id)
+            .where(
+                or_(
+                    and_(
+                        PaymentEvent.status == PaymentEventStatus.PENDING,
+                        PaymentEvent.available_at <= now,
+                    ),
+                    and_(
+                        PaymentEvent.status == PaymentEventStatus.PROCESSING,
+                        PaymentEvent.locked_at < stale_before,
+                    ),
+                )
+            )
+            .order_by(PaymentEvent.id)
+            .limit(limit)
+            # Реплики забирают разные события, не дожидаясь друг друга (PostgreSQL)
+            .with_for_update(skip_locked=True)
+        )
+        result = await self.session.execute(
+            update(PaymentEvent)
+            .where(PaymentEvent.id.in_(candidates.scalar_subquery()))
+            .values(status=PaymentEventStatus.PROCESSING, locked_at=now)
+            .returning(PaymentEvent.id, PaymentEvent.external_id)
+            .execution_options(synchronize_session=False)
+        )
+        claimed = sorted((row.id, row.external_id) for row in result)
+        await self.session.commit()
+        return claimed
+
+    async def release(self, ids: Sequence[int]) -> None:
+        """Возвращает захваченные, но не обработанные события в очередь."""
+        if not ids:
+            return
+        await self.session.execute(
+            update(PaymentEvent)
+            .where(
+                PaymentEvent.id.in_(ids),
+                PaymentEvent.status == PaymentEventStatus.PROCESSING,
+            )
+            .values(status=PaymentEventStatus.PENDING, locked_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        await self.session.commit()
+
+    async def process(self, event_id: int) -> None:
+        """
+        Обрабатывает захваченное событие. Отметка об обработке фиксируется в той же
+        транзакции, что и изменения платежа, поэтому событие применяется один раз.
+
+        Уведомление может прийти раньше, чем платеж создан локально, поэтому
+        событие для неизвестного платежа не отбрасывается, а повторяется с паузой,
+        как при ошибке, и после `payment_event_max_attempts` попыток остается в
+        статусе FAILED с причиной в `last_error`.
+        """
+        # Статус меняется UPDATE-ами в обход сессии, поэтому перечитываем строку
+        event = await self.session.get(PaymentEvent, event_id, populate_existing=True)
+        if event is None or event.status != PaymentEventStatus.PROCESSING:
+            return
+        payload = event.payload
+        attempts = event.attempts + 1
+        event.status = PaymentEventStatus.PROCESSED
+        event.attempts = attempts
+        event.processed_at = datetime.now(timezone.utc)
+        event.last_error = None
+        try:
+            payment, _ = await PaymentService(self.session).handle_yookassa_notification(payload)
+            if payment is None:
+                raise LookupError(f"платеж {event.external_id} не найден")
+            await self.session.commit()
+        except Exception as exc:
+            await self.session.rollback()
+            await self._mark_failed(event_id, attempts, exc)
+            raise
+
+    async def _mark_failed(self, event_id: int, attempts: int, exc: Exception) -> None:
+        exhausted = attempts >= settings.payment_event_max_attempts
+        delay = min(
+            timedelta(seconds=settings.payment_event_retry_base_seconds * 2 ** (attempts - 1)),
+            _MAX_RETRY_DELAY,
+        )
+        await self.session.execute(
+            update(PaymentEvent)
+            .where(PaymentEvent.id == event_id)
+            .values(
+                status=PaymentEventStatus.FAILED if exhausted else PaymentEventStatus.PENDING,
+                attempts=attempts,
+                last_error=f"{type(exc).__name__}: {exc}"[:2000],
+                available_at=datetime.now(timezone.utc) + delay,
+                locked_at=None,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await self.session.commit()
+        if exhausted:
+            logger.error(
+                "Уведомление YooKassa %s не обработано за %d попыток: %s", event_id, attempts, exc
+            )
+
+    async def prune(self, older_than: timedelta) -> int:
+        """Удаляет обработанные события старше `older_than`."""
+        cutoff = datetime.now(timezone.utc) - older_than
+        result = await self.session.execute(
+            delete(PaymentEvent)
+            .where(
+                PaymentEvent.status == PaymentEventStatus.PROCESSED,
+                PaymentEvent.processed_at < cutoff,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await self.session.commit()
+        return result.rowcount or 0
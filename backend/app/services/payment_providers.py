@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import time
+from dataclasses import dataclass
 
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
+from ..core.config import settings
 from ..core.crypto import decrypt_secret, encrypt_secret
 from ..models.payment import PaymentProvider
 from ..models.payment_provider_credential import PaymentProviderCredential
@@ -12,34 +16,108 @@ from ..models.payment_provider_credential import PaymentProviderCredential
 logger = logging.getLogger(__name__)
 
 
-class PaymentProviderSettingsService:
-    def __init__(self, session: AsyncSession) -> None:
-        self.session = session
-        self._schema_initialized = False
+@dataclass(frozen=True, slots=True)
+class _CachedCredentials:
+    shop_id: str | None
+    api_key: str | None
+    loaded_at: float
+
+
+class YooKassaCredentialsCache:
+    """
+    Расшифрованные учетные данные YooKassa в памяти процесса.
+
+    `upsert_yookassa_settings` сбрасывает кэш своего процесса и увеличивает
+    версию: загрузка, начатая до сброса, свой результат в кэш не кладет.
+    Изменения, сделанные другими процессами, подхватываются через
+    `yookassa_credentials_cache_ttl_seconds` или раньше — по запросу с `max_age`.
+    """
+
+    def __init__(self) -> None:
+        self._entry: _CachedCredentials | None = None
+        self._version = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self) -> None:
+        self._version += 1
+        self._entry = None
+
+    def _fresh(self, max_age: float) -> _CachedCredentials | None:
+        entry = self._entry
+        if entry is not None and time.monotonic() - entry.loaded_at < max_age:
+            return entry
+        return None
+
+    async def get(
+        self, session: AsyncSession, max_age: float | None = None
+    ) -> _CachedCredentials:
+        if max_age is None:
+            max_age = settings.yookassa_credentials_cache_ttl_seconds
+        entry = self._fresh(max_age)
+        if entry is not None:
+            return entry
+        async with self._lock:
+            # Пока ждали блокировку, данные мог загрузить другой запрос
+            entry = self._fresh(max_age)
+            if entry is not None:
+                return entry
+            version = self._version
+            record = await _select_credentials(session, PaymentProvider.YOOKASSA)
+            api_key = (
+                decrypt_secret(record.api_key_encrypted)
+                if record is not None and record.api_key_encrypted
+                else None
+            )
+            entry = _CachedCredentials(
+                shop_id=record.shop_id if record is not None else None,
+                api_key=api_key,
+                loaded_at=time.monotonic(),
+            )
+            if version == self._version:
+                self._entry = entry
+            return entry
 
-    async def _ensure_schema(self) -> None:
-        if self._schema_initialized:
-            return
 
-        def _create_table(sync_connection) -> None:  # pragma: no cover
-            bind = getattr(sync_connection, "get_bind", None)
-            engine = bind() if callable(bind) else sync_connection
-            PaymentProviderCredential.__table__.create(bind=engine, checkfirst=True)
+yookassa_credentials_cache = YooKassaCredentialsCache()
 
-        await self.session.run_sync(_create_table)
-        self._schema_initialized = True
+
+async def _select_credentials(
+    session: AsyncSession, provider: PaymentProvider
+) -> PaymentProviderCredential | None:
+    stmt = (
+        select(PaymentProviderCredential)
+        .where(PaymentProviderCredential.provider == provider)
+        .limit(1)
+    )
+    result = await session.execute(stmt)
+    return result.scalar_one_or_none()
+
+
+async def ensure_payment_provider_schema(engine: AsyncEngine) -> None:
+    """
+    Создает таблицу учетных данных провайдеров, если ее нет (база без миграций).
+    Вызывается один раз при старте приложения, а не в обработке запросов.
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            lambda sync_conn: PaymentProviderCredential.__table__.create(
+                bind=sync_conn, checkfirst=True
+            )
+        )
+
+
+class PaymentProviderSettingsService:
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
 
     async def _get_by_provider(
         self, provider: PaymentProvider
     ) -> PaymentProviderCredential | None:
-        await self._ensure_schema()
-        stmt = (
-            select(PaymentProviderCredential)
-            .where(PaymentProviderCredential.provider == provider)
-            .limit(1)
-        )
-        result = await self.session.execute(stmt)
-        return result.scalar_one_or_none()
+        return await _select_credentials(self.session, provider)
 
     async def get_yookassa_settings(self) -> tuple[str | None, bool]:
         record = await self._get_by_provider(PaymentProvider.YOOKASSA)
@@ -47,14 +125,15 @@ class PaymentProviderSettingsService:
             return None, False
         return record.shop_id, bool(record.api_key_encrypted)
 
-    async def get_yookassa_credentials(self) -> tuple[str, str]:
-        record = await self._get_by_provider(PaymentProvider.YOOKASSA)
-        if record is None or not record.api_key_encrypted:
+    async def get_yookassa_credentials(self, max_age: float | None = None) -> tuple[str, str]:
+        """
+        Shop ID и ключ API из кэша процесса; `max_age` ограничивает возраст
+        кэшированного значения (по умолчанию — TTL кэша).
+        """
+        credentials = await yookassa_credentials_cache.get(self.session, max_age)
+        if credentials.shop_id is None or credentials.api_key is None:
             raise RuntimeError("Настройки YooKassa не сконфигурированы")
-        api_key = decrypt_secret(record.api_key_encrypted)
-        if api_key is None:
-            raise RuntimeError("Не удалось расшифровать ключ YooKassa")
-        return record.shop_id, api_key
+        return credentials.shop_id, credentials.api_key
 
     async def upsert_yookassa_settings(
         self, *, shop_id: str, api_key: str | None
@@ -73,6 +152,7 @@ class PaymentProviderSettingsService:
                 record.api_key_encrypted = encrypt_secret(api_key)
         self.session.add(record)
         await self.session.commit()
+        yookassa_credentials_cache.invalidate()
         await self.session.refresh(record)
         logger.info(
             "Обновлены настройки YooKassa",
@@ -1,25 +1,50 @@
 from __future__ import annotations
 
+import asyncio
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 import logging
+from typing import Any
 
-from sqlalchemy import Select, select
+from sqlalchemy import Select, and_, false, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload, selectinload
 
+from ..core.config import settings
 from ..integrations.yookassa import YooKassaClient
+from ..models.cache_invalidation import CacheScope
 from ..models.payment import Payment, PaymentProvider, PaymentStatus
+from ..models.promo_code import PromoCode
 from ..models.subscription import Subscription
 from ..models.subscription_plan import SubscriptionPlan
 from ..models.user import User
 from ..schemas.admin import PaymentListItem
+from .cache_invalidation import CacheInvalidationService
 from .payment_providers import PaymentProviderSettingsService
-from .notifications import send_admin_message
+from .rollups import DailyRollupService
+from .notifications import KIND_PAYMENT_CANCELED, KIND_PAYMENT_SUCCEEDED, send_admin_message
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass(slots=True)
+class ReconcileStats:
+    claimed: int = 0
+    succeeded: int = 0
+    canceled: int = 0
+    expired: int = 0
+    pending: int = 0
+    errors: int = 0
+
+
+@dataclass(slots=True)
+class CheckoutContext:
+    plan: SubscriptionPlan
+    user: User | None
+    promo_code: PromoCode | None
+
+
 class PaymentService:
     def __init__(self, session: AsyncSession) -> None:
         self.session = session
@@ -130,6 +155,55 @@ class PaymentService:
             created_at=created_at_dt,
         )
 
+    async def load_checkout(
+        self,
+        *,
+        plan_id: int,
+        telegram_id: int,
+        user_id: int | None = None,
+        bot_id: int | None = None,
+        promo_code: str | None = None,
+    ) -> CheckoutContext | None:
+        """
+        Тариф, покупатель и промокод для оформления счета одним запросом.
+
+        Покупатель ищется по `user_id`, иначе по telegram_id в боте `bot_id`
+        (без него — в боте тарифа), промокод — в боте тарифа. None, если тарифа нет.
+        """
+        if user_id is not None:
+            user_clause = User.id == user_id
+        else:
+            user_clause = and_(
+                User.telegram_id == telegram_id,
+                User.bot_id == (bot_id if bot_id is not None else SubscriptionPlan.bot_id),
+            )
+        promo_clause = (
+            and_(
+                PromoCode.bot_id == SubscriptionPlan.bot_id,
+                PromoCode.code == promo_code.upper(),
+            )
+            if promo_code
+            else false()
+        )
+        stmt = (
+            select(SubscriptionPlan, User, PromoCode)
+            .select_from(SubscriptionPlan)
+            .outerjoin(User, user_clause)
+            .outerjoin(PromoCode, promo_clause)
+            .where(SubscriptionPlan.id == plan_id)
+            .limit(1)
+        )
+        row = (await self.session.execute(stmt)).first()
+        if row is None:
+            return None
+        plan, user, promo = row
+        if user is None and user_id is not None:
+            # Устаревший user_id от бота: ищем по telegram_id, как и без него
+            return await self.load_checkout(
+                plan_id=plan_id, telegram_id=telegram_id, bot_id=bot_id, promo_code=promo_code
+            )
+        return CheckoutContext(plan=plan, user=user, promo_code=promo)
+
     async def create_invoice(
         self,
         *,
@@ -157,8 +231,8 @@ class PaymentService:
                 plan_id=plan.id if plan else None,
             )
             self.session.add(payment)
+            # id и created_at возвращаются самим INSERT (RETURNING), refresh не нужен
             await self.session.commit()
-            await self.session.refresh(payment)
             return payment
         except Exception:
             await self.session.rollback()
@@ -228,6 +302,8 @@ class PaymentService:
                 description=payment_description,
                 metadata=metadata,
                 confirmation_return_url=client.return_url,
+                # Один ключ на локальный платеж: повтор запроса не создаст второй платеж
+                idempotence_key=f"payment-{payment.id}-{int(payment.created_at.timestamp())}",
             )
             payment.external_id = remote_payment.get("id")
             confirmation = remote_payment.get("confirmation") or {}
@@ -238,7 +314,6 @@ class PaymentService:
             }
             self.session.add(payment)
             await self.session.commit()
-            await self.session.refresh(payment)
             logger.info(f"YooKassa payment created: {payment.external_id}, URL: {payment_url}")
         except RuntimeError as exc:
             logger.warning(f"YooKassa не настроена или ошибка получения credentials: {exc}")
@@ -535,178 +610,262 @@ class PaymentService:
 
         self.session.add(payment)
         await self.session.commit()
-        if subscription:
-            await self.session.refresh(subscription)
-        await self.session.refresh(payment)
 
-        # Отправляем уведомления только если статус изменился
-        if not was_already_succeeded:
-            if payment.status == PaymentStatus.SUCCEEDED:
-                amount_formatted = self.format_amount(payment.amount, payment.currency)
-                await send_admin_message(
-                    f"Оплата #{payment.id} подтверждена через YooKassa. Сумма: {amount_formatted}"
-                )
-                
-                # Отправляем уведомление пользователю об успешной оплате
-                if payment.user:
-                    try:
-                        from .user_notifications import UserNotificationService
-                        notification_service = UserNotificationService(self.session)
-                        plan_name = payment.plan.name if payment.plan else None
-                        subscription_end = subscription.expires_at if subscription else None
-                        plan_id = payment.plan.id if payment.plan else None
-                        await notification_service.send_payment_success_notification(
-                            user=payment.user,
-                            payment_id=payment.id,
-                            amount=amount_formatted,
-                            plan_name=plan_name,
-                            subscription_end=subscription_end,
-                            plan_id=plan_id,
-                        )
-                    except Exception as exc:
-                        logger.warning(
-                            "Не удалось отправить уведомление об успешной оплате через вебхук: %s",
-                            exc,
-                            extra={
-                                "payment_id": payment.id,
-                                "user_id": payment.user_id,
-                            },
-                        )
-            elif payment.status == PaymentStatus.CANCELED:
-                await send_admin_message(f"Оплата #{payment.id} отменена в YooKassa.")
+        # Изменения уже зафиксированы: сбой после коммита не должен заставить
+        # вызывающий код считать уведомление YooKassa необработанным
+        try:
+            if subscription:
+                await self.session.refresh(subscription)
+            await self.session.refresh(payment)
+            # Отправляем уведомления только если статус изменился
+            if not was_already_succeeded:
+                await self._notify_yookassa_transition(payment, subscription)
+        except Exception as exc:
+            logger.exception(
+                "Платеж %s сохранен, но уведомления о нем не отправлены: %s", payment.id, exc
+            )
 
         return payment, subscription
 
-    async def sync_pending_yookassa_payments(self, limit: int = 20) -> None:
-        # Получаем список ID платежей без блокировки (для производительности)
-        # Используем raw SQL для обхода проблемы с payment_provider
-        from sqlalchemy import text
-        stmt = text("""
-            SELECT id FROM payments 
-            WHERE (payment_provider = 'yookassa' OR payment_provider = 'YOOKASSA' OR external_id IS NOT NULL)
-              AND status = 'pending'
-              AND external_id IS NOT NULL
-            ORDER BY created_at ASC
-            LIMIT :limit
-        """)
-        result = await self.session.execute(stmt, {"limit": limit})
-        payment_ids = [row[0] for row in result.fetchall()]
-        if not payment_ids:
-            return
-
-        # Обрабатываем каждый платеж с блокировкой
-        for payment_id in payment_ids:
-            try:
-                # Блокируем строку платежа для предотвращения race conditions
-                payment_stmt = (
-                    select(Payment)
-                    .options(
-                        selectinload(Payment.user),
-                        selectinload(Payment.plan),
-                        selectinload(Payment.subscription),
+    async def _notify_yookassa_transition(
+        self, payment: Payment, subscription: Subscription | None
+    ) -> None:
+        """Уведомляет администратора и пользователя о смене статуса платежа."""
+        if payment.status == PaymentStatus.SUCCEEDED:
+            amount_formatted = self.format_amount(payment.amount, payment.currency)
+            await send_admin_message(
+                f"Оплата #{payment.id} подтверждена через YooKassa. Сумма: {amount_formatted}",
+                KIND_PAYMENT_SUCCEEDED,
+            )
+            
+            # Отправляем уведомление пользователю об успешной оплате
+            if payment.user:
+                try:
+                    from .user_notifications import UserNotificationService
+                    notification_service = UserNotificationService(self.session)
+                    plan_name = payment.plan.name if payment.plan else None
+                    subscription_end = subscription.expires_at if subscription else None
+                    plan_id = payment.plan.id if payment.plan else None
+                    await notification_service.send_payment_success_notification(
+                        user=payment.user,
+                        payment_id=payment.id,
+                        amount=amount_formatted,
+                        plan_name=plan_name,
+                        subscription_end=subscription_end,
+                        plan_id=plan_id,
                     )
-                    .where(Payment.id == payment_id)
-                    .with_for_update(skip_locked=True)  # Пропускаем уже заблокированные
-                )
-                payment_result = await self.session.execute(payment_stmt)
-                payment = payment_result.scalar_one_or_none()
-                
-                # Если платеж уже обрабатывается другим процессом или изменил статус, пропускаем
-                if payment is None or payment.status != PaymentStatus.PENDING:
-                    continue
-
-                await self._ensure_remote_payment_succeeded(payment)
-                
-                # Проверяем статус после проверки удаленного платежа
-                if payment.status == PaymentStatus.SUCCEEDED:
-                    # Проверяем, что подписка еще не создана (защита от race condition)
-                    await self.session.refresh(payment, attribute_names=["subscription"])
-                    if payment.subscription is None:
-                        subscription = await self._activate_subscription(payment)
-                        
-                        # Применяем промокод после успешной оплаты
-                        promo_code_id = payment.payload.get("promo_code", {}).get("promo_code_id") if payment.payload else None
-                        if promo_code_id:
-                            try:
-                                from .promo_codes import PromoCodeService
-                                promo_service = PromoCodeService(self.session)
-                                await promo_service.apply_promo_code(promo_code_id)
-                                logger.info(
-                                    "Промокод применён при синхронизации",
-                                    extra={
-                                        "payment_id": payment.id,
-                                        "promo_code_id": promo_code_id,
-                                    },
-                                )
-                            except Exception as exc:
-                                logger.warning(
-                                    "Не удалось применить промокод при синхронизации: %s",
-                                    exc,
-                                    extra={
-                                        "payment_id": payment.id,
-                                        "promo_code_id": promo_code_id,
-                                    },
-                                )
-                    
-                    self.session.add(payment)
-                    await self.session.commit()
-                    
-                    # Отправляем уведомление пользователю об успешной оплате
-                    if payment.user:
-                        try:
-                            from .user_notifications import UserNotificationService
-                            notification_service = UserNotificationService(self.session)
-                            amount_formatted = self.format_amount(payment.amount, payment.currency)
-                            plan_name = payment.plan.name if payment.plan else None
-                            subscription_end = payment.subscription.expires_at if payment.subscription else None
-                            plan_id = payment.plan.id if payment.plan else None
-                            await notification_service.send_payment_success_notification(
-                                user=payment.user,
-                                payment_id=payment.id,
-                                amount=amount_formatted,
-                                plan_name=plan_name,
-                                subscription_end=subscription_end,
-                                plan_id=plan_id,
-                            )
-                        except Exception as exc:
-                            logger.warning(
-                                "Не удалось отправить уведомление об успешной оплате при синхронизации: %s",
-                                exc,
-                                extra={
-                                    "payment_id": payment.id,
-                                    "user_id": payment.user_id,
-                                },
-                            )
-                    
-                    logger.info(
-                        "Платёж синхронизирован и подписка активирована",
+                except Exception as exc:
+                    logger.warning(
+                        "Не удалось отправить уведомление об успешной оплате через вебхук: %s",
+                        exc,
                         extra={
                             "payment_id": payment.id,
-                            "subscription_id": payment.subscription.id if payment.subscription else None,
+                            "user_id": payment.user_id,
                         },
                     )
-                else:
-                    # Сохраняем изменения статуса (например, CANCELED)
-                    self.session.add(payment)
-                    await self.session.commit()
-            except ValueError as exc:
-                await self.session.rollback()
-                if "не завершён" in str(exc):
-                    continue
-                logger.info(
-                    "YooKassa payment %s sync issue: %s",
-                    payment_id,
-                    exc,
+        elif payment.status == PaymentStatus.CANCELED:
+            await send_admin_message(
+                f"Оплата #{payment.id} отменена в YooKassa.", KIND_PAYMENT_CANCELED
+            )
+
+    async def sync_pending_yookassa_payments(self, limit: int = 20) -> ReconcileStats:
+        """
+        Сверяет с YooKassa пачку из `limit` ожидающих платежей.
+
+        Пачка захватывается FOR UPDATE SKIP LOCKED (реплики берут разные платежи)
+        и отмечается сдвигом `updated_at`; захват сразу фиксируется, поэтому на время
+        запросов к YooKassa блокировки не держатся, а платеж, проверенный недавно,
+        повторно не берется (`payment_reconcile_recheck_seconds`) — пачки проходят по
+        всей очереди, а не по одним и тем же платежам. Статусы запрашиваются
+        параллельно, не более `payment_reconcile_concurrency` запросов одновременно.
+        Затем платежи, все еще ожидающие оплаты, блокируются снова, и все переходы
+        фиксируются одним коммитом. Неоплаченные платежи старше
+        `yookassa_pending_ttl_hours` отменяются.
+        """
+        stats = ReconcileStats()
+        try:
+            provider_service = PaymentProviderSettingsService(self.session)
+            shop_id, api_key = await provider_service.get_yookassa_credentials()
+        except RuntimeError:
+            # YooKassa не настроена — сверять не с чем
+            return stats
+
+        now = datetime.now(timezone.utc)
+        claim_stmt = (
+            select(Payment.id, Payment.external_id)
+            .where(
+                Payment.status == PaymentStatus.PENDING,
+                Payment.external_id.is_not(None),
+                Payment.updated_at
+                <= now - timedelta(seconds=settings.payment_reconcile_recheck_seconds),
+            )
+            .order_by(Payment.updated_at, Payment.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        claimed = (await self.session.execute(claim_stmt)).all()
+        stats.claimed = len(claimed)
+        if claimed:
+            await self.session.execute(
+                update(Payment)
+                .where(Payment.id.in_([payment_id for payment_id, _external_id in claimed]))
+                .values(updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+        await self.session.commit()
+        if not claimed:
+            return stats
+
+        client = YooKassaClient(shop_id=shop_id, api_key=api_key)
+        semaphore = asyncio.Semaphore(settings.payment_reconcile_concurrency)
+
+        async def fetch(external_id: str) -> dict[str, Any] | None:
+            async with semaphore:
+                return await client.get_payment(external_id)
+
+        remote_payments = await asyncio.gather(
+            *(fetch(external_id) for _payment_id, external_id in claimed),
+            return_exceptions=True,
+        )
+        remote_by_id: dict[int, dict[str, Any] | None] = {}
+        for (payment_id, external_id), remote_payment in zip(
+            claimed, remote_payments, strict=True
+        ):
+            if isinstance(remote_payment, BaseException):
+                stats.errors += 1
+                logger.warning(
+                    "Не удалось получить платёж YooKassa %s: %s", external_id, remote_payment
                 )
                 continue
+            remote_by_id[payment_id] = remote_payment
+
+        # Пока шли запросы, платеж мог обработать вебхук: берем только ожидающие
+        stmt = (
+            select(Payment)
+            .options(
+                selectinload(Payment.user),
+                selectinload(Payment.plan),
+                selectinload(Payment.subscription),
+            )
+            .where(Payment.id.in_(list(remote_by_id)), Payment.status == PaymentStatus.PENDING)
+            .order_by(Payment.id)
+            .with_for_update(of=Payment)
+        )
+        payments = list((await self.session.execute(stmt)).scalars().all())
+
+        expire_before = now - timedelta(hours=settings.yookassa_pending_ttl_hours)
+        activated: list[tuple[Payment, Subscription | None]] = []
+        for payment in payments:
+            # После отката savepoint объект платежа истекает, id берем заранее
+            payment_id = payment.id
+            remote_payment = remote_by_id[payment_id]
+            try:
+                # Ошибка одного платежа не должна откатывать переходы всей пачки
+                async with self.session.begin_nested():
+                    outcome = await self._apply_remote_payment(
+                        payment, remote_payment, now=now, expire_before=expire_before
+                    )
             except Exception as exc:
-                await self.session.rollback()
-                logger.exception(
-                    "Ошибка при синхронизации платежа %s: %s",
-                    payment_id,
-                    exc,
-                )
+                stats.errors += 1
+                logger.exception("Ошибка при синхронизации платежа %s: %s", payment_id, exc)
                 continue
+            setattr(stats, outcome, getattr(stats, outcome) + 1)
+            if outcome == "succeeded":
+                activated.append((payment, payment.subscription))
+
+        await self.session.commit()
+
+        for payment, subscription in activated:
+            await self._notify_user_payment_succeeded(payment, subscription)
+        if stats.claimed:
+            logger.info(
+                "Сверка платежей YooKassa: проверено %d, оплачено %d, отменено %d, "
+                "просрочено %d, ожидают %d, ошибок %d",
+                stats.claimed,
+                stats.succeeded,
+                stats.canceled,
+                stats.expired,
+                stats.pending,
+                stats.errors,
+            )
+        return stats
+
+    async def _apply_remote_payment(
+        self,
+        payment: Payment,
+        remote_payment: dict[str, Any] | None,
+        *,
+        now: datetime,
+        expire_before: datetime,
+    ) -> str:
+        """Применяет статус платежа из YooKassa; возвращает имя поля `ReconcileStats`."""
+        created_at = payment.created_at
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        expired = created_at < expire_before
+
+        remote_status = (remote_payment or {}).get("status")
+        if remote_payment is not None:
+            payment.payload = {**(payment.payload or {}), "yookassa_payment": remote_payment}
+
+        if remote_status == "succeeded":
+            payment.status = PaymentStatus.SUCCEEDED
+            paid_at = self._parse_remote_datetime(
+                remote_payment.get("paid_at") or remote_payment.get("captured_at")
+            )
+            payment.paid_at = paid_at or payment.paid_at or now
+            if payment.subscription is None:
+                await self._activate_subscription(payment)
+                promo_code_id = (payment.payload.get("promo_code") or {}).get("promo_code_id")
+                if promo_code_id:
+                    # Атомарный инкремент в общей транзакции пачки (apply_promo_code коммитит сам)
+                    await self.session.execute(
+                        update(PromoCode)
+                        .where(PromoCode.id == promo_code_id)
+                        .values(used_count=PromoCode.used_count + 1)
+                    )
+            return "succeeded"
+
+        if remote_status == "canceled":
+            payment.status = PaymentStatus.CANCELED
+            return "canceled"
+
+        if expired and (remote_payment is None or remote_status in {"pending", "waiting_for_capture"}):
+            # Платеж не найден или так и не оплачен за время жизни — закрываем его
+            payment.status = PaymentStatus.CANCELED
+            payment.payload = {**(payment.payload or {}), "expired_at": now.isoformat()}
+            return "expired"
+
+        if remote_status not in {None, "pending", "waiting_for_capture"}:
+            logger.info(
+                "YooKassa payment %s sync issue: неизвестный статус %s", payment.id, remote_status
+            )
+        payment.updated_at = now
+        return "pending"
+
+    async def _notify_user_payment_succeeded(
+        self, payment: Payment, subscription: Subscription | None
+    ) -> None:
+        if payment.user is None:
+            return
+        try:
+            from .user_notifications import UserNotificationService
+
+            notification_service = UserNotificationService(self.session)
+            await notification_service.send_payment_success_notification(
+                user=payment.user,
+                payment_id=payment.id,
+                amount=self.format_amount(payment.amount, payment.currency),
+                plan_name=payment.plan.name if payment.plan else None,
+                subscription_end=subscription.expires_at if subscription else None,
+                plan_id=payment.plan.id if payment.plan else None,
+            )
+        except Exception as exc:
+            logger.warning(
+                "Не удалось отправить уведомление об успешной оплате при синхронизации: %s",
+                exc,
+                extra={"payment_id": payment.id, "user_id": payment.user_id},
+            )
 
     async def _ensure_remote_payment_succeeded(self, payment: Payment) -> None:
         if payment.payment_provider != PaymentProvider.YOOKASSA:
@@ -799,6 +958,9 @@ class PaymentService:
         if payment.subscription is not None:
             return payment.subscription
 
+        # Сводка дня на дашборде; двойной учет исключает проверка выше под блокировкой
+        await DailyRollupService(self.session).record_payment(payment)
+
         now = datetime.now(timezone.utc)
         start_point = now
         if locked_user.subscription_end:
@@ -905,6 +1067,10 @@ class PaymentService:
         locked_user.subscription_end = end_point
         locked_user.is_premium = True
         self.session.add(locked_user)
+        # Бот должен увидеть оплаченную подписку сразу, не дожидаясь истечения своего кэша
+        await CacheInvalidationService(self.session).publish(
+            CacheScope.STATUS, [locked_user.telegram_id]
+        )
         if subscription:
             payment.subscription = subscription
         return subscription
@@ -57,7 +57,11 @@ class PromoCodeService:
         promo_code = await self.get_promo_code_by_code(code, bot_id)
         if promo_code is None:
             raise ValueError("Промокод не найден")
+        return promo_code, self.check_promo_code(promo_code, plan_price)
 
+    @staticmethod
+    def check_promo_code(promo_code: PromoCode, plan_price: Decimal) -> Decimal:
+        """Проверяет уже загруженный промокод и возвращает цену после скидки."""
         if not promo_code.is_active:
             raise ValueError("Промокод неактивен")
 
@@ -74,11 +78,9 @@ class PromoCodeService:
         # Вычисляем итоговую цену
         if promo_code.discount_type == DiscountType.PERCENTAGE:
             discount_amount = plan_price * (promo_code.discount_value / Decimal("100"))
-            final_price = plan_price - discount_amount
-        else:  # FIXED
-            final_price = max(Decimal("0"), plan_price - promo_code.discount_value)
-
-        return promo_code, final_price
+            return plan_price - discount_amount
+        # FIXED
+        return max(Decimal("0"), plan_price - promo_code.discount_value)
 
     async def apply_promo_code(self, promo_code_id: int) -> None:
         """Увеличивает счётчик использования промокода."""
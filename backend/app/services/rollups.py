@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import Any
+
+from sqlalchemy import and_, case, delete, distinct, exists, func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from ..db.upsert import insert_or_increment
+from ..models.bot_daily_stats import BotDailyStats
+from ..models.payment import Payment, PaymentStatus
+from ..models.subscription import Subscription
+
+
+def utc_day(value: datetime) -> date:
+    if value.tzinfo is None:
+        return value.date()
+    return value.astimezone(timezone.utc).date()
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def _as_date(value: Any) -> date:
+    # SQLite возвращает date() строкой
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+class DailyRollupService:
+    """Поддержка таблицы `bot_daily_stats`."""
+
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    def _day_expr(self, column: Any) -> Any:
+        if self.session.get_bind().dialect.name == "postgresql":
+            return func.date(func.timezone("UTC", column))
+        return func.date(column)
+
+    async def record_payment(self, payment: Payment) -> None:
+        """
+        Учитывает успешную оплату в сводке дня оплаты. Вызывается один раз на
+        платеж, в транзакции активации подписки. Пустой `paid_at` заполняется
+        текущим временем, чтобы пересчет `rebuild` отнес оплату к тому же дню.
+        """
+        if payment.paid_at is None:
+            payment.paid_at = datetime.now(timezone.utc)
+        paid_at = payment.paid_at
+        earlier = await self.session.execute(
+            select(
+                exists().where(
+                    Payment.user_id == payment.user_id,
+                    Payment.status == PaymentStatus.SUCCEEDED,
+                    Payment.id != payment.id,
+                    or_(
+                        Payment.paid_at < paid_at,
+                        and_(Payment.paid_at == paid_at, Payment.id < payment.id),
+                    ),
+                )
+            )
+        )
+        renewal = bool(earlier.scalar())
+        stmt = insert_or_increment(
+            self.session,
+            BotDailyStats,
+            index_elements=["bot_id", "day"],
+            values={
+                "bot_id": payment.bot_id,
+                "day": utc_day(paid_at),
+                "revenue": payment.amount,
+                "payments_count": 1,
+                "new_subscriptions": 0 if renewal else 1,
+                "renewals": 1 if renewal else 0,
+                "churned": 0,
+            },
+            increments=("revenue", "payments_count", "new_subscriptions", "renewals"),
+        )
+        await self.session.execute(stmt)
+
+    async def rebuild(self, start: date, end: date) -> int:
+        """
+        Пересчитывает сводки за дни [start, end) из платежей и подписок и
+        заменяет ими прежние строки. Возвращает число записанных строк.
+
+        Оплата, подтвержденная между подсчетом и заменой, может выпасть из
+        пересчитанного дня; ее вернет следующий пересчет.
+        """
+        range_start, range_end = _day_start(start), _day_start(end)
+        rows: dict[tuple[int, date], dict[str, Any]] = {}
+
+        def row(bot_id: int, day: Any) -> dict[str, Any]:
+            key = (bot_id, _as_date(day))
+            if key not in rows:
+                rows[key] = {
+                    "bot_id": key[0],
+                    "day": key[1],
+                    "revenue": Decimal("0"),
+                    "payments_count": 0,
+                    "new_subscriptions": 0,
+                    "renewals": 0,
+                    "churned": 0,
+                }
+            return rows[key]
+
+        earlier = aliased(Payment)
+        is_first = ~exists().where(
+            earlier.user_id == Payment.user_id,
+            earlier.status == PaymentStatus.SUCCEEDED,
+            or_(
+                earlier.paid_at < Payment.paid_at,
+                and_(earlier.paid_at == Payment.paid_at, earlier.id < Payment.id),
+            ),
+        )
+        paid_day = self._day_expr(Payment.paid_at)
+        payments = await self.session.execute(
+            select(
+                Payment.bot_id,
+                paid_day,
+                func.sum(Payment.amount),
+                func.count(),
+                func.sum(case((is_first, 1), else_=0)),
+            )
+            .where(
+                Payment.status == PaymentStatus.SUCCEEDED,
+                Payment.paid_at >= range_start,
+                Payment.paid_at < range_end,
+            )
+            .group_by(Payment.bot_id, paid_day)
+        )
+        for bot_id, day, revenue, count, first in payments:
+            item = row(bot_id, day)
+            item["revenue"] = Decimal(str(revenue or 0))
+            item["payments_count"] = count
+            item["new_subscriptions"] = int(first or 0)
+            item["renewals"] = count - int(first or 0)
+
+        # Отток: срок подписки закончился, и никакая подписка пользователя не
+        # продолжается после него (продление начинается с конца прежнего срока)
+        now = datetime.now(timezone.utc)
+        following = aliased(Subscription)
+        expired_day = self._day_expr(Subscription.expires_at)
+        churn = await self.session.execute(
+            select(Subscription.bot_id, expired_day, func.count(distinct(Subscription.user_id)))
+            .where(
+                Subscription.expires_at >= range_start,
+                Subscription.expires_at < min(range_end, now),
+                ~exists().where(
+                    following.user_id == Subscription.user_id,
+                    following.started_at <= Subscription.expires_at,
+                    following.expires_at > Subscription.expires_at,
+                ),
+            )
+            .group_by(Subscription.bot_id, expired_day)
+        )
+        for bot_id, day, churned in churn:
+            row(bot_id, day)["churned"] = churned
+
+        await self.session.execute(
+            delete(BotDailyStats).where(BotDailyStats.day >= start, BotDailyStats.day < end)
+        )
+        if rows:
+            await self.session.execute(insert(BotDailyStats), list(rows.values()))
+        return len(rows)
+
+    async def is_empty(self) -> bool:
+        result = await self.session.execute(select(exists().select_from(BotDailyStats)))
+        return not result.scalar()
+
+    async def earliest_day(self) -> date | None:
+        """Первый день, за который есть оплаты или подписки."""
+        first_payment = (
+            await self.session.execute(
+                select(func.min(Payment.paid_at)).where(Payment.status == PaymentStatus.SUCCEEDED)
+            )
+        ).scalar()
+        first_subscription = (
+            await self.session.execute(select(func.min(Subscription.started_at)))
+        ).scalar()
+        candidates = [utc_day(value) for value in (first_payment, first_subscription) if value]
+        return min(candidates) if candidates else None
+
+    async def refresh(self, *, recent_days: int, chunk_days: int) -> int:
+        """
+        Пересчитывает `recent_days` закрытых дней, а при пустой таблице — всю
+        историю, включая сегодняшний день, порциями по `chunk_days` с коммитом
+        после каждой. Текущий день дальше ведет `record_payment`.
+        """
+        today = datetime.now(timezone.utc).date()
+        if await self.is_empty():
+            start = await self.earliest_day()
+            if start is None:
+                return 0
+            end = today + timedelta(days=1)
+        else:
+            start, end = today - timedelta(days=recent_days), today
+
+        written = 0
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(chunk_start + timedelta(days=max(1, chunk_days)), end)
+            written += await self.rebuild(chunk_start, chunk_end)
+            await self.session.commit()
+            chunk_start = chunk_end
+        return written
@@ -1,25 +1,34 @@
 from __future__ import annotations
 
+from collections.abc import Iterable
 from decimal import Decimal
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from ..models.cache_invalidation import CacheScope
 from ..models.channel import Channel
-from ..models.subscription_plan import SubscriptionPlan
+from ..models.subscription_plan import SubscriptionPlan, subscription_plan_channels
 from ..schemas.subscription_plan import (
     SubscriptionPlanCreate,
     SubscriptionPlanPublic,
     SubscriptionPlanRead,
     SubscriptionPlanUpdate,
 )
+from .cache_invalidation import CacheInvalidationService
 
 
 class SubscriptionPlanService:
     def __init__(self, session: AsyncSession) -> None:
         self.session = session
 
+    async def _invalidate_bot_cache(self) -> None:
+        # Тарифы определяют и список тарифов в боте, и то, какие каналы закрыты
+        invalidations = CacheInvalidationService(self.session)
+        await invalidations.publish(CacheScope.PLANS)
+        await invalidations.publish(CacheScope.CHANNELS)
+
     async def list_plans(self, *, bot_id: int | None = None) -> list[SubscriptionPlanRead]:
         stmt = select(SubscriptionPlan).options(selectinload(SubscriptionPlan.channels))
         if bot_id is not None:
@@ -79,6 +88,23 @@ class SubscriptionPlanService:
             raise ValueError("Тариф не найден")
         return plan
 
+    async def get_channels_by_plan(self, plan_ids: Iterable[int]) -> dict[int, list[Channel]]:
+        """Каналы нескольких тарифов одним запросом: {plan_id: [Channel, ...]}."""
+        plan_ids = set(plan_ids)
+        channels: dict[int, list[Channel]] = {plan_id: [] for plan_id in plan_ids}
+        if not plan_ids:
+            return channels
+        stmt = (
+            select(subscription_plan_channels.c.plan_id, Channel)
+            .join(Channel, Channel.id == subscription_plan_channels.c.channel_id)
+            .where(subscription_plan_channels.c.plan_id.in_(plan_ids))
+            .order_by(Channel.id)
+        )
+        result = await self.session.execute(stmt)
+        for plan_id, channel in result.all():
+            channels[plan_id].append(channel)
+        return channels
+
     async def create_plan(self, payload: SubscriptionPlanCreate) -> SubscriptionPlanRead:
         try:
             data = payload.model_dump(exclude={"channel_ids"})
@@ -91,6 +117,7 @@ class SubscriptionPlanService:
             await self.session.flush()
             if payload.channel_ids:
                 plan.channels = await self._load_channels(payload.channel_ids, plan.bot_id)
+            await self._invalidate_bot_cache()
             await self.session.commit()
             # Перезагружаем план с каналами через selectinload
             await self.session.refresh(plan, attribute_names=["channels"])
@@ -122,6 +149,7 @@ class SubscriptionPlanService:
         if payload.channel_ids is not None:
             plan.channels = await self._load_channels(payload.channel_ids, plan.bot_id)
         self.session.add(plan)
+        await self._invalidate_bot_cache()
         await self.session.commit()
         # Перезагружаем план с каналами через selectinload
         stmt = (
@@ -136,6 +164,7 @@ class SubscriptionPlanService:
     async def delete_plan(self, plan_id: int) -> None:
         plan = await self.get_plan(plan_id)
         await self.session.delete(plan)
+        await self._invalidate_bot_cache()
         await self.session.commit()
 
     async def _load_channels(self, channel_ids: list[int], bot_id: int) -> list[Channel]:
@@ -7,8 +7,7 @@ import httpx
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..core.crypto import decrypt_secret
-from ..models.bot import Bot
+from ..integrations.telegram import telegram_gateway
 from ..models.subscription import Subscription
 from ..models.user import User
 
@@ -44,29 +43,11 @@ class UserNotificationService:
                 return False
             bot_id = user.bot_id
 
-        bot = await self.session.get(Bot, bot_id)
-        if bot is None:
-            logger.warning("Бот с id=%s не найден", bot_id)
+        token = await telegram_gateway.get_bot_token(self.session, bot_id)
+        if not token:
             return False
 
-        # Расшифровываем токен бота
-        if not bot.telegram_bot_token_encrypted:
-            logger.warning("Токен бота %s не настроен", bot_id)
-            return False
-
-        try:
-            # telegram_bot_token_encrypted это bytes, нужно декодировать в строку перед расшифровкой
-            encrypted_str = bot.telegram_bot_token_encrypted.decode() if isinstance(bot.telegram_bot_token_encrypted, bytes) else bot.telegram_bot_token_encrypted
-            token = decrypt_secret(encrypted_str)
-            if not token:
-                logger.warning("Не удалось расшифровать токен бота %s", bot_id)
-                return False
-        except Exception as exc:
-            logger.warning("Ошибка при расшифровке токена бота %s: %s", bot_id, exc)
-            return False
-
-        # Отправляем сообщение через Telegram Bot API
-        url = f"https://api.telegram.org/bot{token}/sendMessage"
+        # Отправляем сообщение через общий клиент Telegram Bot API
         payload = {
             "chat_id": telegram_id,
             "text": text,
@@ -76,45 +57,44 @@ class UserNotificationService:
         if reply_markup:
             payload["reply_markup"] = reply_markup
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.post(url, json=payload)
-                response.raise_for_status()
-                logger.info(
-                    "Уведомление отправлено пользователю",
-                    extra={
-                        "telegram_id": telegram_id,
-                        "bot_id": bot_id,
-                    },
+        try:
+            response = await telegram_gateway.call(token, "sendMessage", payload)
+            response.raise_for_status()
+            logger.info(
+                "Уведомление отправлено пользователю",
+                extra={
+                    "telegram_id": telegram_id,
+                    "bot_id": bot_id,
+                },
+            )
+            return True
+        except httpx.HTTPStatusError as exc:
+            # Если пользователь заблокировал бота или чат не найден - это нормально
+            if exc.response.status_code == 403:
+                logger.debug(
+                    "Пользователь %s заблокировал бота или чат недоступен",
+                    telegram_id,
                 )
-                return True
-            except httpx.HTTPStatusError as exc:
-                # Если пользователь заблокировал бота или чат не найден - это нормально
-                if exc.response.status_code == 403:
-                    logger.debug(
-                        "Пользователь %s заблокировал бота или чат недоступен",
-                        telegram_id,
-                    )
-                elif exc.response.status_code == 400:
-                    logger.warning(
-                        "Ошибка при отправке уведомления пользователю %s: %s",
-                        telegram_id,
-                        exc.response.text,
-                    )
-                else:
-                    logger.warning(
-                        "HTTP ошибка при отправке уведомления пользователю %s: %s",
-                        telegram_id,
-                        exc,
-                    )
-                return False
-            except httpx.RequestError as exc:
+            elif exc.response.status_code == 400:
+                logger.warning(
+                    "Ошибка при отправке уведомления пользователю %s: %s",
+                    telegram_id,
+                    exc.response.text,
+                )
+            else:
                 logger.warning(
-                    "Ошибка сети при отправке уведомления пользователю %s: %s",
+                    "HTTP ошибка при отправке уведомления пользователю %s: %s",
                     telegram_id,
                     exc,
                 )
-                return False
+            return False
+        except httpx.RequestError as exc:
+            logger.warning(
+                "Ошибка сети при отправке уведомления пользователю %s: %s",
+                telegram_id,
+                exc,
+            )
+            return False
 
     async def send_payment_success_notification(
         self,
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import logging
+from collections.abc import Sequence
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from typing import Any
@@ -12,6 +13,7 @@ from sqlalchemy.orm import selectinload
 logger = logging.getLogger(__name__)
 
 from ..models.bot import Bot
+from ..models.cache_invalidation import CacheScope
 from ..models.payment import Payment, PaymentProvider, PaymentStatus
 from ..models.subscription import Subscription
 from ..models.subscription_plan import SubscriptionPlan
@@ -24,6 +26,7 @@ from ..schemas.admin import (
 )
 from ..schemas.bot import ChannelPublic, SubscriptionStatusResponse
 from ..schemas.subscription_plan import SubscriptionPlanPublic
+from .cache_invalidation import CacheInvalidationService
 from .channels import ChannelService
 
 
@@ -136,31 +139,73 @@ class UserService:
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
 
-    async def get_subscription_status_for_telegram(
-        self,
-        telegram_id: int,
-        *,
-        bot_id: int | None = None,
-    ) -> SubscriptionStatusResponse:
-        stmt = (
+    @staticmethod
+    def _subscription_status_query() -> Select[tuple[User]]:
+        return (
             select(User)
             .options(
                 selectinload(User.subscriptions)
                 .selectinload(Subscription.plan)
                 .selectinload(SubscriptionPlan.channels)
             )
-            .where(User.telegram_id == telegram_id)
             .order_by(User.created_at.desc())
-            .limit(1)
         )
+
+    async def get_subscription_status_for_telegram(
+        self,
+        telegram_id: int,
+        *,
+        bot_id: int | None = None,
+    ) -> SubscriptionStatusResponse:
+        stmt = self._subscription_status_query().where(User.telegram_id == telegram_id).limit(1)
         if bot_id is not None:
             stmt = stmt.where(User.bot_id == bot_id)
         result = await self.session.execute(stmt)
         user = result.scalar_one_or_none()
         if user is None:
             return SubscriptionStatusResponse(status="not_found", is_active=False)
+        return await self._build_subscription_status(user, datetime.now(timezone.utc), {})
+
+    async def get_subscription_statuses_for_telegram(
+        self,
+        telegram_ids: Sequence[int],
+        *,
+        bot_id: int | None = None,
+    ) -> dict[int, SubscriptionStatusResponse]:
+        """
+        Статусы подписок для нескольких Telegram ID одним набором запросов:
+        пользователи одним IN, подписки, тарифы и каналы — через selectinload.
+        """
+        stmt = self._subscription_status_query().where(User.telegram_id.in_(set(telegram_ids)))
+        if bot_id is not None:
+            stmt = stmt.where(User.bot_id == bot_id)
+        result = await self.session.execute(stmt)
+        # Как и для одного пользователя, берем самую свежую запись с этим Telegram ID
+        users: dict[int, User] = {}
+        for user in result.scalars().all():
+            users.setdefault(user.telegram_id, user)
 
         now = datetime.now(timezone.utc)
+        bot_channels: dict[tuple[int, bool], list[ChannelPublic]] = {}
+        statuses: dict[int, SubscriptionStatusResponse] = {}
+        for telegram_id in telegram_ids:
+            user = users.get(telegram_id)
+            if user is None:
+                statuses[telegram_id] = SubscriptionStatusResponse(status="not_found", is_active=False)
+            else:
+                statuses[telegram_id] = await self._build_subscription_status(user, now, bot_channels)
+        return statuses
+
+    async def _build_subscription_status(
+        self,
+        user: User,
+        now: datetime,
+        bot_channels: dict[tuple[int, bool], list[ChannelPublic]],
+    ) -> SubscriptionStatusResponse:
+        """
+        Собирает статус по пользователю с загруженными подписками, тарифами и каналами.
+        `bot_channels` — кэш каналов бота для пользователей без тарифа.
+        """
         latest_subscription = None
         subscription_end = None
 
@@ -191,7 +236,6 @@ class UserService:
             days_left = max(0, delta.days)
 
         plan_public: SubscriptionPlanPublic | None = None
-        channel_service = ChannelService(self.session)
         if latest_subscription and latest_subscription.plan:
             plan_model = latest_subscription.plan
             plan_channels = [
@@ -218,11 +262,14 @@ class UserService:
                 channels=[channel.model_dump() for channel in plan_channels],
             )
         else:
-            channels_raw = await channel_service.list_channels_for_bot(
-                bot_id=user.bot_id,
-                include_locked=is_active,
-            )
-            channels = [ChannelPublic(**channel) for channel in channels_raw]
+            cache_key = (user.bot_id, is_active)
+            if cache_key not in bot_channels:
+                channels_raw = await ChannelService(self.session).list_channels_for_bot(
+                    bot_id=user.bot_id,
+                    include_locked=is_active,
+                )
+                bot_channels[cache_key] = [ChannelPublic(**channel) for channel in channels_raw]
+            channels = bot_channels[cache_key]
 
         auto_renew = False
         if latest_subscription:
@@ -281,6 +328,7 @@ class UserService:
                 # для получения актуальных данных перед коммитом
                 await self.session.refresh(user, attribute_names=["subscriptions", "subscription_end", "is_premium"])
 
+            await self._invalidate_status(user.telegram_id)
             await self.session.commit()
             logger.info(
                 "Создан новый подписчик",
@@ -316,6 +364,7 @@ class UserService:
                 user.is_blocked = payload.is_blocked
 
             self._activate_latest_subscription(user)
+            await self._invalidate_status(user.telegram_id)
             await self.session.commit()
             logger.info(
                 "Обновлены данные подписчика",
@@ -350,6 +399,7 @@ class UserService:
             # ИСПРАВЛЕНИЕ: Перезагружаем пользователя после создания подписки
             await self.session.refresh(user, attribute_names=["subscriptions", "subscription_end", "is_premium"])
             
+            await self._invalidate_status(user.telegram_id)
             await self.session.commit()
             logger.info(
                 "Продлена подписка подписчика",
@@ -388,6 +438,7 @@ class UserService:
             self.session.expire_all()
             await self.session.refresh(user, attribute_names=["subscriptions", "subscription_end", "is_premium"])
             
+            await self._invalidate_status(user.telegram_id)
             await self.session.commit()
             logger.info(
                 "Продлена подписка подписчика (вариант B)",
@@ -438,6 +489,7 @@ class UserService:
             self.session.add(user)
             await self.session.flush()
             
+            await self._invalidate_status(user.telegram_id)
             await self.session.commit()
             logger.info(
                 "Продлена подписка подписчика (вариант C)",
@@ -461,6 +513,7 @@ class UserService:
             telegram_id = user.telegram_id
             bot_id = user.bot_id
             await self.session.delete(user)
+            await self._invalidate_status(telegram_id)
             await self.session.commit()
             logger.info(
                 "Удалён подписчик",
@@ -499,6 +552,7 @@ class UserService:
 
             self._activate_latest_subscription(user)
             self.session.add(user)
+            await self._invalidate_status(user.telegram_id)
             await self.session.commit()
             logger.info(
                 "Удалена подписка подписчика",
@@ -799,6 +853,9 @@ class UserService:
         user.subscription_end = user_updated.subscription_end
         user.is_premium = user_updated.is_premium
 
+    async def _invalidate_status(self, telegram_id: int) -> None:
+        await CacheInvalidationService(self.session).publish(CacheScope.STATUS, [telegram_id])
+
     async def _get_user(self, user_id: int) -> User | None:
         result = await self.session.execute(
             select(User)
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.services.broadcast_delivery import (
+    BroadcastDeliveryEngine,
+    BroadcastRateLimiter,
+    DeliveryJob,
+    ThroughputSettings,
+    TokenBucket,
+)
+
+FAKE_API_URL = "http://fake-bot-api.local"
+
+
+def _too_many_requests(retry_after: float) -> httpx.Response:
+    return httpx.Response(
+        429,
+        json={
+            "ok": False,
+            "error_code": 429,
+            "description": "Too Many Requests",
+            "parameters": {"retry_after": retry_after},
+        },
+    )
+
+
+def _jobs(count: int) -> list[DeliveryJob]:
+    return [
+        DeliveryJob(chat_id=chat_id, method="sendMessage", payload={"chat_id": chat_id})
+        for chat_id in range(1, count + 1)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate_after_burst() -> None:
+    bucket = TokenBucket(rate=20, capacity=5)
+    started_at = time.monotonic()
+    for _ in range(5):
+        await bucket.acquire()
+    assert time.monotonic() - started_at < 0.05
+
+    for _ in range(4):
+        await bucket.acquire()
+    # 4 токена сверх запаса при 20/сек — не меньше 0.2 сек.
+    assert time.monotonic() - started_at >= 0.18
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_pause_blocks_and_drops_reserve() -> None:
+    bucket = TokenBucket(rate=100, capacity=10)
+    assert bucket.pause(0.2) == pytest.approx(0.2, abs=0.01)
+    # Более короткая пауза внутри текущей ничего не добавляет
+    assert bucket.pause(0.1) == 0.0
+
+    started_at = time.monotonic()
+    await bucket.acquire()
+    assert time.monotonic() - started_at >= 0.19
+
+
+def test_token_bucket_rejects_non_positive_rate() -> None:
+    with pytest.raises(ValueError, match="rate"):
+        TokenBucket(rate=0)
+
+
+@pytest.mark.asyncio
+async def test_engine_sends_concurrently_and_counts_failures() -> None:
+    in_flight = 0
+    max_in_flight = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, max_in_flight
+        chat_id = json.loads(request.content)["chat_id"]
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if chat_id == 3:
+            return httpx.Response(403, json={"ok": False, "error_code": 403})
+        if chat_id == 5:
+            return httpx.Response(500, json={"ok": False, "error_code": 500})
+        return httpx.Response(200, json={"ok": True, "result": {"message_id": 1}})
+
+    throughput = ThroughputSettings(messages_per_second=1000, concurrency=4, per_chat_interval=0)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        engine = BroadcastDeliveryEngine(client, "TOKEN", throughput, api_url=FAKE_API_URL)
+        report = await asyncio.wait_for(engine.deliver(_jobs(10)), timeout=5)
+
+    assert report.sent == 8
+    assert report.failed == 2
+    # Заблокировавший бота пользователь не попадает в список ошибок
+    assert report.errors == ["User 5: HTTP 500"]
+    assert max_in_flight > 1
+
+
+def test_rate_limiter_aimd(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "broadcast_min_messages_per_second", 1.0)
+    monkeypatch.setattr(settings, "broadcast_additive_increase", 1.0)
+    monkeypatch.setattr(settings, "broadcast_multiplicative_decrease", 0.5)
+    limiter = BroadcastRateLimiter(
+        ThroughputSettings(messages_per_second=20, concurrency=1, per_chat_interval=0)
+    )
+
+    limiter.on_throttled(1, 0.5)
+    assert limiter.rate == pytest.approx(10)
+    # Пачка 429 в пределах одного окна retry_after снижает скорость один раз
+    limiter.on_throttled(2, 0.5)
+    limiter.on_throttled(3, 0.5)
+    assert limiter.rate == pytest.approx(10)
+
+    limiter.on_success()
+    assert limiter.rate == pytest.approx(10.1)
+    for _ in range(1000):
+        limiter.on_success()
+    assert limiter.rate == pytest.approx(20)
+
+
+def test_rate_limiter_respects_min_rate(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "broadcast_min_messages_per_second", 4.0)
+    monkeypatch.setattr(settings, "broadcast_multiplicative_decrease", 0.5)
+    limiter = BroadcastRateLimiter(
+        ThroughputSettings(messages_per_second=5, concurrency=1, per_chat_interval=0)
+    )
+    limiter.on_throttled(1, 0.0)
+    limiter.on_throttled(1, 0.0)
+    assert limiter.rate == pytest.approx(4)
+
+
+@pytest.mark.asyncio
+async def test_engine_requeues_after_retry_after(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "broadcast_max_attempts", 5)
+    attempts: dict[int, list[float]] = {}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        chat_id = json.loads(request.content)["chat_id"]
+        attempts.setdefault(chat_id, []).append(time.monotonic())
+        # Первое сообщение в чат 2 получает 429
+        if chat_id == 2 and len(attempts[chat_id]) == 1:
+            return _too_many_requests(0.3)
+        return httpx.Response(200, json={"ok": True, "result": {"message_id": 1}})
+
+    results: list[tuple[int | str, str | None]] = []
+    throughput = ThroughputSettings(messages_per_second=100, concurrency=2, per_chat_interval=0)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        engine = BroadcastDeliveryEngine(client, "TOKEN", throughput, api_url=FAKE_API_URL)
+        report = await engine.deliver(
+            _jobs(3), on_result=lambda job, error: results.append((job.chat_id, error))
+        )
+
+    assert report.sent == 3
+    assert report.failed == 0
+    assert report.throttled == 1
+    assert report.requeued == 1
+    assert report.throttled_seconds == pytest.approx(0.3, abs=0.05)
+    assert sorted(results) == [(1, None), (2, None), (3, None)]
+    first, second = attempts[2]
+    assert second - first >= 0.29
+
+
+@pytest.mark.asyncio
+async def test_engine_gives_up_after_max_attempts(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "broadcast_max_attempts", 2)
+    calls = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        return _too_many_requests(0.05)
+
+    throughput = ThroughputSettings(messages_per_second=100, concurrency=1, per_chat_interval=0)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        engine = BroadcastDeliveryEngine(client, "TOKEN", throughput, api_url=FAKE_API_URL)
+        report = await asyncio.wait_for(engine.deliver(_jobs(1)), timeout=5)
+
+    assert calls == 2
+    assert report.sent == 0
+    assert report.failed == 1
+    assert report.throttled == 2
+    assert report.requeued == 1
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+from backend.app.core.config import settings
+from backend.app.integrations.telegram import telegram_gateway
+from backend.app.models.bot import Bot
+from backend.app.models.broadcast_delivery import BroadcastDelivery, DeliveryStatus
+from backend.app.models.scheduled_broadcast import (
+    BroadcastAudience,
+    BroadcastStatus,
+    ScheduledBroadcast,
+)
+from backend.app.models.user import User
+from backend.app.services.broadcast_delivery import DeliveryJob
+from backend.app.services.broadcasts import BroadcastService, _DeliveryLedger
+
+
+async def _seed(session_factory, users: int = 5, **fields) -> tuple[int, list[int]]:
+    """Создаёт бота, пользователей и рассылку; возвращает (id рассылки, id пользователей)"""
+    async with session_factory() as session:
+        bot = Bot(name="bot", slug="bot")
+        session.add(bot)
+        await session.flush()
+        recipients = [User(bot_id=bot.id, telegram_id=1000 + n) for n in range(users)]
+        session.add_all(recipients)
+        broadcast = ScheduledBroadcast(
+            bot_id=bot.id,
+            message_text="hello",
+            target_audience=BroadcastAudience.ALL,
+            **fields,
+        )
+        session.add(broadcast)
+        await session.commit()
+        return broadcast.id, [user.id for user in recipients]
+
+
+def _job(user_id: int) -> DeliveryJob:
+    job = DeliveryJob(chat_id=1000 + user_id, method="sendMessage", payload={})
+    job.recipient_id = user_id
+    return job
+
+
+def _stale_heartbeat() -> datetime:
+    stale_after = timedelta(seconds=settings.broadcast_stale_after_seconds + 60)
+    return datetime.now(timezone.utc) - stale_after
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_stops_below_lowest_in_flight_recipient(session_factory) -> None:
+    broadcast_id, user_ids = await _seed(
+        session_factory, status=BroadcastStatus.SENDING, claimed_by="owner"
+    )
+    async with session_factory() as session:
+        broadcast = await session.get(ScheduledBroadcast, broadcast_id)
+        ledger = _DeliveryLedger(session, broadcast, "owner")
+        for user_id in user_ids:
+            ledger.dispatch(user_id)
+        # Третий получатель ещё в работе, хотя четвёртый уже ответил
+        for user_id in (user_ids[0], user_ids[1], user_ids[3]):
+            ledger.record(_job(user_id), None)
+        await ledger.flush()
+        assert broadcast.checkpoint_user_id == user_ids[1]
+
+        ledger.record(_job(user_ids[2]), None)
+        ledger.record(_job(user_ids[4]), "User 1004: HTTP 400")
+        await ledger.flush()
+        assert broadcast.checkpoint_user_id == user_ids[4]
+
+    async with session_factory() as session:
+        stored = await session.get(ScheduledBroadcast, broadcast_id)
+        assert stored.checkpoint_user_id == user_ids[4]
+        assert await _DeliveryLedger(session, stored, "owner").totals() == (4, 1)
+
+
+@pytest.mark.asyncio
+async def test_resume_skips_recipients_already_in_ledger(session_factory, monkeypatch) -> None:
+    broadcast_id, user_ids = await _seed(
+        session_factory,
+        status=BroadcastStatus.SENDING,
+        heartbeat_at=_stale_heartbeat(),
+        claimed_by="crashed",
+    )
+    # До сбоя обработаны первые двое и, вне очереди, четвёртый получатель
+    async with session_factory() as session:
+        session.add_all(
+            BroadcastDelivery(
+                broadcast_id=broadcast_id,
+                user_id=user_id,
+                telegram_id=1000 + index,
+                status=DeliveryStatus.SENT,
+            )
+            for index, user_id in enumerate(user_ids)
+            if index in (0, 1, 3)
+        )
+        broadcast = await session.get(ScheduledBroadcast, broadcast_id)
+        broadcast.checkpoint_user_id = user_ids[1]
+        await session.commit()
+
+    delivered: list[int] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        delivered.append(json.loads(request.content)["chat_id"])
+        return httpx.Response(200, json={"ok": True, "result": {"message_id": 1}})
+
+    async def bot_token(session, bot_id: int) -> str:
+        return "123:token"
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(telegram_gateway, "_client", client)
+    monkeypatch.setattr(telegram_gateway, "get_bot_token", bot_token)
+
+    async with session_factory() as session:
+        result = await BroadcastService(session).send_broadcast_now(broadcast_id)
+
+    assert sorted(delivered) == [1002, 1004]
+    assert result == {"sent": 5, "failed": 0, "total": 5}
+    async with session_factory() as session:
+        stored = await session.get(ScheduledBroadcast, broadcast_id)
+        assert stored.status == BroadcastStatus.COMPLETED
+        assert stored.claimed_by is None
+
+
+def test_is_stale_treats_missing_heartbeat_as_stale() -> None:
+    now = datetime.now(timezone.utc)
+    assert BroadcastService.is_stale(ScheduledBroadcast(heartbeat_at=None), now)
+    assert BroadcastService.is_stale(ScheduledBroadcast(heartbeat_at=_stale_heartbeat()), now)
+    assert not BroadcastService.is_stale(ScheduledBroadcast(heartbeat_at=now), now)
+
+
+@pytest.mark.asyncio
+async def test_claim_refuses_live_broadcast(session_factory) -> None:
+    broadcast_id, _ = await _seed(
+        session_factory,
+        status=BroadcastStatus.SENDING,
+        heartbeat_at=datetime.now(timezone.utc),
+        claimed_by="alive",
+    )
+    async with session_factory() as session:
+        service = BroadcastService(session)
+        broadcast = await session.get(ScheduledBroadcast, broadcast_id)
+        with pytest.raises(ValueError, match="уже отправляется"):
+            await service.send_broadcast_now(broadcast_id)
+        with pytest.raises(ValueError, match="уже отправляется"):
+            await service.claim(broadcast, resuming=True)
+
+
+@pytest.mark.asyncio
+async def test_only_one_process_claims_stale_broadcast(session_factory) -> None:
+    broadcast_id, user_ids = await _seed(
+        session_factory, status=BroadcastStatus.SENDING, heartbeat_at=None, claimed_by="crashed"
+    )
+    async with session_factory() as first, session_factory() as second:
+        # Оба процесса увидели рассылку прерванной до того, как кто-то её захватил
+        first_broadcast = await first.get(ScheduledBroadcast, broadcast_id)
+        second_broadcast = await second.get(ScheduledBroadcast, broadcast_id)
+        assert BroadcastService.is_stale(first_broadcast)
+        assert BroadcastService.is_stale(second_broadcast)
+
+        owner = await BroadcastService(first).claim(first_broadcast, resuming=True)
+        with pytest.raises(ValueError, match="уже отправляется"):
+            await BroadcastService(second).claim(second_broadcast, resuming=True)
+
+        # Если рассылку всё же перехватили, прежний владелец не пишет контрольную точку
+        ledger = _DeliveryLedger(first, first_broadcast, owner)
+        ledger.dispatch(user_ids[0])
+        ledger.record(_job(user_ids[0]), None)
+        async with session_factory() as session:
+            stored = await session.get(ScheduledBroadcast, broadcast_id)
+            stored.claimed_by = "someone-else"
+            await session.commit()
+        await ledger.flush()
+        assert ledger.lost
+
+    async with session_factory() as session:
+        stored = await session.get(ScheduledBroadcast, broadcast_id)
+        assert stored.checkpoint_user_id is None
+
+
+@pytest.mark.asyncio
+async def test_keep_alive_refreshes_heartbeat_until_ownership_is_lost(
+    session_factory, monkeypatch
+) -> None:
+    monkeypatch.setattr(settings, "broadcast_heartbeat_interval_seconds", 0.01)
+    broadcast_id, _ = await _seed(
+        session_factory,
+        status=BroadcastStatus.SENDING,
+        heartbeat_at=_stale_heartbeat(),
+        claimed_by="owner",
+    )
+    async with session_factory() as session:
+        broadcast = await session.get(ScheduledBroadcast, broadcast_id)
+        ledger = _DeliveryLedger(session, broadcast, "owner")
+        keep_alive = asyncio.create_task(ledger.keep_alive(session.bind))
+        await asyncio.sleep(0.05)
+
+        async with session_factory() as other:
+            stored = await other.scalar(
+                select(ScheduledBroadcast).where(ScheduledBroadcast.id == broadcast_id)
+            )
+            assert not BroadcastService.is_stale(stored)
+            stored.claimed_by = "someone-else"
+            await other.commit()
+
+        await asyncio.wait_for(keep_alive, timeout=1)
+        assert ledger.lost
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from backend.app.background import subscriptions
+from backend.app.models.bot import Bot
+from backend.app.models.channel import Channel
+from backend.app.models.subscription import Subscription
+from backend.app.models.subscription_notification import (
+    NotificationKind,
+    NotificationStatus,
+    SubscriptionNotification,
+)
+from backend.app.models.user import User
+from backend.app.services.notification_outbox import NotificationOutbox
+
+
+async def _seed_expiring(session_factory, users: int) -> list[int]:
+    """Создает подписки, истекающие через 3 дня; возвращает telegram_id пользователей"""
+    expires_at = datetime.now(timezone.utc) + timedelta(days=3, hours=12)
+    async with session_factory() as session:
+        bot = Bot(name="bot", slug="bot")
+        session.add(bot)
+        await session.flush()
+        channel = Channel(bot_id=bot.id, channel_id="-100", channel_name="channel")
+        session.add(channel)
+        await session.flush()
+        telegram_ids = [100 + n for n in range(users)]
+        for telegram_id in telegram_ids:
+            user = User(bot_id=bot.id, telegram_id=telegram_id, is_premium=True)
+            session.add(user)
+            await session.flush()
+            session.add(
+                Subscription(
+                    bot_id=bot.id,
+                    user_id=user.id,
+                    channel_id=channel.id,
+                    started_at=expires_at - timedelta(days=30),
+                    expires_at=expires_at,
+                )
+            )
+        await session.commit()
+    return telegram_ids
+
+
+@pytest.mark.asyncio
+async def test_claimed_notification_is_not_claimed_again(session_factory) -> None:
+    await _seed_expiring(session_factory, users=1)
+    async with session_factory() as session:
+        subscription = await session.scalar(select(Subscription))
+        row = {
+            "user_id": subscription.user_id,
+            "subscription_id": subscription.id,
+            "kind": NotificationKind.EXPIRING_3D,
+            "expires_at": subscription.expires_at,
+        }
+        outbox = NotificationOutbox(session)
+
+        claimed = await outbox.claim([row])
+        assert list(claimed) == [(subscription.id, NotificationKind.EXPIRING_3D)]
+        assert await outbox.claim([row]) == {}
+
+        # Неудачная отправка освобождает захват, и уведомление повторится
+        await outbox.release(list(claimed.values()))
+        await session.commit()
+        assert list(await outbox.claim([row])) == list(claimed)
+
+
+@pytest.mark.asyncio
+async def test_reminder_is_sent_once_and_failed_one_is_retried(
+    session_factory, monkeypatch
+) -> None:
+    telegram_ids = await _seed_expiring(session_factory, users=2)
+    failing = {telegram_ids[1]}
+    sent: list[int] = []
+
+    class FakeNotificationService:
+        def __init__(self, session) -> None:
+            pass
+
+        async def send_subscription_expiring_notification(self, user, days_left, subscription_end):
+            assert days_left == 3
+            if user.telegram_id in failing:
+                return False
+            sent.append(user.telegram_id)
+            return True
+
+    monkeypatch.setattr(subscriptions, "AsyncSessionLocal", session_factory)
+    monkeypatch.setattr(subscriptions, "UserNotificationService", FakeNotificationService)
+
+    await subscriptions._check_expiring_subscriptions()
+    assert sent == [telegram_ids[0]]
+
+    # Повторный запуск (или другая реплика) не отправляет напоминание второй раз,
+    # а неудавшееся отправляется снова
+    failing.clear()
+    await subscriptions._check_expiring_subscriptions()
+    await subscriptions._check_expiring_subscriptions()
+    assert sorted(sent) == telegram_ids
+
+    async with session_factory() as session:
+        statuses = (await session.scalars(select(SubscriptionNotification.status))).all()
+        assert statuses == [NotificationStatus.SENT, NotificationStatus.SENT]
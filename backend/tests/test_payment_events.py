@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, select
+
+from backend.app.core.config import settings
+from backend.app.models.bot import Bot
+from backend.app.models.payment import Payment, PaymentProvider, PaymentStatus
+from backend.app.models.payment_event import PaymentEvent, PaymentEventStatus
+from backend.app.models.user import User
+from backend.app.services.payment_events import PaymentEventService
+
+
+def _notification(external_id: str, status: str = "waiting_for_capture") -> dict:
+    return {
+        "type": "notification",
+        "event": f"payment.{status}",
+        "object": {"id": external_id, "status": status},
+    }
+
+
+async def _create_payment(session_factory, external_id: str) -> int:
+    async with session_factory() as session:
+        bot = Bot(name="bot", slug="bot")
+        session.add(bot)
+        await session.flush()
+        user = User(bot_id=bot.id, telegram_id=1000)
+        session.add(user)
+        await session.flush()
+        payment = Payment(
+            bot_id=bot.id,
+            user_id=user.id,
+            amount=Decimal("100.00"),
+            payment_provider=PaymentProvider.YOOKASSA,
+            external_id=external_id,
+            status=PaymentStatus.PENDING,
+        )
+        session.add(payment)
+        await session.commit()
+        return payment.id
+
+
+async def _event(session_factory, event_id: int) -> PaymentEvent:
+    async with session_factory() as session:
+        return await session.get(PaymentEvent, event_id)
+
+
+@pytest.mark.asyncio
+async def test_repeated_notification_is_dropped_by_idempotency_key(session_factory) -> None:
+    async with session_factory() as session:
+        service = PaymentEventService(session)
+        assert await service.record_yookassa_event(_notification("pay-1"))
+        assert not await service.record_yookassa_event(_notification("pay-1"))
+        # Другое событие того же платежа - отдельная запись
+        assert await service.record_yookassa_event(_notification("pay-1", "succeeded"))
+        assert not await service.record_yookassa_event({"event": "payment.succeeded"})
+        assert await session.scalar(select(func.count()).select_from(PaymentEvent)) == 2
+
+
+@pytest.mark.asyncio
+async def test_claimed_events_are_not_handed_out_twice(session_factory) -> None:
+    async with session_factory() as session:
+        service = PaymentEventService(session)
+        for external_id in ("pay-1", "pay-2", "pay-3"):
+            await service.record_yookassa_event(_notification(external_id))
+
+        first = await service.claim(2)
+        second = await service.claim(2)
+
+    assert [external_id for _, external_id in first] == ["pay-1", "pay-2"]
+    assert [external_id for _, external_id in second] == ["pay-3"]
+    event = await _event(session_factory, first[0][0])
+    assert event.status == PaymentEventStatus.PROCESSING
+    assert event.locked_at is not None
+
+
+@pytest.mark.asyncio
+async def test_stale_processing_event_is_claimed_again(session_factory) -> None:
+    async with session_factory() as session:
+        service = PaymentEventService(session)
+        await service.record_yookassa_event(_notification("pay-1"))
+        [(event_id, _)] = await service.claim(10)
+        assert await service.claim(10) == []
+
+        # Процесс, захвативший событие, упал и не вернул его в очередь
+        event = await session.get(PaymentEvent, event_id)
+        event.locked_at = datetime.now(timezone.utc) - timedelta(
+            seconds=settings.payment_event_stale_seconds + 1
+        )
+        await session.commit()
+
+        assert await service.claim(10) == [(event_id, "pay-1")]
+
+
+@pytest.mark.asyncio
+async def test_processed_event_updates_payment(session_factory) -> None:
+    payment_id = await _create_payment(session_factory, "pay-1")
+    async with session_factory() as session:
+        service = PaymentEventService(session)
+        await service.record_yookassa_event(_notification("pay-1", "canceled"))
+        [(event_id, _)] = await service.claim(10)
+        await service.process(event_id)
+
+    event = await _event(session_factory, event_id)
+    assert event.status == PaymentEventStatus.PROCESSED
+    assert event.attempts == 1
+    async with session_factory() as session:
+        payment = await session.get(Payment, payment_id)
+        assert payment.status == PaymentStatus.CANCELED
+
+
+@pytest.mark.asyncio
+async def test_event_for_unknown_payment_is_retried_with_backoff(
+    session_factory, monkeypatch
+) -> None:
+    monkeypatch.setattr(settings, "payment_event_max_attempts", 2)
+    async with session_factory() as session:
+        service = PaymentEventService(session)
+        await service.record_yookassa_event(_notification("pay-1"))
+        [(event_id, _)] = await service.claim(10)
+
+        started_at = datetime.now(timezone.utc)
+        with pytest.raises(LookupError):
+            await service.process(event_id)
+
+    event = await _event(session_factory, event_id)
+    assert event.status == PaymentEventStatus.PENDING
+    assert event.attempts == 1
+    assert "pay-1" in event.last_error
+    available_at = event.available_at.replace(tzinfo=timezone.utc)
+    assert available_at - started_at >= timedelta(
+        seconds=settings.payment_event_retry_base_seconds - 1
+    )
+
+    async with session_factory() as session:
+        service = PaymentEventService(session)
+        # Пауза еще не прошла
+        assert await service.claim(10) == []
+
+        event = await session.get(PaymentEvent, event_id)
+        event.available_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        await session.commit()
+        assert await service.claim(10) == [(event_id, "pay-1")]
+        with pytest.raises(LookupError):
+            await service.process(event_id)
+
+    event = await _event(session_factory, event_id)
+    assert event.status == PaymentEventStatus.FAILED
+    assert event.attempts == 2
+    assert event.processed_at is None
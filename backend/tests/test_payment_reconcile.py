@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+from backend.app.core.config import settings
+from backend.app.integrations import yookassa
+from backend.app.integrations.yookassa import YooKassaClient, YooKassaClientPool
+from backend.app.models.bot import Bot
+from backend.app.models.channel import Channel
+from backend.app.models.payment import Payment, PaymentProvider, PaymentStatus
+from backend.app.models.subscription import Subscription
+from backend.app.models.user import User
+from backend.app.services.payment_providers import PaymentProviderSettingsService
+from backend.app.services.payments import PaymentService
+from backend.app.services.user_notifications import UserNotificationService
+from scripts.yookassa_stub_server import create_app
+
+STUB_API_URL = "http://yookassa.local/v3"
+
+
+class _StubTransport(httpx.AsyncBaseTransport):
+    """Заглушка YooKassa; запросы платежей из `unreachable` обрываются ошибкой сети."""
+
+    def __init__(self) -> None:
+        self.app = create_app()
+        self._inner = httpx.ASGITransport(app=self.app)
+        self.unreachable: set[str] = set()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.rsplit("/", 1)[-1] in self.unreachable:
+            raise httpx.ConnectError("connection refused", request=request)
+        return await self._inner.handle_async_request(request)
+
+
+@pytest.fixture
+def stub(monkeypatch: pytest.MonkeyPatch) -> _StubTransport:
+    transport = _StubTransport()
+    monkeypatch.setattr(settings, "yookassa_api_url", STUB_API_URL)
+    monkeypatch.setattr(settings, "yookassa_max_retries", 2)
+    monkeypatch.setattr(settings, "yookassa_retry_backoff_seconds", 0.01)
+    monkeypatch.setattr(yookassa, "yookassa_clients", YooKassaClientPool(transport))
+
+    async def credentials(self, max_age=None) -> tuple[str, str]:
+        return "shop", "key"
+
+    async def notify(self, **kwargs) -> None:
+        return None
+
+    monkeypatch.setattr(PaymentProviderSettingsService, "get_yookassa_credentials", credentials)
+    monkeypatch.setattr(UserNotificationService, "send_payment_success_notification", notify)
+    return transport
+
+
+async def _remote_payment(stub: _StubTransport, status: str | None) -> str:
+    payment = await YooKassaClient(shop_id="shop", api_key="key").create_payment(
+        amount="990.00",
+        description="Подписка",
+        metadata={},
+        confirmation_return_url="https://example.com/return",
+    )
+    if status is not None:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=stub.app), base_url="http://yookassa.local"
+        ) as control:
+            response = await control.post(f"/_stub/payments/{payment['id']}/{status}")
+            response.raise_for_status()
+    return payment["id"]
+
+
+async def _seed_payments(session_factory, external_ids: dict[str, str]) -> dict[str, int]:
+    """Создает ожидающие платежи одного пользователя; возвращает {имя: id платежа}"""
+    checked_at = datetime.now(timezone.utc) - timedelta(
+        seconds=settings.payment_reconcile_recheck_seconds + 1
+    )
+    async with session_factory() as session:
+        bot = Bot(name="bot", slug="bot")
+        session.add(bot)
+        await session.flush()
+        session.add(
+            Channel(
+                bot_id=bot.id,
+                channel_id="-100",
+                channel_name="channel",
+                requires_subscription=True,
+                is_active=True,
+            )
+        )
+        user = User(bot_id=bot.id, telegram_id=1000)
+        session.add(user)
+        await session.flush()
+        payments = {
+            name: Payment(
+                bot_id=bot.id,
+                user_id=user.id,
+                amount=Decimal("990.00"),
+                payment_provider=PaymentProvider.YOOKASSA,
+                external_id=external_id,
+                status=PaymentStatus.PENDING,
+                updated_at=checked_at,
+            )
+            for name, external_id in external_ids.items()
+        }
+        session.add_all(payments.values())
+        await session.commit()
+        return {name: payment.id for name, payment in payments.items()}
+
+
+async def _statuses(session_factory) -> dict[int, PaymentStatus]:
+    async with session_factory() as session:
+        result = await session.execute(select(Payment.id, Payment.status))
+        return dict(result.all())
+
+
+@pytest.mark.asyncio
+async def test_reconcile_applies_succeeded_and_canceled_payments(
+    session_factory, stub
+) -> None:
+    ids = await _seed_payments(
+        session_factory,
+        {
+            "paid": await _remote_payment(stub, "succeeded"),
+            "canceled": await _remote_payment(stub, "canceled"),
+            "waiting": await _remote_payment(stub, None),
+        },
+    )
+
+    async with session_factory() as session:
+        stats = await PaymentService(session).sync_pending_yookassa_payments(limit=10)
+
+    assert (stats.claimed, stats.succeeded, stats.canceled, stats.pending) == (3, 1, 1, 1)
+    assert stats.errors == 0
+    assert await _statuses(session_factory) == {
+        ids["paid"]: PaymentStatus.SUCCEEDED,
+        ids["canceled"]: PaymentStatus.CANCELED,
+        ids["waiting"]: PaymentStatus.PENDING,
+    }
+    async with session_factory() as session:
+        subscription = await session.scalar(select(Subscription))
+        assert subscription.payment_id == ids["paid"]
+        assert subscription.is_active
+
+    # Только что сверенные платежи в следующую пачку не попадают
+    async with session_factory() as session:
+        stats = await PaymentService(session).sync_pending_yookassa_payments(limit=10)
+    assert stats.claimed == 0
+
+
+@pytest.mark.asyncio
+async def test_reconcile_error_does_not_roll_back_other_payments(
+    session_factory, stub, monkeypatch
+) -> None:
+    unreachable = await _remote_payment(stub, "succeeded")
+    ids = await _seed_payments(
+        session_factory,
+        {
+            "paid": await _remote_payment(stub, "succeeded"),
+            "unreachable": unreachable,
+            "broken": await _remote_payment(stub, "canceled"),
+            "canceled": await _remote_payment(stub, "canceled"),
+        },
+    )
+    stub.unreachable.add(unreachable)
+
+    apply_remote_payment = PaymentService._apply_remote_payment
+
+    async def failing_apply(self, payment, remote_payment, **kwargs):
+        outcome = await apply_remote_payment(self, payment, remote_payment, **kwargs)
+        if payment.id == ids["broken"]:
+            raise RuntimeError("broken payment")
+        return outcome
+
+    monkeypatch.setattr(PaymentService, "_apply_remote_payment", failing_apply)
+
+    async with session_factory() as session:
+        stats = await PaymentService(session).sync_pending_yookassa_payments(limit=10)
+
+    assert (stats.claimed, stats.succeeded, stats.canceled, stats.errors) == (4, 1, 1, 2)
+    assert await _statuses(session_factory) == {
+        ids["paid"]: PaymentStatus.SUCCEEDED,
+        ids["unreachable"]: PaymentStatus.PENDING,
+        ids["broken"]: PaymentStatus.PENDING,
+        ids["canceled"]: PaymentStatus.CANCELED,
+    }
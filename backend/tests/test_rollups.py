@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+from datetime import datetime, time, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import delete, func, select
+
+from backend.app.models.bot import Bot
+from backend.app.models.bot_daily_stats import BotDailyStats
+from backend.app.models.channel import Channel
+from backend.app.models.payment import Payment, PaymentProvider, PaymentStatus
+from backend.app.models.subscription import Subscription
+from backend.app.models.user import User
+from backend.app.services.analytics import AnalyticsService
+from backend.app.services.rollups import DailyRollupService
+
+_FIELDS = ("revenue", "payments_count", "new_subscriptions", "renewals", "churned")
+
+
+def _at(days_ago: int) -> datetime:
+    """Момент оплаты `days_ago` дней назад; сегодняшний — уже прошедший"""
+    now = datetime.now(timezone.utc)
+    day_start = datetime.combine(now.date(), time.min, tzinfo=timezone.utc)
+    if days_ago == 0:
+        return day_start + (now - day_start) / 2
+    return day_start - timedelta(days=days_ago) + timedelta(hours=12)
+
+
+async def _seed(session_factory) -> None:
+    """
+    Три пользователя: первый платит трижды, второй дважды (первая оплата вне
+    30 дней), третий впервые сегодня; у второго подписка закончилась 5 дней
+    назад и не продлена.
+    """
+    async with session_factory() as session:
+        bot = Bot(name="bot", slug="bot")
+        session.add(bot)
+        await session.flush()
+        channel = Channel(bot_id=bot.id, channel_id="-100", channel_name="channel")
+        users = [User(bot_id=bot.id, telegram_id=100 + n) for n in range(3)]
+        session.add_all([channel, *users])
+        await session.flush()
+        first, second, third = (user.id for user in users)
+
+        payments = [
+            (first, 10, "990.00"),
+            (first, 3, "990.00"),
+            (first, 0, "990.00"),
+            (second, 40, "490.00"),
+            (second, 2, "490.00"),
+            (third, 0, "1490.00"),
+        ]
+        session.add_all(
+            Payment(
+                bot_id=bot.id,
+                user_id=user_id,
+                amount=Decimal(amount),
+                payment_provider=PaymentProvider.YOOKASSA,
+                status=PaymentStatus.SUCCEEDED,
+                paid_at=_at(days_ago),
+            )
+            for user_id, days_ago, amount in payments
+        )
+        session.add(
+            Payment(
+                bot_id=bot.id,
+                user_id=third,
+                amount=Decimal("990.00"),
+                payment_provider=PaymentProvider.YOOKASSA,
+                status=PaymentStatus.PENDING,
+            )
+        )
+        session.add_all(
+            Subscription(
+                bot_id=bot.id,
+                user_id=user_id,
+                channel_id=channel.id,
+                started_at=_at(started),
+                expires_at=_at(expires),
+            )
+            for user_id, started, expires in (
+                (first, 10, 3),
+                (first, 3, -27),
+                (second, 35, 5),
+            )
+        )
+        await session.commit()
+
+
+async def _stats(session) -> dict[tuple[int, object], tuple]:
+    rows = (await session.scalars(select(BotDailyStats))).all()
+    return {
+        (row.bot_id, row.day): tuple(getattr(row, field) for field in _FIELDS) for row in rows
+    }
+
+
+@pytest.mark.asyncio
+async def test_recorded_payments_match_rebuild(session_factory) -> None:
+    await _seed(session_factory)
+    today = datetime.now(timezone.utc).date()
+    async with session_factory() as session:
+        service = DailyRollupService(session)
+        paid = (
+            await session.scalars(
+                select(Payment)
+                .where(Payment.status == PaymentStatus.SUCCEEDED)
+                .order_by(Payment.paid_at)
+            )
+        ).all()
+        for payment in paid:
+            await service.record_payment(payment)
+        await session.commit()
+        recorded = await _stats(session)
+
+        await service.rebuild(today - timedelta(days=60), today + timedelta(days=1))
+        await session.commit()
+        rebuilt = await _stats(session)
+
+    # Отток знает только пересчет, остальное должно совпасть с приращениями
+    assert {key: value[:4] for key, value in rebuilt.items() if value[1]} == {
+        key: value[:4] for key, value in recorded.items()
+    }
+    churned = {day: value[4] for (_bot_id, day), value in rebuilt.items() if value[4]}
+    assert churned == {today - timedelta(days=5): 1}
+    today_row = next(value for (_bot_id, day), value in rebuilt.items() if day == today)
+    assert today_row == (Decimal("2480.00"), 2, 1, 1, 0)
+
+
+@pytest.mark.asyncio
+async def test_record_payment_stamps_missing_paid_at(session_factory) -> None:
+    await _seed(session_factory)
+    async with session_factory() as session:
+        pending = await session.scalar(
+            select(Payment).where(Payment.status == PaymentStatus.PENDING)
+        )
+        pending.status = PaymentStatus.SUCCEEDED
+        await DailyRollupService(session).record_payment(pending)
+        await session.commit()
+        assert pending.paid_at is not None
+        assert await _stats(session) == {
+            (pending.bot_id, datetime.now(timezone.utc).date()): (
+                Decimal("990.00"), 1, 0, 1, 0
+            )
+        }
+
+
+@pytest.mark.asyncio
+async def test_refresh_backfills_then_rebuilds_only_closed_days(session_factory) -> None:
+    await _seed(session_factory)
+    today = datetime.now(timezone.utc).date()
+    async with session_factory() as session:
+        service = DailyRollupService(session)
+        assert await service.refresh(recent_days=7, chunk_days=7) > 0
+        backfilled = await _stats(session)
+        assert min(day for _bot_id, day in backfilled) == today - timedelta(days=40)
+        assert any(day == today for _bot_id, day in backfilled)
+
+        # Расхождение за закрытый день исправляет следующий пересчет,
+        # а сегодняшнюю строку ведут только приращения
+        await session.execute(
+            delete(BotDailyStats).where(BotDailyStats.day == today - timedelta(days=3))
+        )
+        await session.execute(
+            BotDailyStats.__table__.update()
+            .where(BotDailyStats.day == today)
+            .values(payments_count=BotDailyStats.payments_count + 100)
+        )
+        await session.commit()
+        await service.refresh(recent_days=7, chunk_days=2)
+        refreshed = await _stats(session)
+
+    assert {key: value for key, value in refreshed.items() if key[1] != today} == {
+        key: value for key, value in backfilled.items() if key[1] != today
+    }
+    [today_row] = [value for key, value in refreshed.items() if key[1] == today]
+    assert today_row[1] == 102
+
+
+@pytest.mark.asyncio
+async def test_dashboard_matches_live_payment_queries(session_factory) -> None:
+    await _seed(session_factory)
+    now = datetime.now(timezone.utc)
+    async with session_factory() as session:
+        await DailyRollupService(session).refresh(recent_days=7, chunk_days=30)
+        summary = await AnalyticsService(session).dashboard_summary()
+
+        # Прежние запросы дашборда прямо по таблице платежей
+        succeeded = select(Payment).where(Payment.status == PaymentStatus.SUCCEEDED)
+        live_revenue = await session.scalar(
+            select(func.coalesce(func.sum(Payment.amount), 0)).where(
+                Payment.status == PaymentStatus.SUCCEEDED,
+                Payment.paid_at >= now - timedelta(days=30),
+            )
+        )
+        live_trend: dict[str, Decimal] = {}
+        week = await session.scalars(succeeded.where(Payment.paid_at >= now - timedelta(days=7)))
+        for payment in week:
+            key = payment.paid_at.strftime("%d.%m")
+            live_trend[key] = live_trend.get(key, Decimal("0")) + payment.amount
+        day_start = datetime.combine(now.date(), time.min, tzinfo=timezone.utc)
+        live_today = await session.scalar(
+            select(func.count()).select_from(
+                succeeded.where(Payment.paid_at >= day_start).subquery()
+            )
+        )
+
+    metrics = {metric.id: metric for metric in summary.metrics}
+    assert metrics["monthly_revenue"].value == f"{live_revenue:,.2f} ₽".replace(",", " ")
+    assert {point.date: point.value for point in summary.revenue_trend if point.value} == live_trend
+    assert len(summary.revenue_trend) == 7
+    assert metrics["subscription_payments_today"].value == str(live_today)
+    assert metrics["subscription_payments_today"].change == "1 новых, 1 продлений"
+    assert metrics["churn_30d"].value == "1"
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import json
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+from backend.app.background import subscriptions
+from backend.app.integrations.telegram import telegram_gateway
+from backend.app.models.bot import Bot
+from backend.app.models.channel import Channel
+from backend.app.models.user import User
+
+
+@pytest.mark.asyncio
+async def test_failed_kick_stays_pending_and_is_retried(session_factory, monkeypatch) -> None:
+    async with session_factory() as session:
+        bot = Bot(name="bot", slug="bot")
+        session.add(bot)
+        await session.flush()
+        session.add(
+            Channel(
+                bot_id=bot.id,
+                channel_id="-100",
+                channel_name="channel",
+                requires_subscription=True,
+                is_active=True,
+            )
+        )
+        session.add_all(
+            User(bot_id=bot.id, telegram_id=telegram_id, is_premium=True)
+            for telegram_id in (100, 101, 102)
+        )
+        await session.commit()
+
+    failing = {101}
+    kicked: list[int] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        user_id = json.loads(request.content)["user_id"]
+        if user_id in failing:
+            return httpx.Response(
+                400, json={"ok": False, "error_code": 400, "description": "Bad Request"}
+            )
+        kicked.append(user_id)
+        return httpx.Response(200, json={"ok": True, "result": True})
+
+    async def bot_token(session, bot_id: int) -> str:
+        return "123:token"
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(telegram_gateway, "_client", client)
+    monkeypatch.setattr(telegram_gateway, "get_bot_token", bot_token)
+    monkeypatch.setattr(subscriptions, "AsyncSessionLocal", session_factory)
+
+    async def pending_kicks() -> dict[int, bool]:
+        async with session_factory() as session:
+            users = (await session.scalars(select(User))).all()
+            assert not any(user.is_premium for user in users)
+            return {user.telegram_id: user.channels_kick_pending for user in users}
+
+    await subscriptions._remove_users_without_subscriptions()
+    assert await pending_kicks() == {100: False, 101: True, 102: False}
+
+    # Следующий запуск повторяет только неудавшееся удаление
+    failing.clear()
+    kicked.clear()
+    await subscriptions._remove_users_without_subscriptions()
+    assert set(kicked) == {101}
+    assert await pending_kicks() == {100: False, 101: False, 102: False}
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.integrations.telegram import TelegramGateway
+
+FAKE_API_URL = "http://fake-bot-api.local"
+TOKEN = "TOKEN"  # noqa: S105 - фейковый токен
+
+
+class _FakeBotApi:
+    """Фейковый Bot API: отвечает 429 на первые `throttle` вызовов в указанные чаты."""
+
+    def __init__(self, retry_after: float, throttle: dict[int | None, int]) -> None:
+        self.retry_after = retry_after
+        self.throttle = throttle
+        self.calls: list[tuple[int | None, float]] = []
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        chat_id = json.loads(request.content or b"{}").get("chat_id")
+        self.calls.append((chat_id, time.monotonic()))
+        if self.throttle.get(chat_id, 0) > 0:
+            self.throttle[chat_id] -= 1
+            return httpx.Response(
+                429,
+                json={
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests",
+                    "parameters": {"retry_after": self.retry_after},
+                },
+            )
+        return httpx.Response(200, json={"ok": True, "result": True})
+
+
+def _gateway(api: _FakeBotApi) -> TelegramGateway:
+    gateway = TelegramGateway(api_url=FAKE_API_URL)
+    gateway._client = httpx.AsyncClient(transport=httpx.MockTransport(api.handler))
+    return gateway
+
+
+@pytest.fixture(autouse=True)
+def _limits(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "telegram_max_retry_after_seconds", 5.0)
+    monkeypatch.setattr(settings, "telegram_chat_flood_window_seconds", 1.0)
+
+
+def _call_times(api: _FakeBotApi, chat_id: int | None) -> list[float]:
+    return [called_at for called, called_at in api.calls if called == chat_id]
+
+
+@pytest.mark.asyncio
+async def test_bot_wide_429_pauses_all_chats() -> None:
+    api = _FakeBotApi(retry_after=0.3, throttle={1: 1})
+    gateway = _gateway(api)
+    started_at = time.monotonic()
+
+    # В чат 1 раньше не писали, значит 429 — лимит бота
+    first = asyncio.create_task(gateway.call(TOKEN, "sendMessage", {"chat_id": 1}))
+    await asyncio.sleep(0.05)
+    response = await gateway.call(TOKEN, "sendMessage", {"chat_id": 2})
+    assert (await first).status_code == 200
+    assert response.status_code == 200
+
+    assert _call_times(api, 2)[0] - started_at >= 0.29
+    assert _call_times(api, 1)[1] - started_at >= 0.29
+    assert gateway.throttled_total == 1
+    assert gateway.retried_total == 1
+    assert gateway.throttled_seconds_total == pytest.approx(0.3, abs=0.05)
+    await gateway.aclose()
+
+
+@pytest.mark.asyncio
+async def test_chat_flood_429_pauses_only_that_chat() -> None:
+    api = _FakeBotApi(retry_after=0.3, throttle={})
+    gateway = _gateway(api)
+    assert (await gateway.call(TOKEN, "sendMessage", {"chat_id": 1})).status_code == 200
+
+    # Повторная отправка в тот же чат сразу после первой — лимит чата
+    api.throttle[1] = 1
+    started_at = time.monotonic()
+    first = asyncio.create_task(gateway.call(TOKEN, "sendMessage", {"chat_id": 1}))
+    await asyncio.sleep(0.05)
+    assert (await gateway.call(TOKEN, "sendMessage", {"chat_id": 2})).status_code == 200
+    assert time.monotonic() - started_at < 0.2
+    assert (await first).status_code == 200
+    assert _call_times(api, 1)[-1] - started_at >= 0.29
+    await gateway.aclose()
+
+
+@pytest.mark.asyncio
+async def test_long_retry_after_is_not_retried(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "telegram_max_retry_after_seconds", 0.1)
+    api = _FakeBotApi(retry_after=0.5, throttle={1: 1})
+    gateway = _gateway(api)
+
+    response = await gateway.call(TOKEN, "sendMessage", {"chat_id": 1})
+    assert response.status_code == 429
+    assert len(api.calls) == 1
+    assert gateway.retried_total == 0
+    await gateway.aclose()
+
+
+@pytest.mark.asyncio
+async def test_persistent_429_stops_after_max_retries(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "telegram_max_retries", 2)
+    api = _FakeBotApi(retry_after=0.01, throttle={1: 100})
+    gateway = _gateway(api)
+
+    response = await asyncio.wait_for(
+        gateway.call(TOKEN, "sendMessage", {"chat_id": 1}), timeout=5
+    )
+    assert response.status_code == 429
+    assert len(api.calls) == 3
+    assert gateway.retried_total == 2
+    assert gateway.throttled_total == 3
+    await gateway.aclose()
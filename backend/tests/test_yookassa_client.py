@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import httpx
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.integrations import yookassa
+from backend.app.integrations.yookassa import YooKassaClient, YooKassaClientPool, YooKassaError
+from scripts.yookassa_stub_server import create_app
+
+STUB_API_URL = "http://yookassa.local/v3"
+
+
+class _StubTransport(httpx.AsyncBaseTransport):
+    """Заглушка YooKassa; первые `lose_responses` ответов теряются после обработки запроса."""
+
+    def __init__(self, lose_responses: int = 0) -> None:
+        self.app = create_app()
+        self._inner = httpx.ASGITransport(app=self.app)
+        self.lose_responses = lose_responses
+        self.requests: list[httpx.Request] = []
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        response = await self._inner.handle_async_request(request)
+        if self.lose_responses > 0:
+            self.lose_responses -= 1
+            raise httpx.ReadError("connection reset", request=request)
+        return response
+
+
+@pytest.fixture
+def stub(monkeypatch: pytest.MonkeyPatch) -> _StubTransport:
+    transport = _StubTransport()
+    monkeypatch.setattr(settings, "yookassa_api_url", STUB_API_URL)
+    monkeypatch.setattr(settings, "yookassa_max_retries", 3)
+    monkeypatch.setattr(settings, "yookassa_retry_backoff_seconds", 0.01)
+    monkeypatch.setattr(yookassa, "yookassa_clients", YooKassaClientPool(transport))
+    return transport
+
+
+async def _create(client: YooKassaClient, idempotence_key: str | None = None) -> dict:
+    return await client.create_payment(
+        amount="990.00",
+        description="Подписка",
+        metadata={"payment_id": 1},
+        confirmation_return_url="https://example.com/return",
+        idempotence_key=idempotence_key,
+    )
+
+
+@pytest.mark.asyncio
+async def test_create_payment_retry_reuses_idempotence_key(stub: _StubTransport) -> None:
+    stub.lose_responses = 1
+    client = YooKassaClient(shop_id="shop", api_key="key")
+
+    payment = await _create(client)
+
+    assert len(stub.requests) == 2
+    keys = {request.headers["Idempotence-Key"] for request in stub.requests}
+    assert len(keys) == 1
+    # Повтор вернул платеж, созданный первым запросом, а не новый
+    fetched = await client.get_payment(payment["id"])
+    assert fetched is not None
+    assert fetched["id"] == payment["id"]
+    again = await _create(client, idempotence_key=keys.pop())
+    assert again["id"] == payment["id"]
+    await yookassa.yookassa_clients.aclose()
+
+
+@pytest.mark.asyncio
+async def test_create_payment_retries_server_errors(stub: _StubTransport) -> None:
+    client = YooKassaClient(shop_id="shop", api_key="key")
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=stub.app), base_url="http://yookassa.local"
+    ) as control:
+        await control.post("/_stub/faults", json={"status": 500, "count": 2})
+
+    payment = await _create(client, idempotence_key="order-1")
+
+    assert payment["status"] == "pending"
+    assert [request.headers["Idempotence-Key"] for request in stub.requests] == ["order-1"] * 3
+    await yookassa.yookassa_clients.aclose()
+
+
+@pytest.mark.asyncio
+async def test_get_payment_not_found_returns_none(stub: _StubTransport) -> None:
+    client = YooKassaClient(shop_id="shop", api_key="key")
+
+    assert await client.get_payment("missing") is None
+    assert len(stub.requests) == 1
+    await yookassa.yookassa_clients.aclose()
+
+
+@pytest.mark.asyncio
+async def test_retries_are_bounded(stub: _StubTransport) -> None:
+    stub.lose_responses = 10
+    client = YooKassaClient(shop_id="shop", api_key="key")
+
+    with pytest.raises(YooKassaError, match="недоступна"):
+        await client.get_payment("missing")
+    assert len(stub.requests) == settings.yookassa_max_retries + 1
+    await yookassa.yookassa_clients.aclose()
+
+
+@pytest.mark.asyncio
+async def test_retired_client_is_closed_when_idle(stub: _StubTransport) -> None:
+    pool = yookassa.yookassa_clients
+    old = pool.client_for("shop", "old-key")
+
+    async with pool.lease("shop", "old-key"):
+        new = pool.client_for("shop", "new-key")
+        assert new is not old
+        # Старый клиент еще обслуживает запрос
+        assert not old.is_closed
+
+    assert old.is_closed
+    payment = await _create(YooKassaClient(shop_id="shop", api_key="new-key"))
+    assert payment["status"] == "pending"
+    assert not new.is_closed
+    await pool.aclose()
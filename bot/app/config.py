@@ -16,12 +16,64 @@ class BotSettings(BaseSettings):
     )
 
     environment: str = Field(default="development")
-    bot_token: SecretStr = Field(alias="TELEGRAM_BOT_TOKEN")
+    bot_token: SecretStr | None = Field(default=None, alias="TELEGRAM_BOT_TOKEN")
     backend_base_url: AnyHttpUrl | str = Field(default="http://localhost:8000")
     backend_api_prefix: str = Field(default="/api/v1")
     request_timeout_seconds: float = Field(default=15.0, ge=1.0)
+    # Пул соединений с бэкендом; HTTP/2 включается, если установлен пакет h2
+    # и бэкенд доступен по TLS
+    backend_max_connections: int = Field(default=50, ge=1)
+    backend_max_keepalive_connections: int = Field(default=20, ge=0)
+    backend_keepalive_expiry_seconds: float = Field(default=30.0, ge=0.0)
+    backend_http2: bool = Field(default=True)
+    # Повторы идемпотентных GET при сетевых ошибках и 5xx
+    backend_get_retries: int = Field(default=2, ge=0, le=10)
+    backend_retry_backoff_seconds: float = Field(default=0.2, ge=0.0)
+    backend_retry_backoff_max_seconds: float = Field(default=2.0, ge=0.0)
+    # Бюджет задержки эндпоинта на все попытки вместе; остальным — request_timeout_seconds
+    backend_latency_budgets: dict[str, float] = Field(
+        default_factory=lambda: {
+            "status": 3.0,
+            "channels": 5.0,
+            "plans": 5.0,
+            "cache_invalidations": 5.0,
+            "validate_promo_code": 5.0,
+            "user_payments": 5.0,
+        }
+    )
+    # Размыкатель цепи: после N сбоев подряд запросы к бэкенду не отправляются
+    backend_breaker_failure_threshold: int = Field(default=5, ge=1)
+    backend_breaker_reset_seconds: float = Field(default=30.0, ge=1.0)
     polling_interval: float = Field(default=1.0, ge=0.1)
+    # Все активные боты из бэкенда в одном процессе вместо одного TELEGRAM_BOT_TOKEN
+    multi_tenant: bool = Field(default=False)
+    bot_service_token: SecretStr | None = Field(default=None)
+    tenants_refresh_seconds: float = Field(default=60.0, ge=1.0)
+    # polling — один процесс опрашивает getUpdates; webhook — обновления присылает Telegram
+    bot_mode: str = Field(default="polling", pattern="^(polling|webhook)$")
+    drop_pending_updates: bool = Field(default=False)
+    webhook_url: str | None = Field(default=None)
+    webhook_secret_token: SecretStr | None = Field(default=None)
+    webhook_listen_host: str = Field(default="0.0.0.0")
+    webhook_listen_port: int = Field(default=8080, ge=1, le=65535)
+    webhook_workers: int = Field(default=16, ge=1, le=256)
+    webhook_queue_size: int = Field(default=10_000, ge=1)
+    webhook_max_connections: int = Field(default=40, ge=1, le=100)
+    webhook_shutdown_timeout_seconds: float = Field(default=10.0, ge=0.0)
     timezone: str = Field(default="Europe/Moscow")
+    cleanup_concurrency: int = Field(default=8, ge=1, le=64)
+    cleanup_channel_interval_seconds: float = Field(default=0.1, ge=0.0)
+    # Кэш ответов бэкенда; TTL 0 отключает кэш для области
+    cache_max_entries: int = Field(default=10_000, ge=0)
+    cache_status_ttl_seconds: float = Field(default=30.0, ge=0.0)
+    cache_plans_ttl_seconds: float = Field(default=300.0, ge=0.0)
+    cache_channels_ttl_seconds: float = Field(default=300.0, ge=0.0)
+    cache_invalidation_poll_seconds: float = Field(default=5.0, ge=0.5)
+    # Хранилище user_data и состояний диалогов: SQLite (WAL) или общий Postgres
+    # (postgresql+asyncpg://...) для нескольких реплик; пусто — без сохранения
+    persistence_url: str | None = Field(default="sqlite+aiosqlite:///./data/bot_state.db")
+    persistence_update_interval: float = Field(default=5.0, ge=0.5)
+    persistence_refresh_on_update: bool = Field(default=True)
     sentry_dsn: AnyHttpUrl | None = None
 
 
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from telegram.ext import Application
+
+
+async def start_application(application: Application) -> None:
+    """
+    Запускает Application без run_polling/run_webhook: они владеют event loop и
+    не дают вести несколько ботов в одном процессе. post_init вызывается вручную,
+    как это сделал бы run_*.
+    """
+    await application.initialize()
+    if application.post_init is not None:
+        await application.post_init(application)
+    await application.start()
+
+
+async def stop_application(application: Application) -> None:
+    if application.updater is not None and application.updater.running:
+        await application.updater.stop()
+    if application.running:
+        await application.stop()
+    # Порядок как в run_*: shutdown сохраняет persistence, post_shutdown закрывает ресурсы
+    await application.shutdown()
+    if application.post_shutdown is not None:
+        await application.post_shutdown(application)
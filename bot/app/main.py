@@ -3,6 +3,7 @@ from __future__ import annotations
 import asyncio
 import logging
 
+import httpx
 from telegram import Bot, Update
 from telegram.ext import (
     Application,
@@ -11,6 +12,7 @@ from telegram.ext import (
     CommandHandler,
     ConversationHandler,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 
@@ -41,7 +43,16 @@ from .handlers import (
     status_command,
     unsubscribe_command,
 )
-from .services.backend import BackendClient
+from .persistence import StatePersistence, StateStore
+from .services.backend import (
+    CACHE_SCOPE_CHANNELS,
+    CACHE_SCOPE_PLANS,
+    CACHE_SCOPE_STATUS,
+    BackendClient,
+)
+from .services.breaker import CircuitBreaker
+from .services.cache import ResponseCache
+from .webhook import run_webhook
 from .tasks.subscription_tasks import (
     remove_expired_users_from_channels,
     send_subscription_reminders,
@@ -50,20 +61,81 @@ from .tasks.subscription_tasks import (
 logger = logging.getLogger("lumenpay.bot")
 
 
-def build_application(bot_token: str) -> Application:
-    application = (
+def build_backend_client() -> BackendClient:
+    cache = ResponseCache(
+        ttls={
+            CACHE_SCOPE_STATUS: settings.cache_status_ttl_seconds,
+            CACHE_SCOPE_PLANS: settings.cache_plans_ttl_seconds,
+            CACHE_SCOPE_CHANNELS: settings.cache_channels_ttl_seconds,
+        },
+        max_entries=settings.cache_max_entries,
+    )
+    service_token = settings.bot_service_token
+    return BackendClient(
+        base_url=str(settings.backend_base_url),
+        api_prefix=settings.backend_api_prefix,
+        timeout=settings.request_timeout_seconds,
+        cache=cache,
+        service_token=service_token.get_secret_value() if service_token else None,
+        limits=httpx.Limits(
+            max_connections=settings.backend_max_connections,
+            max_keepalive_connections=settings.backend_max_keepalive_connections,
+            keepalive_expiry=settings.backend_keepalive_expiry_seconds,
+        ),
+        http2=settings.backend_http2,
+        get_retries=settings.backend_get_retries,
+        retry_backoff=settings.backend_retry_backoff_seconds,
+        retry_backoff_max=settings.backend_retry_backoff_max_seconds,
+        latency_budgets=settings.backend_latency_budgets,
+        breaker=CircuitBreaker(
+            failure_threshold=settings.backend_breaker_failure_threshold,
+            reset_timeout=settings.backend_breaker_reset_seconds,
+        ),
+    )
+
+
+def build_state_store() -> StateStore | None:
+    return StateStore(settings.persistence_url) if settings.persistence_url else None
+
+
+def build_application(
+    bot_token: str,
+    backend_client: BackendClient | None = None,
+    state_store: StateStore | None = None,
+    namespace: str = "default",
+) -> Application:
+    """
+    Собирает Application бота. Без `backend_client` создает собственный клиент
+    бэкенда и сам его закрывает; переданным клиентом (общим для нескольких ботов)
+    владеет вызывающий код. То же для `state_store`: состояние бота хранится в
+    нем под ключом `namespace`.
+    """
+    owns_state_store = state_store is None
+    if state_store is None:
+        state_store = build_state_store()
+
+    builder = (
         ApplicationBuilder()
         .token(bot_token)
         .post_init(_on_startup)
         .post_shutdown(_on_shutdown)
-        .build()
     )
+    persistence: StatePersistence | None = None
+    if state_store is not None:
+        persistence = StatePersistence(
+            state_store,
+            namespace,
+            update_interval=settings.persistence_update_interval,
+            refresh_on_update=settings.persistence_refresh_on_update,
+        )
+        builder = builder.persistence(persistence)
+    application = builder.build()
 
-    backend_client = BackendClient(
-        base_url=str(settings.backend_base_url),
-        api_prefix=settings.backend_api_prefix,
-        timeout=settings.request_timeout_seconds,
-    )
+    if owns_state_store and state_store is not None:
+        application.bot_data["state_store"] = state_store
+    application.bot_data["owns_backend_client"] = backend_client is None
+    if backend_client is None:
+        backend_client = build_backend_client()
     application.bot_data["backend_client"] = backend_client
 
     registration_handler = ConversationHandler(
@@ -83,8 +155,15 @@ def build_application(bot_token: str) -> Application:
             MessageHandler(filters.Regex("^Отмена$"), cancel_registration),
         ],
         allow_reentry=True,
+        name="registration",
+        persistent=state_store is not None,
     )
 
+    if persistence is not None and settings.persistence_refresh_on_update:
+        # Состояние диалога перечитывается до того, как его проверит ConversationHandler
+        application.add_handler(
+            TypeHandler(Update, persistence.refresh_conversations), group=-1
+        )
     application.add_handler(registration_handler)
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("status", status_command))
@@ -128,13 +207,19 @@ async def _on_startup(application: Application) -> None:
     application.bot_data["bot_id"] = me.id
     logger.info("Bot started as @%s", me.username)
     
-    # Запускаем периодические задачи
+    # Запускаем периодические задачи; ссылки храним, чтобы остановить их вместе с ботом
     backend_client = application.bot_data.get("backend_client")
     if isinstance(backend_client, BackendClient):
-        # Задача для отправки напоминаний (каждый день в 10:00)
-        asyncio.create_task(_run_daily_reminders(application.bot, backend_client))
-        # Задача для удаления из каналов (каждые 6 часов)
-        asyncio.create_task(_run_channel_cleanup(application.bot, backend_client))
+        tasks = [
+            # Задача для отправки напоминаний (каждый день в 10:00)
+            asyncio.create_task(_run_daily_reminders(application.bot, backend_client)),
+            # Задача для удаления из каналов (каждые 6 часов)
+            asyncio.create_task(_run_channel_cleanup(application.bot, backend_client)),
+        ]
+        if application.bot_data.get("owns_backend_client"):
+            # Инвалидации кэша от бэкенда (оплаты, изменения тарифов и каналов)
+            tasks.append(asyncio.create_task(run_cache_invalidation_listener(backend_client)))
+        application.bot_data["background_tasks"] = tasks
         logger.info("Периодические задачи запущены")
 
 
@@ -174,6 +259,19 @@ async def _run_channel_cleanup(bot: Bot, backend_client: BackendClient) -> None:
             await asyncio.sleep(3600)
 
 
+async def run_cache_invalidation_listener(backend_client: BackendClient) -> None:
+    """Опрашивает журнал инвалидаций бэкенда и сбрасывает устаревшие записи кэша."""
+    while True:
+        try:
+            await backend_client.sync_cache_invalidations()
+        except asyncio.CancelledError:
+            break
+        except Exception as exc:
+            # Без синхронизации записи всё равно устареют по TTL
+            logger.warning("Не удалось получить инвалидации кэша: %s", exc)
+        await asyncio.sleep(settings.cache_invalidation_poll_seconds)
+
+
 async def _wait_until_time(hour: int, minute: int) -> None:
     """Ждёт до указанного времени следующего дня."""
     from datetime import datetime, time, timedelta, timezone
@@ -191,17 +289,34 @@ async def _wait_until_time(hour: int, minute: int) -> None:
 
 
 async def _on_shutdown(application: Application) -> None:
+    tasks = application.bot_data.pop("background_tasks", [])
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
     backend_client = application.bot_data.get("backend_client")
-    if isinstance(backend_client, BackendClient):
+    if isinstance(backend_client, BackendClient) and application.bot_data.get("owns_backend_client"):
         await backend_client.close()
+    state_store = application.bot_data.pop("state_store", None)
+    if isinstance(state_store, StateStore):
+        await state_store.close()
     logger.info("Bot shutdown complete")
 
 
 def run() -> None:
+    if settings.multi_tenant:
+        from .runner import MultiBotRunner
+
+        asyncio.run(MultiBotRunner(build_backend_client()).run())
+        return
+    if settings.bot_token is None:
+        raise RuntimeError("Не задан TELEGRAM_BOT_TOKEN (или включите MULTI_TENANT)")
     application = build_application(settings.bot_token.get_secret_value())
+    if settings.bot_mode == "webhook":
+        asyncio.run(run_webhook(application))
+        return
     application.run_polling(
         allowed_updates=Update.ALL_TYPES,
-        drop_pending_updates=True,
+        drop_pending_updates=settings.drop_pending_updates,
         close_loop=False,
     )
 
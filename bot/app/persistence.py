@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import zlib
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any
+
+import orjson
+from sqlalchemy import Column, Float, LargeBinary, MetaData, String, Table, delete, event, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from telegram import Update
+from telegram.ext import BasePersistence, CallbackContext, ConversationHandler, PersistenceInput
+
+logger = logging.getLogger("lumenpay.bot.persistence")
+
+# Значения длиннее порога сжимаются; первый байт — формат
+_COMPRESS_THRESHOLD = 512
+_PLAIN = b"j"
+_ZLIB = b"z"
+
+_metadata = MetaData()
+bot_state = Table(
+    "bot_state",
+    _metadata,
+    Column("namespace", String(64), primary_key=True),
+    Column("kind", String(96), primary_key=True),
+    Column("key", String(128), primary_key=True),
+    Column("data", LargeBinary, nullable=False),
+    Column("updated_at", Float, nullable=False),
+)
+
+StateKey = tuple[str, str]
+
+
+def _dumps(value: Any) -> bytes:
+    raw = orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    if len(raw) > _COMPRESS_THRESHOLD:
+        return _ZLIB + zlib.compress(raw)
+    return _PLAIN + raw
+
+
+def _loads(data: bytes) -> Any:
+    if data[:1] == _ZLIB:
+        return orjson.loads(zlib.decompress(data[1:]))
+    return orjson.loads(data[1:])
+
+
+class StateStore:
+    """
+    Хранилище состояния бота в одной таблице `bot_state` (SQLite или Postgres).
+
+    Один экземпляр обслуживает всех ботов процесса; строки разделены по `namespace`.
+    Для SQLite включается WAL, чтобы чтения не ждали записи.
+    """
+
+    def __init__(self, url: str) -> None:
+        parsed = make_url(url)
+        if parsed.get_backend_name() == "sqlite" and parsed.database not in (None, "", ":memory:"):
+            Path(parsed.database).parent.mkdir(parents=True, exist_ok=True)
+        self._engine: AsyncEngine = create_async_engine(url)
+        if self._engine.dialect.name == "sqlite":
+            event.listen(self._engine.sync_engine, "connect", _enable_sqlite_wal)
+        self._ready = False
+        self._ready_lock = asyncio.Lock()
+
+    async def _ensure_ready(self) -> None:
+        if self._ready:
+            return
+        async with self._ready_lock:
+            if not self._ready:
+                async with self._engine.begin() as conn:
+                    await conn.run_sync(_metadata.create_all)
+                self._ready = True
+
+    async def load(self, namespace: str, kind: str) -> dict[str, bytes]:
+        await self._ensure_ready()
+        async with self._engine.connect() as conn:
+            result = await conn.execute(
+                select(bot_state.c.key, bot_state.c.data).where(
+                    bot_state.c.namespace == namespace, bot_state.c.kind == kind
+                )
+            )
+            return {row.key: row.data for row in result}
+
+    async def load_one(self, namespace: str, kind: str, key: str) -> bytes | None:
+        await self._ensure_ready()
+        async with self._engine.connect() as conn:
+            return await conn.scalar(
+                select(bot_state.c.data).where(
+                    bot_state.c.namespace == namespace,
+                    bot_state.c.kind == kind,
+                    bot_state.c.key == key,
+                )
+            )
+
+    async def write(self, namespace: str, changes: dict[StateKey, bytes | None]) -> None:
+        """Записывает пачку изменений одной транзакцией; None удаляет строку."""
+        await self._ensure_ready()
+        now = time.time()
+        upserts = [
+            {"namespace": namespace, "kind": kind, "key": key, "data": data, "updated_at": now}
+            for (kind, key), data in changes.items()
+            if data is not None
+        ]
+        deletes = [(kind, key) for (kind, key), data in changes.items() if data is None]
+        async with self._engine.begin() as conn:
+            if upserts:
+                insert = (
+                    postgresql.insert(bot_state)
+                    if self._engine.dialect.name == "postgresql"
+                    else sqlite.insert(bot_state)
+                )
+                stmt = insert.on_conflict_do_update(
+                    index_elements=[bot_state.c.namespace, bot_state.c.kind, bot_state.c.key],
+                    set_={"data": insert.excluded.data, "updated_at": insert.excluded.updated_at},
+                )
+                await conn.execute(stmt, upserts)
+            for kind, key in deletes:
+                await conn.execute(
+                    delete(bot_state).where(
+                        bot_state.c.namespace == namespace,
+                        bot_state.c.kind == kind,
+                        bot_state.c.key == key,
+                    )
+                )
+
+    async def close(self) -> None:
+        await self._engine.dispose()
+
+
+def _enable_sqlite_wal(dbapi_connection: Any, _: Any) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+class StatePersistence(BasePersistence[dict, dict, dict]):
+    """
+    Persistence python-telegram-bot поверх `StateStore`: user_data и состояния
+    ConversationHandler переживают перезапуск и доступны другим репликам.
+
+    Запись отложенная: Application раз в `update_interval` передает изменившиеся
+    данные, и все они уходят в базу одной транзакцией; неизменившиеся значения не
+    перезаписываются. Перед обработкой обновления user_data и состояние диалога
+    этого обновления перечитываются из базы (`refresh_on_update`), если у процесса
+    нет для них незаписанных изменений — так реплика видит данные, записанные
+    другой. Состояния диалогов обновляет `refresh_conversations`, который нужно
+    зарегистрировать обработчиком в группе раньше ConversationHandler.
+    bot_data не сохраняется: там живут объекты процесса (клиент бэкенда, задачи).
+    """
+
+    def __init__(
+        self,
+        store: StateStore,
+        namespace: str,
+        update_interval: float = 5.0,
+        refresh_on_update: bool = True,
+    ) -> None:
+        # chat_data обработчики не используют, а каждая сохраняемая область —
+        # лишнее чтение из базы на обновление
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=True, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self._store = store
+        self._namespace = namespace
+        self._refresh_on_update = refresh_on_update
+        self._pending: dict[StateKey, bytes | None] = {}
+        # Хеши последних записанных значений, чтобы не писать неизменившееся
+        self._written: dict[StateKey, int] = {}
+        self._flush_task: asyncio.Task[None] | None = None
+
+    # --- чтение -----------------------------------------------------------
+
+    async def _load_kind(self, kind: str) -> dict[str, Any]:
+        loaded: dict[str, Any] = {}
+        for key, data in (await self._store.load(self._namespace, kind)).items():
+            self._written[(kind, key)] = hash(data)
+            loaded[key] = _loads(data)
+        return loaded
+
+    async def get_user_data(self) -> dict[int, dict]:
+        return {int(key): value for key, value in (await self._load_kind("user")).items()}
+
+    async def get_chat_data(self) -> dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> MutableMapping[tuple[int | str, ...], object]:
+        loaded = await self._load_kind(f"conversation:{name}")
+        return {tuple(orjson.loads(key)): state for key, state in loaded.items()}
+
+    async def _refresh(self, kind: str, key: int, data: dict) -> None:
+        if not self._refresh_on_update or (kind, str(key)) in self._pending:
+            return
+        stored = await self._store.load_one(self._namespace, kind, str(key))
+        if stored is None or hash(stored) == self._written.get((kind, str(key))):
+            return
+        self._written[(kind, str(key))] = hash(stored)
+        data.clear()
+        data.update(_loads(stored))
+
+    async def refresh_conversation(
+        self,
+        name: str,
+        key: tuple[int | str, ...],
+        conversations: MutableMapping[tuple[int | str, ...], object],
+    ) -> None:
+        kind = f"conversation:{name}"
+        store_key = orjson.dumps(list(key)).decode()
+        if not self._refresh_on_update or (kind, store_key) in self._pending:
+            return
+        stored = await self._store.load_one(self._namespace, kind, store_key)
+        if stored is None:
+            # Диалог завершен другой репликой
+            if self._written.pop((kind, store_key), None) is not None:
+                conversations.pop(key, None)
+            return
+        if hash(stored) == self._written.get((kind, store_key)):
+            return
+        self._written[(kind, store_key)] = hash(stored)
+        conversations[key] = _loads(stored)
+
+    async def refresh_conversations(self, update: object, context: CallbackContext) -> None:
+        """
+        Обработчик-предшественник: перечитывает состояние диалога обновления во всех
+        сохраняемых ConversationHandler приложения. ConversationHandler загружает
+        состояния только при старте, поэтому без этого реплика продолжала бы диалог
+        с устаревшего шага.
+        """
+        if not isinstance(update, Update):
+            return
+        for handlers in context.application.handlers.values():
+            for handler in handlers:
+                if not isinstance(handler, ConversationHandler) or not handler.persistent:
+                    continue
+                # Ключ и словарь состояний - внутренние поля PTB, публичного API для
+                # них нет
+                try:
+                    key = handler._get_key(update)
+                except (AttributeError, RuntimeError):
+                    continue
+                await self.refresh_conversation(handler.name, key, handler._conversations)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        await self._refresh("user", user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        return None
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        return None
+
+    # --- запись -----------------------------------------------------------
+
+    def _stage(self, kind: str, key: str, value: Any) -> None:
+        state_key = (kind, key)
+        if value is None:
+            self._pending[state_key] = None
+        else:
+            try:
+                data = _dumps(value)
+            except TypeError as exc:
+                logger.warning("Не удалось сериализовать %s/%s: %s", kind, key, exc)
+                return
+            if self._written.get(state_key) == hash(data):
+                self._pending.pop(state_key, None)
+                return
+            self._pending[state_key] = data
+        if self._flush_task is None:
+            # Application передает изменения пачкой (gather); задача запустится
+            # после того, как вся пачка окажется в _pending
+            self._flush_task = asyncio.create_task(self._flush_pending())
+
+    async def _flush_pending(self) -> None:
+        try:
+            # Изменения, поступившие во время записи, уходят следующей пачкой
+            while self._pending:
+                await self.flush()
+        except Exception as exc:
+            logger.warning("Не удалось сохранить состояние бота: %s", exc)
+        finally:
+            self._flush_task = None
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._stage("user", str(user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        return None
+
+    async def update_bot_data(self, data: dict) -> None:
+        return None
+
+    async def update_callback_data(self, data: Any) -> None:
+        return None
+
+    async def update_conversation(
+        self, name: str, key: tuple[int | str, ...], new_state: object | None
+    ) -> None:
+        self._stage(f"conversation:{name}", orjson.dumps(list(key)).decode(), new_state)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._stage("user", str(user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        return None
+
+    async def flush(self) -> None:
+        task = self._flush_task
+        if task is not None and task is not asyncio.current_task():
+            # Дожидаемся фоновой записи, чтобы не закрыть хранилище посреди нее
+            await task
+        if not self._pending:
+            return
+        changes, self._pending = self._pending, {}
+        try:
+            await self._store.write(self._namespace, changes)
+        except Exception:
+            # Вернем неудавшуюся пачку, не затирая более свежие изменения
+            for state_key, data in changes.items():
+                self._pending.setdefault(state_key, data)
+            raise
+        for state_key, data in changes.items():
+            if data is None:
+                self._written.pop(state_key, None)
+            else:
+                self._written[state_key] = hash(data)
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import signal
+from dataclasses import dataclass
+
+from telegram import Update
+from telegram.ext import Application
+
+from .config import settings
+from .lifecycle import start_application, stop_application
+from .main import build_application, build_state_store, run_cache_invalidation_listener
+from .services.backend import BackendClient
+from .webhook import WebhookIngress, build_webhook_ingress
+
+logger = logging.getLogger("lumenpay.bot.runner")
+
+
+@dataclass(slots=True)
+class _Tenant:
+    bot_id: int
+    slug: str
+    token: str
+    application: Application
+
+
+class MultiBotRunner:
+    """
+    Все активные боты из бэкенда в одном процессе и одном event loop.
+
+    Список ботов с токенами запрашивается у бэкенда раз в `tenants_refresh_seconds`:
+    новые боты запускаются, выключенные и удаленные останавливаются, бот со
+    сменившимся токеном перезапускается. Пул соединений и кэш клиента бэкенда общие,
+    каждому боту достается свой `BackendClient.for_bot`. Обновления боты получают
+    polling'ом или, в режиме webhook, через общий HTTP-прием по пути `<путь>/<id бота>`.
+    """
+
+    def __init__(self, backend_client: BackendClient) -> None:
+        self._backend = backend_client
+        self._tenants: dict[int, _Tenant] = {}
+        self._state_store = build_state_store()
+        self._ingress: WebhookIngress | None = (
+            build_webhook_ingress() if settings.bot_mode == "webhook" else None
+        )
+
+    @property
+    def bot_ids(self) -> list[int]:
+        return sorted(self._tenants)
+
+    async def run(self) -> None:
+        background = [
+            asyncio.create_task(self._sync_forever()),
+            asyncio.create_task(run_cache_invalidation_listener(self._backend)),
+        ]
+        try:
+            if self._ingress is not None:
+                # uvicorn сам обрабатывает SIGINT/SIGTERM и завершает serve()
+                await self._ingress.build_server().serve()
+            else:
+                await _wait_for_shutdown_signal()
+        finally:
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+            for bot_id in list(self._tenants):
+                await self._stop_tenant(bot_id)
+            await self._backend.close()
+            if self._state_store is not None:
+                await self._state_store.close()
+
+    async def _sync_forever(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except Exception as exc:
+                logger.warning("Не удалось обновить список ботов: %s", exc)
+            await asyncio.sleep(settings.tenants_refresh_seconds)
+
+    async def sync(self) -> None:
+        """Приводит запущенных ботов к списку активных ботов бэкенда."""
+        desired = {bot["id"]: bot for bot in await self._backend.list_active_bots()}
+
+        for bot_id, tenant in list(self._tenants.items()):
+            bot = desired.get(bot_id)
+            if bot is None or bot["token"] != tenant.token:
+                await self._stop_tenant(bot_id)
+
+        for bot_id, bot in desired.items():
+            if bot_id in self._tenants:
+                continue
+            try:
+                await self._start_tenant(bot_id, bot["slug"], bot["token"])
+            except Exception as exc:
+                # Например, отозванный токен; попробуем снова при следующей синхронизации
+                logger.warning("Не удалось запустить бота %s (%s): %s", bot_id, bot["slug"], exc)
+
+    async def _start_tenant(self, bot_id: int, slug: str, token: str) -> None:
+        application = build_application(
+            token, self._backend.for_bot(bot_id), self._state_store, namespace=str(bot_id)
+        )
+        try:
+            await start_application(application)
+            if self._ingress is not None:
+                await self._ingress.add(str(bot_id), application)
+            else:
+                await application.updater.start_polling(
+                    poll_interval=settings.polling_interval,
+                    allowed_updates=Update.ALL_TYPES,
+                    drop_pending_updates=settings.drop_pending_updates,
+                )
+        except Exception:
+            with contextlib.suppress(Exception):
+                await stop_application(application)
+            raise
+        self._tenants[bot_id] = _Tenant(bot_id, slug, token, application)
+        logger.info("Запущен бот %s (%s)", bot_id, slug)
+
+    async def _stop_tenant(self, bot_id: int) -> None:
+        tenant = self._tenants.pop(bot_id, None)
+        if tenant is None:
+            return
+        try:
+            if self._ingress is not None:
+                await self._ingress.remove(str(bot_id))
+            await stop_application(tenant.application)
+        except Exception as exc:
+            logger.warning("Ошибка при остановке бота %s: %s", bot_id, exc)
+        logger.info("Остановлен бот %s (%s)", bot_id, tenant.slug)
+
+
+async def _wait_for_shutdown_signal() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
@@ -1,57 +1,395 @@
 from __future__ import annotations
 
+import asyncio
+import copy
+import random
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Mapping, Sequence
+from dataclasses import dataclass, field
 from typing import Any
 
 import httpx
 
+from .breaker import CircuitBreaker, CircuitOpenError
+from .cache import CacheKey, CacheStats, ResponseCache
+
+# Области кэша; совпадают с областями журнала инвалидаций бэкенда
+CACHE_SCOPE_STATUS = "status"
+CACHE_SCOPE_PLANS = "plans"
+CACHE_SCOPE_CHANNELS = "channels"
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _is_unavailable(exc: BaseException) -> bool:
+    """Сбой на стороне бэкенда или сети, а не ошибка в самом запросе."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError | CircuitOpenError)
+
+
+@dataclass(slots=True)
+class EndpointStats:
+    requests: int = 0
+    failures: int = 0
+    retries: int = 0
+    budget_exceeded: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+
+@dataclass(slots=True)
+class _ClientMetrics:
+    # Общий объект для клиента и всех его копий из for_bot
+    in_flight: int = 0
+    endpoints: dict[str, EndpointStats] = field(default_factory=dict)
+
 
 class BackendClient:
-    def __init__(self, base_url: str, api_prefix: str = "/api/v1", timeout: float = 15.0) -> None:
+    """
+    HTTP-клиент API бэкенда.
+
+    Каждый вызов относится к именованному эндпоинту со своим бюджетом задержки:
+    бюджет ограничивает время всех попыток вместе. Идемпотентные GET-запросы
+    повторяются при сетевых ошибках и ответах 5xx с экспоненциальной паузой со
+    случайным разбросом, пока укладываются в бюджет. Сбои считает `CircuitBreaker`:
+    при разомкнутой цепи запросы сразу завершаются `CircuitOpenError`, а
+    кэшируемые чтения отдают последнее известное значение, если оно есть.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_prefix: str = "/api/v1",
+        timeout: float = 15.0,
+        cache: ResponseCache | None = None,
+        service_token: str | None = None,
+        *,
+        limits: httpx.Limits | None = None,
+        http2: bool = False,
+        get_retries: int = 0,
+        retry_backoff: float = 0.2,
+        retry_backoff_max: float = 2.0,
+        latency_budgets: Mapping[str, float] | None = None,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
+        headers = {"X-Bot-Service-Token": service_token} if service_token else None
+        self._limits = limits or httpx.Limits()
         self._client = httpx.AsyncClient(
             base_url=f"{base_url.rstrip('/')}{api_prefix}",
             timeout=timeout,
+            headers=headers,
+            limits=self._limits,
+            http2=http2 and _http2_available(),
         )
+        self._timeout = timeout
+        self._get_retries = get_retries
+        self._retry_backoff = retry_backoff
+        self._retry_backoff_max = retry_backoff_max
+        self._latency_budgets = dict(latency_budgets or {})
+        self._breaker = breaker
+        self._metrics = _ClientMetrics()
+        self._cache = cache
+        self._invalidation_cursor: int | None = None
+        # id уже примененных событий из окна повторной выдачи бэкенда
+        self._applied_invalidations: set[int] = set()
+        # Бот по умолчанию для запросов без явного bot_id (см. for_bot)
+        self._bot_id: int | None = None
 
     async def close(self) -> None:
         await self._client.aclose()
 
+    def for_bot(self, bot_id: int) -> BackendClient:
+        """
+        Клиент для одного бота: тот же пул соединений и кэш, но bot_id подставляется
+        во все запросы, где он не указан явно. Закрывать его не нужно.
+        """
+        scoped = copy.copy(self)
+        scoped._bot_id = bot_id
+        return scoped
+
+    def _resolve_bot_id(self, bot_id: int | None) -> int | None:
+        return bot_id if bot_id is not None else self._bot_id
+
+    @property
+    def cache_stats(self) -> CacheStats | None:
+        return self._cache.stats if self._cache is not None else None
+
+    def metrics(self) -> dict[str, Any]:
+        """Загрузка пула, состояние размыкателя и статистика по эндпоинтам."""
+        breaker = self._breaker
+        cache_stats = self.cache_stats
+        return {
+            "pool": {
+                "max_connections": self._limits.max_connections,
+                "max_keepalive_connections": self._limits.max_keepalive_connections,
+                "in_flight": self._metrics.in_flight,
+            },
+            "breaker": {
+                "state": breaker.state if breaker is not None else "disabled",
+                "opened_total": breaker.opened_total if breaker is not None else 0,
+                "rejected_total": breaker.rejected_total if breaker is not None else 0,
+            },
+            "stale_served_total": cache_stats.stale_served if cache_stats is not None else 0,
+            "endpoints": {
+                name: {
+                    "requests": stats.requests,
+                    "failures": stats.failures,
+                    "retries": stats.retries,
+                    "budget_exceeded": stats.budget_exceeded,
+                    "avg_seconds": round(stats.total_seconds / stats.requests, 4)
+                    if stats.requests
+                    else 0.0,
+                    "max_seconds": round(stats.max_seconds, 4),
+                }
+                for name, stats in self._metrics.endpoints.items()
+            },
+        }
+
+    async def _request(
+        self, method: str, url: str, *, endpoint: str, **kwargs: Any
+    ) -> httpx.Response:
+        """
+        Выполняет запрос в пределах бюджета эндпоинта. Ответ 5xx после исчерпания
+        попыток возвращается как есть: статус проверяет вызывающий код.
+        """
+        stats = self._metrics.endpoints.get(endpoint)
+        if stats is None:
+            stats = self._metrics.endpoints[endpoint] = EndpointStats()
+        budget = self._latency_budgets.get(endpoint, self._timeout)
+        deadline = time.monotonic() + budget
+        retries = self._get_retries if method == "GET" else 0
+        attempt = 0
+        while True:
+            if self._breaker is not None:
+                self._breaker.before_request()
+            remaining = deadline - time.monotonic()
+            started = time.monotonic()
+            self._metrics.in_flight += 1
+            stats.requests += 1
+            error: httpx.TransportError | None = None
+            response: httpx.Response | None = None
+            try:
+                response = await self._client.request(
+                    method, url, timeout=min(remaining, self._timeout), **kwargs
+                )
+            except httpx.TransportError as exc:
+                error = exc
+                if isinstance(exc, httpx.TimeoutException) and remaining < self._timeout:
+                    stats.budget_exceeded += 1
+            except BaseException:
+                if self._breaker is not None:
+                    self._breaker.release_probe()
+                raise
+            finally:
+                self._metrics.in_flight -= 1
+                elapsed = time.monotonic() - started
+                stats.total_seconds += elapsed
+                stats.max_seconds = max(stats.max_seconds, elapsed)
+
+            if response is not None and response.status_code < 500:
+                if self._breaker is not None:
+                    self._breaker.record_success()
+                return response
+
+            stats.failures += 1
+            if self._breaker is not None:
+                self._breaker.record_failure()
+            delay = random.uniform(  # noqa: S311 - разброс пауз, не криптография
+                0, min(self._retry_backoff_max, self._retry_backoff * 2**attempt)
+            )
+            if attempt >= retries or time.monotonic() + delay >= deadline:
+                if response is not None:
+                    return response
+                if error is None:
+                    raise RuntimeError(f"{method} {url}: нет ни ответа, ни ошибки")
+                raise error
+            attempt += 1
+            stats.retries += 1
+            await asyncio.sleep(delay)
+
+    async def _cached(
+        self, key: CacheKey, loader: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        if self._cache is None:
+            return await loader()
+        try:
+            return await self._cache.get_or_load(key, loader)
+        except httpx.HTTPError as exc:
+            if not _is_unavailable(exc):
+                raise
+            # Бэкенд недоступен: лучше устаревшие данные, чем ошибка пользователю
+            stale = self._cache.get_stale(key)
+            if stale is None:
+                raise
+            return stale
+
+    def invalidate(self, scope: str, key: int | str | None = None) -> None:
+        if self._cache is not None:
+            self._cache.invalidate(scope, None if key is None else str(key))
+
+    async def sync_cache_invalidations(self, page_size: int = 1000) -> int:
+        """
+        Применяет к кэшу новые события из журнала инвалидаций бэкенда.
+        Возвращает число обработанных событий.
+
+        Бэкенд повторно отдает недавние события до курсора (поздно
+        зафиксированные транзакции); уже примененные пропускаются по `id`.
+        """
+        if self._cache is None:
+            return 0
+        processed = 0
+        while True:
+            params: dict[str, Any] = {"limit": page_size}
+            if self._invalidation_cursor is not None:
+                params["after"] = self._invalidation_cursor
+            response = await self._request(
+                "GET", "/bot/cache/invalidations", endpoint="cache_invalidations", params=params
+            )
+            response.raise_for_status()
+            data = response.json()
+            if self._invalidation_cursor is None or data.get("reset"):
+                # До первой синхронизации события не отслеживались: кэшу нельзя доверять
+                self._cache.clear()
+            events = data.get("events") or []
+            previous_cursor = self._invalidation_cursor
+            applied: set[int] = set()
+            new_count = 0
+            for event in events:
+                event_id = event.get("id")
+                if event_id is None or previous_cursor is None or event_id > previous_cursor:
+                    new_count += 1
+                if event_id is not None:
+                    applied.add(event_id)
+                    if event_id in self._applied_invalidations:
+                        continue
+                self._cache.invalidate(event["scope"], event.get("key"))
+                processed += 1
+            # События, выпавшие из окна, больше не придут: помнить нужно только текущие
+            self._applied_invalidations = applied
+            self._invalidation_cursor = data["cursor"]
+            if new_count < page_size:
+                return processed
+
+    async def list_active_bots(self) -> list[dict[str, Any]]:
+        """Активные боты с токенами; требует service_token."""
+        response = await self._request("GET", "/bot/bots/active", endpoint="bots_active")
+        response.raise_for_status()
+        return response.json()
+
     async def register_user(self, payload: dict[str, Any]) -> dict[str, Any]:
-        response = await self._client.post("/bot/users/register", json=payload)
+        if payload.get("bot_id") is None and self._bot_id is not None:
+            payload = {**payload, "bot_id": self._bot_id}
+        response = await self._request(
+            "POST", "/bot/users/register", endpoint="register_user", json=payload
+        )
+        self.invalidate(CACHE_SCOPE_STATUS, payload.get("telegram_id"))
         response.raise_for_status()
         return response.json()
 
     async def update_user(self, user_id: int, payload: dict[str, Any]) -> dict[str, Any]:
-        response = await self._client.put(f"/bot/users/{user_id}", json=payload)
+        response = await self._request(
+            "PUT", f"/bot/users/{user_id}", endpoint="update_user", json=payload
+        )
         response.raise_for_status()
-        return response.json()
+        data = response.json()
+        if data.get("telegram_id") is not None:
+            self.invalidate(CACHE_SCOPE_STATUS, data["telegram_id"])
+        return data
+
+    async def get_subscription_status(
+        self, telegram_id: int, bot_id: int | None = None
+    ) -> dict[str, Any]:
+        bot_id = self._resolve_bot_id(bot_id)
+        return await self._cached(
+            (CACHE_SCOPE_STATUS, str(telegram_id), f"bot:{bot_id}"),
+            lambda: self._fetch_subscription_status(telegram_id, bot_id),
+        )
 
-    async def get_subscription_status(self, telegram_id: int) -> dict[str, Any]:
-        response = await self._client.get(f"/bot/users/{telegram_id}/status")
+    async def _fetch_subscription_status(
+        self, telegram_id: int, bot_id: int | None
+    ) -> dict[str, Any]:
+        params = {"bot_id": bot_id} if bot_id is not None else None
+        response = await self._request(
+            "GET", f"/bot/users/{telegram_id}/status", endpoint="status", params=params
+        )
         if response.status_code == httpx.codes.NOT_FOUND:
             return {"status": "not_found"}
         response.raise_for_status()
         return response.json()
 
-    async def list_channels(self, *, include_locked: bool = False) -> list[dict[str, Any]]:
-        response = await self._client.get("/bot/channels", params={"include_locked": include_locked})
-        response.raise_for_status()
-        return response.json()
+    async def get_subscription_statuses(
+        self, telegram_ids: Sequence[int], bot_id: int | None = None, chunk_size: int = 1000
+    ) -> dict[int, dict[str, Any]]:
+        """Статусы подписок для списка Telegram ID: один запрос на каждые `chunk_size` ID."""
+        bot_id = self._resolve_bot_id(bot_id)
+        statuses: dict[int, dict[str, Any]] = {}
+        unique_ids = list(dict.fromkeys(telegram_ids))
+        for offset in range(0, len(unique_ids), chunk_size):
+            payload: dict[str, Any] = {"telegram_ids": unique_ids[offset:offset + chunk_size]}
+            if bot_id is not None:
+                payload["bot_id"] = bot_id
+            response = await self._request(
+                "POST", "/bot/users/status:batch", endpoint="status_batch", json=payload
+            )
+            response.raise_for_status()
+            for item in response.json():
+                statuses[item["telegram_id"]] = item
+        return statuses
+
+    async def list_channels(
+        self, *, include_locked: bool = False, bot_id: int | None = None
+    ) -> list[dict[str, Any]]:
+        bot_id = self._resolve_bot_id(bot_id)
+
+        async def load() -> list[dict[str, Any]]:
+            params: dict[str, Any] = {"include_locked": include_locked}
+            if bot_id is not None:
+                params["bot_id"] = bot_id
+            response = await self._request(
+                "GET", "/bot/channels", endpoint="channels", params=params
+            )
+            response.raise_for_status()
+            return response.json()
+
+        return await self._cached(
+            (CACHE_SCOPE_CHANNELS, f"bot:{bot_id}", f"locked:{int(include_locked)}"), load
+        )
 
     async def list_plans(self, *, bot_id: int | None = None) -> list[dict[str, Any]]:
-        params = {}
-        if bot_id is not None:
-            params["bot_id"] = bot_id
-        response = await self._client.get("/plans/public", params=params or None)
-        response.raise_for_status()
-        return response.json()
+        bot_id = self._resolve_bot_id(bot_id)
+
+        async def load() -> list[dict[str, Any]]:
+            params = {}
+            if bot_id is not None:
+                params["bot_id"] = bot_id
+            response = await self._request(
+                "GET", "/plans/public", endpoint="plans", params=params or None
+            )
+            response.raise_for_status()
+            return response.json()
+
+        return await self._cached((CACHE_SCOPE_PLANS, f"bot:{bot_id}", ""), load)
 
     async def create_payment(self, payload: dict[str, Any]) -> dict[str, Any]:
-        response = await self._client.post("/bot/payments/create", json=payload)
+        if payload.get("bot_id") is None and self._bot_id is not None:
+            payload = {**payload, "bot_id": self._bot_id}
+        response = await self._request(
+            "POST", "/bot/payments/create", endpoint="create_payment", json=payload
+        )
         response.raise_for_status()
         return response.json()
 
     async def confirm_payment(self, payment_id: str) -> dict[str, Any]:
-        response = await self._client.post(f"/bot/payments/{payment_id}/confirm")
+        response = await self._request(
+            "POST", f"/bot/payments/{payment_id}/confirm", endpoint="confirm_payment"
+        )
         response.raise_for_status()
         return response.json()
 
@@ -65,7 +403,9 @@ class BackendClient:
         params: dict[str, Any] = {"code": code, "bot_id": bot_id}
         if plan_price is not None:
             params["plan_price"] = plan_price
-        response = await self._client.get("/promo-codes/validate", params=params)
+        response = await self._request(
+            "GET", "/promo-codes/validate", endpoint="validate_promo_code", params=params
+        )
         response.raise_for_status()
         return response.json()
 
@@ -73,11 +413,12 @@ class BackendClient:
         self, telegram_id: int, bot_id: int | None = None, limit: int = 50
     ) -> list[dict[str, Any]]:
         """Получает историю платежей пользователя."""
+        bot_id = self._resolve_bot_id(bot_id)
         params: dict[str, Any] = {"limit": limit}
         if bot_id is not None:
             params["bot_id"] = bot_id
-        response = await self._client.get(
-            f"/bot/users/{telegram_id}/payments", params=params
+        response = await self._request(
+            "GET", f"/bot/users/{telegram_id}/payments", endpoint="user_payments", params=params
         )
         response.raise_for_status()
         return response.json()
@@ -86,13 +427,17 @@ class BackendClient:
         self, telegram_id: int, bot_id: int | None = None
     ) -> dict[str, Any]:
         """Отменяет автопродление подписки пользователя."""
+        bot_id = self._resolve_bot_id(bot_id)
         params: dict[str, Any] = {}
         if bot_id is not None:
             params["bot_id"] = bot_id
-        response = await self._client.post(
+        response = await self._request(
+            "POST",
             f"/bot/users/{telegram_id}/subscription/cancel-auto-renew",
+            endpoint="cancel_auto_renew",
             params=params or None,
         )
+        self.invalidate(CACHE_SCOPE_STATUS, telegram_id)
         response.raise_for_status()
         return response.json()
 
@@ -100,13 +445,17 @@ class BackendClient:
         self, telegram_id: int, bot_id: int | None = None
     ) -> dict[str, Any]:
         """Полностью отменяет подписку пользователя: деактивирует подписки и удаляет из каналов."""
+        bot_id = self._resolve_bot_id(bot_id)
         params: dict[str, Any] = {}
         if bot_id is not None:
             params["bot_id"] = bot_id
-        response = await self._client.post(
+        response = await self._request(
+            "POST",
             f"/bot/users/{telegram_id}/subscription/cancel",
+            endpoint="cancel_subscription",
             params=params or None,
         )
+        self.invalidate(CACHE_SCOPE_STATUS, telegram_id)
         response.raise_for_status()
         return response.json()
 
@@ -114,24 +463,42 @@ class BackendClient:
         self, bot_id: int | None = None, days_ahead: int = 3
     ) -> list[dict[str, Any]]:
         """Получает список пользователей с истекающими подписками."""
+        bot_id = self._resolve_bot_id(bot_id)
         params: dict[str, Any] = {"days_ahead": days_ahead}
         if bot_id is not None:
             params["bot_id"] = bot_id
-        response = await self._client.get(
-            "/bot/subscriptions/expiring", params=params
+        response = await self._request(
+            "GET", "/bot/subscriptions/expiring", endpoint="expiring_subscriptions", params=params
         )
         response.raise_for_status()
         return response.json()
 
+    async def iter_expired_subscriptions(
+        self, bot_id: int | None = None, hours_ago: int = 24, page_size: int = 1000
+    ) -> AsyncIterator[list[dict[str, Any]]]:
+        """Постранично отдает пользователей с истекшими подписками (курсор в X-Next-Cursor)."""
+        bot_id = self._resolve_bot_id(bot_id)
+        params: dict[str, Any] = {"hours_ago": hours_ago, "limit": page_size}
+        if bot_id is not None:
+            params["bot_id"] = bot_id
+        while True:
+            response = await self._request(
+                "GET", "/bot/subscriptions/expired", endpoint="expired_subscriptions", params=params
+            )
+            response.raise_for_status()
+            page = response.json()
+            if page:
+                yield page
+            next_cursor = response.headers.get("X-Next-Cursor")
+            if not next_cursor:
+                return
+            params["cursor"] = next_cursor
+
     async def get_expired_subscriptions(
         self, bot_id: int | None = None, hours_ago: int = 24
     ) -> list[dict[str, Any]]:
         """Получает список пользователей с истекшими подписками."""
-        params: dict[str, Any] = {"hours_ago": hours_ago}
-        if bot_id is not None:
-            params["bot_id"] = bot_id
-        response = await self._client.get(
-            "/bot/subscriptions/expired", params=params
-        )
-        response.raise_for_status()
-        return response.json()
+        expired: list[dict[str, Any]] = []
+        async for page in self.iter_expired_subscriptions(bot_id=bot_id, hours_ago=hours_ago):
+            expired.extend(page)
+        return expired
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import logging
+import time
+
+import httpx
+
+logger = logging.getLogger("lumenpay.bot.breaker")
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(httpx.RequestError):
+    """Бэкенд считается недоступным, запрос не отправлялся."""
+
+
+class CircuitBreaker:
+    """
+    Размыкатель цепи для запросов к бэкенду.
+
+    После `failure_threshold` сбоев подряд цепь размыкается, и запросы сразу
+    завершаются `CircuitOpenError`, не занимая соединения и не ожидая таймаута.
+    Через `reset_timeout` пропускается один пробный запрос: его успех замыкает
+    цепь, сбой снова размыкает ее.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probe_in_flight = False
+        self.opened_total = 0
+        self.rejected_total = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return STATE_CLOSED
+        if time.monotonic() - self._opened_at >= self._reset_timeout:
+            return STATE_HALF_OPEN
+        return STATE_OPEN
+
+    def before_request(self) -> None:
+        """Поднимает `CircuitOpenError`, если запрос отправлять нельзя."""
+        state = self.state
+        if state == STATE_CLOSED:
+            return
+        if state == STATE_HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        self.rejected_total += 1
+        raise CircuitOpenError("Бэкенд недоступен, запрос отклонен размыкателем цепи")
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info("Бэкенд снова доступен, цепь замкнута")
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._probe_in_flight or (
+            self._opened_at is None and self._failures >= self._failure_threshold
+        ):
+            if self._opened_at is None:
+                self.opened_total += 1
+                logger.warning(
+                    "Бэкенд недоступен (%d сбоев подряд), цепь разомкнута на %.1f сек.",
+                    self._failures,
+                    self._reset_timeout,
+                )
+            self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Пробный запрос не дал ответа о состоянии бэкенда (например, отменен)."""
+        self._probe_in_flight = False
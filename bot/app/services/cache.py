@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Mapping
+from dataclasses import dataclass
+from typing import Any
+
+# (область, ключ инвалидации, вариант): инвалидация по ключу сбрасывает все его варианты
+CacheKey = tuple[str, str, str]
+
+
+@dataclass(slots=True)
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    stale_served: int = 0
+
+
+class ResponseCache:
+    """
+    Кэш ответов бэкенда: TTL по областям, LRU-вытеснение и объединение запросов.
+
+    Ключ записи — (область, ключ, вариант), например ("status", "<telegram_id>",
+    "bot:<id>"). Инвалидация приходит с областью и ключом и сбрасывает все
+    варианты ключа. Одновременные промахи по одному ключу ждут один общий
+    запрос. Если запись инвалидирована, пока её загружали, результат отдается
+    ожидающим, но в кэш не попадает. Вызывающий код получает копию значения и
+    может её изменять.
+
+    Истекшие записи не удаляются до вытеснения или инвалидации: `get_stale`
+    отдает их, когда загрузить свежее значение не удалось.
+    """
+
+    def __init__(self, ttls: Mapping[str, float], max_entries: int = 10_000) -> None:
+        self._ttls = dict(ttls)
+        self._max_entries = max_entries
+        self._entries: OrderedDict[CacheKey, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[CacheKey, asyncio.Future[Any]] = {}
+        # (область, ключ) -> варианты в кэше
+        self._variants: dict[tuple[str, str], set[str]] = {}
+        self._epoch = 0
+        self.stats = CacheStats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get_or_load(self, key: CacheKey, loader: Callable[[], Awaitable[Any]]) -> Any:
+        ttl = self._ttls.get(key[0], 0.0)
+        if ttl <= 0 or self._max_entries <= 0:
+            return await loader()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return copy.deepcopy(value)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats.coalesced += 1
+        else:
+            self.stats.misses += 1
+            inflight = asyncio.ensure_future(self._load(key, ttl, loader))
+            self._inflight[key] = inflight
+        # shield: отмена одного из ожидающих не должна отменять общий запрос
+        return copy.deepcopy(await asyncio.shield(inflight))
+
+    async def _load(self, key: CacheKey, ttl: float, loader: Callable[[], Awaitable[Any]]) -> Any:
+        epoch = self._epoch
+        try:
+            value = await loader()
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+        if epoch == self._epoch:
+            self._store(key, ttl, value)
+        return value
+
+    def _store(self, key: CacheKey, ttl: float, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        self._variants.setdefault(key[:2], set()).add(key[2])
+        while len(self._entries) > self._max_entries:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.stats.evictions += 1
+
+    def _discard(self, key: CacheKey) -> None:
+        self._entries.pop(key, None)
+        variants = self._variants.get(key[:2])
+        if variants is not None:
+            variants.discard(key[2])
+            if not variants:
+                del self._variants[key[:2]]
+
+    def get_stale(self, key: CacheKey) -> Any | None:
+        """Последнее значение ключа, даже истекшее; None, если его нет."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self.stats.stale_served += 1
+        return copy.deepcopy(entry[1])
+
+    def invalidate(self, scope: str, key: str | None = None) -> None:
+        """Удаляет все варианты ключа (scope, key) или, без ключа, все записи области."""
+        self._epoch += 1
+        self.stats.invalidations += 1
+        if key is not None:
+            for variant in self._variants.pop((scope, key), ()):
+                self._entries.pop((scope, key, variant), None)
+            matches = [k for k in self._inflight if k[:2] == (scope, key)]
+        else:
+            for cache_key in [k for k in self._entries if k[0] == scope]:
+                self._discard(cache_key)
+            matches = [k for k in self._inflight if k[0] == scope]
+        for cache_key in matches:
+            del self._inflight[cache_key]
+
+    def clear(self) -> None:
+        self._epoch += 1
+        self._entries.clear()
+        self._inflight.clear()
+        self._variants.clear()
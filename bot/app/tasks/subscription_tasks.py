@@ -2,16 +2,23 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import time
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
+from typing import Any
 
 import httpx
 from telegram import Bot
-from telegram.error import TelegramError
+from telegram.error import RetryAfter, TelegramError
 
+from ..config import settings
 from ..services.backend import BackendClient
 
 logger = logging.getLogger(__name__)
 
+# Сколько раз повторяем удаление из канала после RetryAfter
+_MAX_KICK_ATTEMPTS = 3
+
 
 async def send_subscription_reminders(
     bot: Bot, backend_client: BackendClient, bot_id: int | None = None
@@ -82,120 +89,268 @@ async def _send_reminder(bot: Bot, user_data: dict, days_left: int) -> None:
         )
 
 
-async def remove_expired_users_from_channels(
-    bot: Bot, backend_client: BackendClient, bot_id: int | None = None
-) -> None:
-    """Удаляет пользователей с истекшими подписками из каналов."""
-    try:
-        # Получаем пользователей с истекшими подписками за последние 24 часа
-        expired_users = await backend_client.get_expired_subscriptions(
-            bot_id=bot_id, hours_ago=24
+@dataclass(slots=True)
+class _CleanupReport:
+    users: int = 0
+    skipped_active: int = 0
+    kicked: int = 0
+    errors: int = 0
+    throttled: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    def log(self) -> None:
+        elapsed = time.monotonic() - self.started_at
+        rate = self.kicked / elapsed if elapsed > 0 else 0.0
+        logger.info(
+            "Обработка истекших подписок завершена: пользователей %d, пропущено активных %d, "
+            "удалений %d, ошибок %d, 429: %d, за %.1f сек. (%.1f удалений/сек)",
+            self.users,
+            self.skipped_active,
+            self.kicked,
+            self.errors,
+            self.throttled,
+            elapsed,
+            rate,
         )
+
+
+class _ChannelLanes:
+    """
+    Полосы по каналам: вызовы к одному каналу идут не чаще раза в `interval` секунд,
+    а RetryAfter от Telegram ставит полосу канала на паузу. Разные каналы не ждут друг друга.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._next_allowed: dict[int | str, float] = {}
+
+    async def acquire(self, chat_id: int | str) -> None:
+        now = time.monotonic()
+        next_allowed = self._next_allowed.get(chat_id, now)
+        self._next_allowed[chat_id] = max(now, next_allowed) + self.interval
+        if next_allowed > now:
+            await asyncio.sleep(next_allowed - now)
+
+    def pause(self, chat_id: int | str, seconds: float) -> None:
+        now = time.monotonic()
+        self._next_allowed[chat_id] = max(self._next_allowed.get(chat_id, now), now + seconds)
+
+
+async def _still_expired(
+    backend_client: BackendClient, candidates: dict[int, dict[str, Any]]
+) -> list[dict[str, Any]] | None:
+    """
+    Перепроверяет статус подписки кандидатов одним запросом: продлившие подписку
+    пропускаются. Возвращает None, если статусы получить не удалось.
+    """
+    if not candidates:
+        return []
+    try:
+        statuses = await backend_client.get_subscription_statuses(list(candidates))
+    except Exception as exc:
+        logger.warning("Ошибка при проверке статусов подписок: %s", exc)
+        return None
+    return [
+        user_data
+        for telegram_id, user_data in candidates.items()
+        # Подписка всё ещё активна - пропускаем
+        if not statuses.get(telegram_id, {}).get("is_active", False)
+    ]
+
+
+async def _process_expired_user(
+    bot: Bot, lanes: _ChannelLanes, user_data: dict[str, Any], report: _CleanupReport
+) -> None:
+    telegram_id = user_data["telegram_id"]
+    
+    # Удаляем пользователя из всех каналов плана
+    for channel in user_data.get("channels", []):
+        channel_id = channel.get("channel_id")
+        if not channel_id:
+            continue
         
-        removed_count = 0
-        error_count = 0
-        
-        for user_data in expired_users:
-            telegram_id = user_data["telegram_id"]
-            channels = user_data.get("channels", [])
-            
-            # Проверяем текущий статус подписки
+        for attempt in range(_MAX_KICK_ATTEMPTS):
+            chat_id = _to_chat_id(channel_id)
+            await lanes.acquire(chat_id)
             try:
-                status = await backend_client.get_subscription_status(telegram_id=telegram_id)
-                if status.get("is_active", False):
-                    # Подписка всё ещё активна, пропускаем
+                await _remove_user_from_channel(bot, telegram_id, chat_id)
+            except RetryAfter as exc:
+                report.throttled += 1
+                lanes.pause(chat_id, _retry_after_seconds(exc))
+                if attempt + 1 < _MAX_KICK_ATTEMPTS:
                     continue
+                report.errors += 1
+                logger.warning(
+                    "Telegram ограничил частоту удаления пользователя %s из канала %s",
+                    telegram_id,
+                    channel_id,
+                )
             except Exception as exc:
+                report.errors += 1
                 logger.warning(
-                    "Ошибка при проверке статуса подписки для пользователя %s: %s",
+                    "Ошибка при удалении пользователя %s из канала %s: %s",
                     telegram_id,
+                    channel_id,
                     exc,
                 )
-                continue
-            
-            # Удаляем пользователя из всех каналов плана
-            for channel in channels:
-                channel_id = channel.get("channel_id")
-                if not channel_id:
-                    continue
-                
-                try:
-                    await _remove_user_from_channel(bot, telegram_id, channel_id)
-                    removed_count += 1
-                    logger.info(
-                        "Пользователь %s удалён из канала %s",
-                        telegram_id,
-                        channel.get("channel_name", channel_id),
-                    )
-                except Exception as exc:
-                    error_count += 1
-                    logger.warning(
-                        "Ошибка при удалении пользователя %s из канала %s: %s",
-                        telegram_id,
-                        channel_id,
-                        exc,
-                    )
-            
-            # Отправляем уведомление пользователю
+            else:
+                report.kicked += 1
+                logger.info(
+                    "Пользователь %s удалён из канала %s",
+                    telegram_id,
+                    channel.get("channel_name", channel_id),
+                )
+            break
+    
+    # Уведомление отправляется один раз, даже если каналы пришли несколькими страницами
+    if not user_data.get("notify", True):
+        return
+    
+    # Отправляем уведомление пользователю
+    try:
+        first_name = user_data.get("first_name") or "Пользователь"
+        message = (
+            f"👋 Привет, {first_name}!\n\n"
+            f"❌ Твоя подписка истекла.\n\n"
+            f"💡 Чтобы восстановить доступ к закрытым каналам, оформи новую подписку командой /buy\n\n"
+            f"💳 Используй промокод командой /promo для получения скидки!"
+        )
+        await bot.send_message(chat_id=telegram_id, text=message)
+    except TelegramError as exc:
+        logger.warning(
+            "Не удалось отправить уведомление пользователю %s: %s",
+            telegram_id,
+            exc,
+        )
+
+
+async def remove_expired_users_from_channels(
+    bot: Bot, backend_client: BackendClient, bot_id: int | None = None
+) -> None:
+    """
+    Удаляет пользователей с истекшими подписками из каналов.
+
+    Истекшие подписки читаются постранично; каждая страница перепроверяется одним
+    пакетным запросом статусов, и пользователи обрабатываются пулом из `cleanup_concurrency` воркеров.
+    Вызовы к одному каналу разнесены полосами `_ChannelLanes`, фиксированных пауз нет.
+    """
+    report = _CleanupReport()
+    lanes = _ChannelLanes(settings.cleanup_channel_interval_seconds)
+    queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=settings.cleanup_concurrency * 2)
+    
+    async def worker() -> None:
+        while True:
+            user_data = await queue.get()
             try:
-                first_name = user_data.get("first_name") or "Пользователь"
-                message = (
-                    f"👋 Привет, {first_name}!\n\n"
-                    f"❌ Твоя подписка истекла.\n\n"
-                    f"💡 Чтобы восстановить доступ к закрытым каналам, оформи новую подписку командой /buy\n\n"
-                    f"💳 Используй промокод командой /promo для получения скидки!"
+                await _process_expired_user(bot, lanes, user_data, report)
+            except Exception as exc:
+                report.errors += 1
+                logger.exception(
+                    "Ошибка при обработке пользователя %s: %s", user_data.get("telegram_id"), exc
                 )
-                await bot.send_message(chat_id=telegram_id, text=message)
-            except TelegramError as exc:
-                logger.warning(
-                    "Не удалось отправить уведомление пользователю %s: %s",
+            finally:
+                queue.task_done()
+    
+    workers = [asyncio.create_task(worker()) for _ in range(settings.cleanup_concurrency)]
+    # Каналы, уже поставленные в работу, по пользователям
+    handled: dict[int, set[Any]] = {}
+    try:
+        # Получаем пользователей с истекшими подписками за последние 24 часа
+        async for page in backend_client.iter_expired_subscriptions(bot_id=bot_id, hours_ago=24):
+            # У пользователя может быть несколько истекших подписок, в том числе на
+            # разных страницах - объединяем каналы, уже обработанные пропускаем
+            candidates: dict[int, dict[str, Any]] = {}
+            for user_data in page:
+                telegram_id = user_data["telegram_id"]
+                candidate = candidates.setdefault(
                     telegram_id,
-                    exc,
+                    {**user_data, "channels": [], "notify": telegram_id not in handled},
                 )
-        
-        if removed_count > 0 or error_count > 0:
-            logger.info(
-                "Обработка истекших подписок завершена: удалено %d, ошибок %d",
-                removed_count,
-                error_count,
+                known = handled.get(telegram_id, set()) | {
+                    channel.get("channel_id") for channel in candidate["channels"]
+                }
+                candidate["channels"].extend(
+                    channel
+                    for channel in user_data.get("channels", [])
+                    if channel.get("channel_id") not in known
+                )
+            candidates = {
+                telegram_id: candidate
+                for telegram_id, candidate in candidates.items()
+                if candidate["notify"] or candidate["channels"]
+            }
+            
+            expired_users = await _still_expired(backend_client, candidates)
+            if expired_users is None:
+                # Без статусов пользователей страницы не трогаем; их каналы не
+                # отмечаются обработанными и повторятся, если встретятся дальше
+                report.errors += len(candidates)
+                continue
+            new_users = sum(1 for candidate in candidates.values() if candidate["notify"])
+            report.users += new_users
+            report.skipped_active += new_users - sum(
+                1 for user_data in expired_users if user_data["notify"]
             )
-                
+            for telegram_id, candidate in candidates.items():
+                handled.setdefault(telegram_id, set()).update(
+                    channel.get("channel_id") for channel in candidate["channels"]
+                )
+            for user_data in expired_users:
+                await queue.put(user_data)
+        
+        await queue.join()
     except httpx.RequestError as exc:
         logger.warning("Ошибка сети при получении истекших подписок: %s", exc)
     except httpx.HTTPStatusError as exc:
         logger.warning("Ошибка HTTP при получении истекших подписок: %s", exc)
     except Exception as exc:
         logger.exception("Неожиданная ошибка при удалении пользователей из каналов: %s", exc)
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    
+    if report.users:
+        report.log()
+
+
+def _to_chat_id(channel_id: int | str) -> int | str:
+    # Преобразуем channel_id в int, если это строка с числом
+    if isinstance(channel_id, str):
+        stripped = channel_id.strip()
+        if stripped.lstrip("-").isdigit():
+            return int(stripped)
+    return channel_id
 
 
-async def _remove_user_from_channel(bot: Bot, telegram_id: int, channel_id: str) -> None:
+def _retry_after_seconds(exc: RetryAfter) -> float:
+    retry_after = exc.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+async def _remove_user_from_channel(bot: Bot, telegram_id: int, chat_id: int | str) -> None:
     """Удаляет пользователя из канала."""
     try:
-        # Преобразуем channel_id в int, если это строка с числом
-        chat_id = channel_id
-        if isinstance(chat_id, str):
-            stripped = chat_id.strip()
-            if stripped.lstrip("-").isdigit():
-                chat_id = int(stripped)
-        
         # Используем ban_chat_member для удаления пользователя
         # until_date=None означает постоянный бан, но мы можем разбанить позже
         await bot.ban_chat_member(chat_id=chat_id, user_id=telegram_id, until_date=None)
         
         # Сразу разбаниваем, чтобы пользователь мог присоединиться снова при продлении подписки
         # Это удалит пользователя из канала, но не заблокирует его навсегда
-        await asyncio.sleep(1)  # Небольшая задержка
         await bot.unban_chat_member(chat_id=chat_id, user_id=telegram_id, only_if_banned=True)
         
+    except RetryAfter:
+        raise
     except TelegramError as exc:
         # Если пользователь уже не в канале или бот не имеет прав администратора, это нормально
         if "user not found" in str(exc).lower() or "not enough rights" in str(exc).lower():
             logger.debug(
                 "Не удалось удалить пользователя %s из канала %s: %s",
                 telegram_id,
-                channel_id,
+                chat_id,
                 exc,
             )
         else:
             raise
-
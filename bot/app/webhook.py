@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import asyncio
+import hmac
+import logging
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import TYPE_CHECKING, Any
+from urllib.parse import urlparse
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from telegram import Update
+from telegram.ext import Application
+
+from .config import settings
+from .lifecycle import start_application, stop_application
+
+if TYPE_CHECKING:
+    import uvicorn
+
+logger = logging.getLogger("lumenpay.bot.webhook")
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def _ordering_key(update: Update) -> int:
+    """Ключ, в пределах которого обновления обрабатываются строго по очереди."""
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    # Обновления без чата и пользователя (опросы и т.п.) друг от друга не зависят
+    return -update.update_id
+
+
+class UpdateDispatcher:
+    """
+    Очередь входящих обновлений и пул обработчиков.
+
+    Обновления одного чата обрабатываются последовательно и в порядке поступления:
+    от этого зависит состояние `ConversationHandler`. Разные чаты обрабатываются
+    параллельно. Если чат уже занят другим обработчиком, новое обновление
+    передается ему, а не ждет в общей очереди, так что медленный чат не
+    задерживает остальные.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Update], Awaitable[None]],
+        workers: int,
+        queue_size: int,
+    ) -> None:
+        self._process = process
+        self._workers_count = workers
+        self._queue: asyncio.Queue[Update] = asyncio.Queue(maxsize=queue_size)
+        # Чаты в обработке -> обновления, пришедшие, пока чат занят
+        self._busy: dict[int, deque[Update]] = {}
+        self._workers: list[asyncio.Task[None]] = []
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def busy_chats(self) -> int:
+        return len(self._busy)
+
+    def submit(self, update: Update) -> bool:
+        """Ставит обновление в очередь. False, если очередь заполнена."""
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def start(self) -> None:
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"update-worker-{idx}")
+            for idx in range(self._workers_count)
+        ]
+
+    async def stop(self, timeout: float) -> None:
+        """Дожидается обработки принятых обновлений (не дольше `timeout`) и останавливает пул."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Не дождались обработки %d обновлений при остановке", self._queue.qsize()
+            )
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self._queue.get()
+            key = _ordering_key(update)
+            pending = self._busy.get(key)
+            if pending is not None:
+                # task_done вызовет обработчик, который займется этим обновлением
+                pending.append(update)
+                continue
+
+            pending = self._busy[key] = deque()
+            try:
+                await self._process_one(update)
+                while pending:
+                    await self._process_one(pending.popleft())
+            finally:
+                del self._busy[key]
+
+    async def _process_one(self, update: Update) -> None:
+        try:
+            await self._process(update)
+        except Exception as exc:
+            logger.exception("Ошибка обработки обновления %s: %s", update.update_id, exc)
+        finally:
+            self._queue.task_done()
+
+
+class WebhookIngress:
+    """
+    HTTP-прием вебхуков Telegram для одного или нескольких ботов.
+
+    Один бот получает обновления на путь из `webhook_url`, боты многоботового
+    режима — на `<путь>/<id бота>`. У каждого бота своя очередь и свой пул
+    обработчиков.
+    """
+
+    def __init__(self, url: str, secret_token: str) -> None:
+        self.url = url.rstrip("/")
+        self.path = urlparse(self.url).path.rstrip("/")
+        self._secret_token = secret_token.encode()
+        self._targets: dict[str, tuple[Application, UpdateDispatcher]] = {}
+
+    def url_for(self, tenant: str) -> str:
+        return f"{self.url}/{tenant}" if tenant else self.url
+
+    async def add(self, tenant: str, application: Application) -> None:
+        """Начинает принимать обновления бота и регистрирует вебхук в Telegram."""
+        dispatcher = UpdateDispatcher(
+            application.process_update,
+            workers=settings.webhook_workers,
+            queue_size=settings.webhook_queue_size,
+        )
+        dispatcher.start()
+        self._targets[tenant] = (application, dispatcher)
+        await application.bot.set_webhook(
+            url=self.url_for(tenant),
+            secret_token=self._secret_token.decode(),
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=settings.webhook_max_connections,
+            drop_pending_updates=settings.drop_pending_updates,
+        )
+
+    async def remove(self, tenant: str) -> None:
+        """Перестает принимать обновления бота и дожидается обработки принятых."""
+        target = self._targets.pop(tenant, None)
+        if target is not None:
+            await target[1].stop(timeout=settings.webhook_shutdown_timeout_seconds)
+
+    def build_app(self) -> Starlette:
+        async def receive_update(request: Request) -> Response:
+            header = request.headers.get(SECRET_TOKEN_HEADER, "").encode()
+            if not hmac.compare_digest(header, self._secret_token):
+                return Response(status_code=403)
+            target = self._targets.get(request.path_params.get("tenant", ""))
+            if target is None:
+                return Response(status_code=404)
+            application, dispatcher = target
+            try:
+                update = Update.de_json(await request.json(), application.bot)
+            except Exception:
+                return Response(status_code=400)
+            if update is None:
+                return Response(status_code=400)
+            if not dispatcher.submit(update):
+                # Telegram повторит доставку позже; до тех пор обновление хранится у него
+                return Response(status_code=503)
+            return Response(status_code=200)
+
+        async def health(_: Request) -> Response:
+            payload: dict[str, Any] = {
+                tenant or "default": {
+                    "queue_size": dispatcher.queue_size,
+                    "busy_chats": dispatcher.busy_chats,
+                }
+                for tenant, (_, dispatcher) in self._targets.items()
+            }
+            # Клиент бэкенда у ботов общий (или единственный), метрики достаточно взять у одного
+            for application, _ in self._targets.values():
+                backend_client = application.bot_data.get("backend_client")
+                if backend_client is not None:
+                    payload["backend"] = backend_client.metrics()
+                    break
+            return JSONResponse(payload)
+
+        return Starlette(
+            routes=[
+                Route(self.path or "/", receive_update, methods=["POST"]),
+                Route(f"{self.path}/{{tenant}}", receive_update, methods=["POST"]),
+                Route("/healthz", health, methods=["GET"]),
+            ]
+        )
+
+    def build_server(self) -> "uvicorn.Server":
+        import uvicorn
+
+        return uvicorn.Server(
+            uvicorn.Config(
+                self.build_app(),
+                host=settings.webhook_listen_host,
+                port=settings.webhook_listen_port,
+                log_level="warning",
+            )
+        )
+
+    async def close(self) -> None:
+        for tenant in list(self._targets):
+            await self.remove(tenant)
+
+
+def build_webhook_ingress() -> WebhookIngress:
+    if not settings.webhook_url or settings.webhook_secret_token is None:
+        raise RuntimeError("Для режима webhook нужны WEBHOOK_URL и WEBHOOK_SECRET_TOKEN")
+    return WebhookIngress(settings.webhook_url, settings.webhook_secret_token.get_secret_value())
+
+
+async def run_webhook(application: Application) -> None:
+    """
+    Запускает бота в режиме вебхука.
+
+    Telegram отправляет обновления на `webhook_url`; ответ 200 уходит сразу после
+    постановки в очередь, обработку ведут `webhook_workers` обработчиков. При
+    остановке вебхук не удаляется, поэтому обновления за время перезапуска
+    Telegram дошлет повторно.
+
+    Несколько реплик за балансировщиком видят общее состояние: persistence
+    перечитывает user_data и состояние диалога перед каждым обновлением. Порядок
+    обновлений одного чата соблюдается только внутри процесса; если два
+    обновления чата одновременно попадут на разные реплики, они обработаются
+    параллельно.
+    """
+    ingress = build_webhook_ingress()
+    server = ingress.build_server()
+
+    await start_application(application)
+    try:
+        await ingress.add("", application)
+        logger.info("Вебхук %s, обработчиков: %d", ingress.url, settings.webhook_workers)
+        # uvicorn сам обрабатывает SIGINT/SIGTERM и завершает serve()
+        await server.serve()
+    finally:
+        await ingress.close()
+        await stop_application(application)
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import pytest
+
+from bot.app.persistence import (
+    _COMPRESS_THRESHOLD,
+    _PLAIN,
+    _ZLIB,
+    StatePersistence,
+    StateStore,
+    _dumps,
+    _loads,
+)
+
+
+@pytest.fixture
+def store(tmp_path) -> StateStore:
+    return StateStore(f"sqlite+aiosqlite:///{tmp_path / 'state.db'}")
+
+
+def test_dumps_compresses_only_large_values() -> None:
+    small = {"step": "contact", "phone": "+70000000000"}
+    large = {"history": ["x" * 32] * (_COMPRESS_THRESHOLD // 16)}
+
+    assert _dumps(small)[:1] == _PLAIN
+    assert _dumps(large)[:1] == _ZLIB
+    assert len(_dumps(large)) < _COMPRESS_THRESHOLD
+    assert _loads(_dumps(small)) == small
+    assert _loads(_dumps(large)) == large
+
+
+@pytest.mark.asyncio
+async def test_changes_are_written_in_one_batch(store, monkeypatch) -> None:
+    persistence = StatePersistence(store, "bot")
+    batches: list[dict] = []
+    write = store.write
+
+    async def recording_write(namespace, changes):
+        batches.append(dict(changes))
+        await write(namespace, changes)
+
+    monkeypatch.setattr(store, "write", recording_write)
+
+    await persistence.update_user_data(1, {"name": "Ann"})
+    await persistence.update_user_data(2, {"name": "Bob"})
+    await persistence.update_conversation("registration", (2, 2), 1)
+    await persistence.flush()
+
+    assert len(batches) == 1
+    assert set(batches[0]) == {("user", "1"), ("user", "2"), ("conversation:registration", "[2,2]")}
+
+    # Неизменившиеся значения повторно не пишутся
+    await persistence.update_user_data(1, {"name": "Ann"})
+    await persistence.flush()
+    assert len(batches) == 1
+
+    reloaded = StatePersistence(store, "bot")
+    assert await reloaded.get_user_data() == {1: {"name": "Ann"}, 2: {"name": "Bob"}}
+    assert await reloaded.get_conversations("registration") == {(2, 2): 1}
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_put_back_without_overwriting_newer_changes(
+    store, monkeypatch
+) -> None:
+    persistence = StatePersistence(store, "bot")
+    write = store.write
+
+    async def failing_write(namespace, changes):
+        # Пока пачка пишется, обработчик успевает снова изменить данные
+        await persistence.update_user_data(1, {"step": 2})
+        raise ConnectionError("database is down")
+
+    await persistence.update_user_data(1, {"step": 1})
+    await persistence.update_user_data(2, {"step": 1})
+    monkeypatch.setattr(store, "write", failing_write)
+    with pytest.raises(ConnectionError):
+        await persistence.flush()
+
+    monkeypatch.setattr(store, "write", write)
+    await persistence.flush()
+
+    reloaded = StatePersistence(store, "bot")
+    assert await reloaded.get_user_data() == {1: {"step": 2}, 2: {"step": 1}}
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_conversation_state_is_refreshed_from_other_replica(store) -> None:
+    first = StatePersistence(store, "bot")
+    second = StatePersistence(store, "bot")
+    conversations = await second.get_conversations("registration")
+    key = (7, 7)
+
+    await first.update_conversation("registration", key, 1)
+    await first.flush()
+    await second.refresh_conversation("registration", key, conversations)
+    assert conversations == {key: 1}
+
+    await first.update_conversation("registration", key, 2)
+    await first.flush()
+    await second.refresh_conversation("registration", key, conversations)
+    assert conversations == {key: 2}
+
+    # Диалог, завершенный другой репликой, забывается
+    await first.update_conversation("registration", key, None)
+    await first.flush()
+    await second.refresh_conversation("registration", key, conversations)
+    assert conversations == {}
+    await store.close()
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from typing import Any
+
+import pytest
+
+from bot.app.config import settings
+from bot.app.tasks import subscription_tasks
+from bot.app.tasks.subscription_tasks import remove_expired_users_from_channels
+
+
+class _FakeBot:
+    def __init__(self) -> None:
+        self.kicked: list[tuple[int, int]] = []
+        self.messages: list[int] = []
+
+    async def ban_chat_member(self, chat_id: int, user_id: int, until_date: Any = None) -> None:
+        self.kicked.append((user_id, chat_id))
+
+    async def unban_chat_member(self, chat_id: int, user_id: int, only_if_banned: bool) -> None:
+        return None
+
+    async def send_message(self, chat_id: int, text: str) -> None:
+        self.messages.append(chat_id)
+
+
+class _FakeBackend:
+    def __init__(self, pages: list[list[dict[str, Any]]], failing_pages: set[int] = frozenset()):
+        self.pages = pages
+        self.failing_pages = failing_pages
+        self._page = 0
+
+    async def iter_expired_subscriptions(self, bot_id=None, hours_ago=24):
+        for index, page in enumerate(self.pages):
+            self._page = index
+            yield page
+
+    async def get_subscription_statuses(self, telegram_ids, bot_id=None):
+        if self._page in self.failing_pages:
+            raise ConnectionError("backend is down")
+        return {telegram_id: {"is_active": False} for telegram_id in telegram_ids}
+
+
+def _expired(telegram_id: int, *channel_ids: int) -> dict[str, Any]:
+    return {
+        "telegram_id": telegram_id,
+        "first_name": "User",
+        "channels": [{"channel_id": channel_id} for channel_id in channel_ids],
+    }
+
+
+@pytest.fixture(autouse=True)
+def _fast_lanes(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "cleanup_channel_interval_seconds", 0.0)
+
+
+@pytest.mark.asyncio
+async def test_channels_from_later_pages_are_merged_for_seen_users() -> None:
+    bot = _FakeBot()
+    backend = _FakeBackend(
+        [
+            [_expired(1, -100), _expired(2, -100)],
+            # Вторая истекшая подписка первого пользователя пришла на следующей странице
+            [_expired(1, -100, -200), _expired(3, -200)],
+        ]
+    )
+
+    await remove_expired_users_from_channels(bot, backend)
+
+    assert sorted(bot.kicked) == [(1, -200), (1, -100), (2, -100), (3, -200)]
+    # Уведомление об истечении - одно на пользователя
+    assert sorted(bot.messages) == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_failed_status_check_is_counted_as_errors(monkeypatch) -> None:
+    reports: list[subscription_tasks._CleanupReport] = []
+    monkeypatch.setattr(subscription_tasks._CleanupReport, "log", lambda self: reports.append(self))
+    bot = _FakeBot()
+    backend = _FakeBackend(
+        [[_expired(1, -100), _expired(2, -100)], [_expired(3, -100)]], failing_pages={0}
+    )
+
+    await remove_expired_users_from_channels(bot, backend)
+
+    assert bot.kicked == [(3, -100)]
+    [report] = reports
+    assert (report.users, report.kicked, report.errors) == (1, 1, 2)
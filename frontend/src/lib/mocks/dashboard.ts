@@ -41,10 +41,10 @@ export const DASHBOARD_SUMMARY_MOCK: DashboardSummary = {
       icon: 'credit-card',
     },
     {
-      id: 'renewals_today',
-      title: 'Продлений сегодня',
+      id: 'subscription_payments_today',
+      title: 'Оплат подписок сегодня',
       value: '23',
-      change: '5 ожидают оплаты',
+      change: '9 новых, 14 продлений',
       icon: 'arrow-up-right',
     },
   ],
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк движка рассылок против локального фейкового Bot API.
+
+Фейковый API отвечает на любой метод `{"ok": true}` с заданной задержкой,
+поэтому измеряется только накладная стоимость движка и эффект конкурентности.
+Флаги `--api-limit` и `--inject-429` заставляют фейковый API отвечать 429 с
+`retry_after`, как это делает Telegram при превышении лимитов.
+
+Примеры:
+    python -m scripts.benchmark_broadcast_delivery --rate 1000 --concurrency 64
+    python -m scripts.benchmark_broadcast_delivery --sizes 1000 --rate 100 --api-limit 40
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from backend.app.services.broadcast_delivery import (
+    BroadcastDeliveryEngine,
+    DeliveryJob,
+    DeliveryReport,
+    ThroughputSettings,
+)
+
+FAKE_API_URL = "http://fake-bot-api.local"
+
+
+def _too_many_requests(retry_after: int) -> httpx.Response:
+    return httpx.Response(
+        429,
+        json={
+            "ok": False,
+            "error_code": 429,
+            "description": f"Too Many Requests: retry after {retry_after}",
+            "parameters": {"retry_after": retry_after},
+        },
+    )
+
+
+def _fake_bot_api(
+    latency: float, api_limit: float = 0.0, inject_429: float = 0.0
+) -> httpx.MockTransport:
+    """Фейковый Bot API: задержка ответа, глобальный лимит в сообщениях/сек и случайные 429."""
+    window_started_at = time.monotonic()
+    window_count = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal window_started_at, window_count
+        await asyncio.sleep(latency)
+        if inject_429 and random.random() < inject_429:  # noqa: S311 - не криптография
+            return _too_many_requests(1)
+        if api_limit:
+            now = time.monotonic()
+            if now - window_started_at >= 1.0:
+                window_started_at = now
+                window_count = 0
+            window_count += 1
+            if window_count > api_limit:
+                return _too_many_requests(1)
+        return httpx.Response(200, json={"ok": True, "result": {"message_id": 1}})
+
+    return httpx.MockTransport(handler)
+
+
+def _jobs(count: int):
+    for chat_id in range(1, count + 1):
+        yield DeliveryJob(
+            chat_id=chat_id,
+            method="sendMessage",
+            payload={"chat_id": chat_id, "text": "Benchmark"},
+        )
+
+
+async def _run_engine(count: int, args: argparse.Namespace) -> DeliveryReport:
+    throughput = ThroughputSettings(
+        messages_per_second=args.rate,
+        concurrency=args.concurrency,
+        per_chat_interval=1.0,
+    )
+    transport = _fake_bot_api(args.latency, args.api_limit, args.inject_429)
+    async with httpx.AsyncClient(transport=transport) as client:
+        engine = BroadcastDeliveryEngine(client, "TOKEN", throughput, api_url=FAKE_API_URL)
+        return await engine.deliver(_jobs(count))
+
+
+async def _run_legacy(count: int, args: argparse.Namespace) -> float:
+    """Прежний алгоритм: последовательная отправка и пауза 1 сек. после каждых 30 сообщений."""
+    started_at = time.monotonic()
+    async with httpx.AsyncClient(transport=_fake_bot_api(args.latency)) as client:
+        for idx, job in enumerate(_jobs(count)):
+            if idx > 0 and idx % 30 == 0:
+                await asyncio.sleep(1)
+            await client.post(f"{FAKE_API_URL}/botTOKEN/{job.method}", json=job.payload)
+    return count / (time.monotonic() - started_at)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--rate", type=float, default=1000.0, help="лимит сообщений в секунду")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа API, сек.")
+    parser.add_argument(
+        "--api-limit",
+        type=float,
+        default=0.0,
+        help="лимит фейкового API в сообщениях/сек, сверх него ответ 429 (0 - без лимита)",
+    )
+    parser.add_argument(
+        "--inject-429", type=float, default=0.0, help="доля случайных ответов 429 (0..1)"
+    )
+    parser.add_argument(
+        "--legacy",
+        action="store_true",
+        help="дополнительно замерить старый последовательный цикл (только для 1k)",
+    )
+    args = parser.parse_args()
+
+    print(
+        f"rate={args.rate}/s concurrency={args.concurrency} latency={args.latency * 1000:.0f}ms"
+    )
+    for size in args.sizes:
+        report = await _run_engine(size, args)
+        print(
+            f"engine  {size:>7} получателей: {report.messages_per_second:8.1f} сообщений/сек, "
+            f"отправлено {report.sent}, потеряно {size - report.sent}, "
+            f"429: {report.throttled}, повторов: {report.requeued}, "
+            f"пауза: {report.throttled_seconds:.1f} сек., итоговая скорость: {report.final_rate:.1f}/сек"
+        )
+
+    if args.legacy:
+        rate = await _run_legacy(1_000, args)
+        print(f"legacy  {1_000:>7} получателей: {rate:8.1f} сообщений/сек")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
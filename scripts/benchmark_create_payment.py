@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк оформления счета через POST /api/v1/bot/payments/create.
+
+Запросы идут в ASGI-приложение бэкенда без сети, YooKassa заменена локальной
+заглушкой (scripts/yookassa_stub_server.py) с задержкой `--provider-latency`.
+Время ответа считается до отправки последнего байта тела, время запросов к
+YooKassa вычитается, поэтому в отчете остается собственная стоимость бэкенда:
+запросы к БД, коммиты и сериализация. Уведомление администратора выполняется
+после ответа и в замер не попадает.
+
+Примеры:
+    python -m scripts.benchmark_create_payment --requests 500 --concurrency 8
+    python -m scripts.benchmark_create_payment --database-url postgresql+asyncpg://...
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextvars
+import statistics
+import tempfile
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+from pathlib import Path
+
+import httpx
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from backend.app.api.deps import get_db
+from backend.app.db.base import Base
+from backend.app.integrations.yookassa import yookassa_clients
+from backend.app.main import app
+from backend.app.models.bot import Bot
+from backend.app.models.promo_code import DiscountType, PromoCode
+from backend.app.models.subscription_plan import SubscriptionPlan
+from backend.app.models.user import User
+from backend.app.services.payment_providers import PaymentProviderSettingsService
+
+from .yookassa_stub_server import create_app as create_yookassa_stub
+
+TELEGRAM_ID_BASE = 10_000_000
+PROMO_CODE = "BENCH10"
+
+
+@dataclass(slots=True)
+class _Timing:
+    provider: float = 0.0
+    responded_at: float | None = None
+
+
+_timing: contextvars.ContextVar[_Timing] = contextvars.ContextVar("benchmark_timing")
+
+
+class _ProviderTransport(httpx.AsyncBaseTransport):
+    """Заглушка YooKassa с задержкой; время запросов копится в текущем замере."""
+
+    def __init__(self, latency: float) -> None:
+        self._inner = httpx.ASGITransport(app=create_yookassa_stub())
+        self._latency = latency
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started_at = time.perf_counter()
+        try:
+            await asyncio.sleep(self._latency)
+            return await self._inner.handle_async_request(request)
+        finally:
+            timing = _timing.get(None)
+            if timing is not None:
+                timing.provider += time.perf_counter() - started_at
+
+
+async def _timed_app(scope, receive, send) -> None:
+    """Отмечает момент отправки последнего байта ответа (фоновые задачи идут позже)."""
+    timing = _timing.get()
+
+    async def send_wrapper(message) -> None:
+        await send(message)
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            timing.responded_at = time.perf_counter()
+
+    await app(scope, receive, send_wrapper)
+
+
+async def _prepare(database_url: str, users: int) -> async_sessionmaker:
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as session:
+        bot = Bot(name="Benchmark", slug="benchmark")
+        session.add(bot)
+        await session.flush()
+        session.add(
+            SubscriptionPlan(
+                bot_id=bot.id,
+                name="Месяц",
+                slug="month",
+                price_amount=Decimal("990.00"),
+                duration_days=30,
+            )
+        )
+        session.add(
+            PromoCode(
+                bot_id=bot.id,
+                code=PROMO_CODE,
+                discount_type=DiscountType.PERCENTAGE,
+                discount_value=Decimal("10"),
+            )
+        )
+        session.add_all(
+            User(bot_id=bot.id, telegram_id=TELEGRAM_ID_BASE + idx) for idx in range(users)
+        )
+        await session.commit()
+        await PaymentProviderSettingsService(session).upsert_yookassa_settings(
+            shop_id="bench-shop", api_key="bench-key"
+        )
+    return session_factory
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument(
+        "--provider-latency", type=float, default=0.15, help="задержка ответа YooKassa, сек."
+    )
+    parser.add_argument("--promo-share", type=float, default=0.3, help="доля запросов с промокодом")
+    parser.add_argument("--database-url", default=None, help="по умолчанию временная SQLite")
+    parser.add_argument("--target-p95-ms", type=float, default=300.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}"
+        session_factory = await _prepare(database_url, args.users)
+
+        async def override_get_db():
+            async with session_factory() as session:
+                yield session
+
+        app.dependency_overrides[get_db] = override_get_db
+        yookassa_clients.transport = _ProviderTransport(args.provider_latency)
+
+        own: list[float] = []
+        total: list[float] = []
+        failures = 0
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=_timed_app), base_url="http://backend"
+        ) as client:
+
+            async def one(idx: int) -> None:
+                nonlocal failures
+                payload = {
+                    "telegram_id": TELEGRAM_ID_BASE + idx % args.users,
+                    "plan_id": 1,
+                }
+                if idx % 100 < args.promo_share * 100:
+                    payload["promo_code"] = PROMO_CODE
+                async with semaphore:
+                    timing = _Timing()
+                    token = _timing.set(timing)
+                    started_at = time.perf_counter()
+                    try:
+                        response = await client.post("/api/v1/bot/payments/create", json=payload)
+                    finally:
+                        _timing.reset(token)
+                if response.status_code != 200 or "payment_url" not in response.json():
+                    failures += 1
+                    return
+                elapsed = (timing.responded_at or time.perf_counter()) - started_at
+                total.append(elapsed)
+                own.append(elapsed - timing.provider)
+
+            # Прогрев: кэш учетных данных YooKassa, пул соединений, компиляция запросов
+            await asyncio.gather(*(one(idx) for idx in range(min(20, args.requests))))
+            own.clear()
+            total.clear()
+
+            started_at = time.monotonic()
+            await asyncio.gather(*(one(idx) for idx in range(args.requests)))
+            duration = time.monotonic() - started_at
+
+        app.dependency_overrides.pop(get_db, None)
+        await yookassa_clients.aclose()
+
+    print(
+        f"{args.requests} запросов, concurrency={args.concurrency}, "
+        f"YooKassa {args.provider_latency * 1000:.0f}ms, {len(total) / duration:.1f} rps, "
+        f"ошибок: {failures}"
+    )
+    for label, values in (("с YooKassa  ", total), ("без YooKassa", own)):
+        if not values:
+            continue
+        print(
+            f"{label}: p50 {statistics.median(values) * 1000:7.1f}ms  "
+            f"p95 {_percentile(values, 95) * 1000:7.1f}ms  "
+            f"p99 {_percentile(values, 99) * 1000:7.1f}ms  "
+            f"max {max(values) * 1000:7.1f}ms"
+        )
+    if own:
+        p95 = _percentile(own, 95) * 1000
+        verdict = "OK" if p95 < args.target_p95_ms else "ПРЕВЫШЕН"
+        print(f"цель p95 < {args.target_p95_ms:.0f}ms без YooKassa: {verdict} ({p95:.1f}ms)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Перешифровывает сохраненные секреты (токены ботов, ключи платежных провайдеров)
+текущим BOT_TOKEN_ENCRYPTION_KEY.
+
+Порядок смены ключа: новый ключ в BOT_TOKEN_ENCRYPTION_KEY, прежний — в
+BOT_TOKEN_ENCRYPTION_PREVIOUS_KEYS, запуск скрипта, затем прежний ключ можно убрать.
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+from app.core.crypto import rotate_secret
+from app.db.session import AsyncSessionLocal
+from app.models.bot import Bot
+from app.models.payment_provider_credential import PaymentProviderCredential
+from sqlalchemy import select
+
+
+async def rotate_encryption_keys() -> None:
+    async with AsyncSessionLocal() as session:
+        bots = (
+            await session.execute(select(Bot).where(Bot.telegram_bot_token_encrypted.is_not(None)))
+        ).scalars().all()
+        for bot in bots:
+            encrypted = bot.telegram_bot_token_encrypted
+            token = encrypted.decode() if isinstance(encrypted, bytes) else encrypted
+            bot.telegram_bot_token_encrypted = rotate_secret(token).encode()
+
+        credentials = (
+            await session.execute(
+                select(PaymentProviderCredential).where(
+                    PaymentProviderCredential.api_key_encrypted.is_not(None)
+                )
+            )
+        ).scalars().all()
+        for credential in credentials:
+            credential.api_key_encrypted = rotate_secret(credential.api_key_encrypted)
+
+        await session.commit()
+        print(f"✅ Перешифровано токенов ботов: {len(bots)}, ключей провайдеров: {len(credentials)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(rotate_encryption_keys())
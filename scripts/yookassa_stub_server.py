@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Локальная заглушка API YooKassa для разработки и тестов.
+
+Поддерживает создание платежа (с Idempotence-Key), получение платежа и
+служебные методы: перевод платежа в succeeded/canceled с отправкой уведомления
+на вебхук бэкенда и внедрение сбоев для проверки повторов.
+
+Запуск:
+    python scripts/yookassa_stub_server.py --port 8090 \
+        --webhook-url http://localhost:8000/api/v1/payments/yookassa/webhook
+и YOOKASSA_API_URL=http://localhost:8090/v3 в конфиге бэкенда.
+
+В тестах приложение можно подключить без сети:
+    httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app()))
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import uuid
+from datetime import datetime, timezone
+from typing import Any
+
+import httpx
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+
+def _error(status_code: int, code: str, description: str) -> JSONResponse:
+    return JSONResponse(
+        {"type": "error", "id": str(uuid.uuid4()), "code": code, "description": description},
+        status_code=status_code,
+    )
+
+
+def create_app(webhook_url: str | None = None) -> FastAPI:
+    app = FastAPI(title="YooKassa stub")
+    payments: dict[str, dict[str, Any]] = {}
+    idempotence: dict[tuple[str, str], str] = {}
+    credentials: dict[str, str] = {}
+    faults: dict[str, int] = {"status": 0, "count": 0}
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        if request.url.path.startswith("/v3/") and faults["count"] > 0:
+            faults["count"] -= 1
+            return _error(faults["status"], "internal_server_error", "Injected fault")
+        return await call_next(request)
+
+    def shop_from(request: Request) -> str:
+        auth = request.headers.get("Authorization", "")
+        if not auth.startswith("Basic "):
+            raise HTTPException(status_code=401, detail="Authorization required")
+        shop_id, _, api_key = base64.b64decode(auth[6:]).decode().partition(":")
+        credentials[shop_id] = api_key
+        return shop_id
+
+    @app.post("/v3/payments")
+    async def create_payment(
+        request: Request, idempotence_key: str | None = Header(default=None)
+    ) -> JSONResponse:
+        shop_id = shop_from(request)
+        if not idempotence_key:
+            return _error(400, "invalid_request", "Idempotence-Key header is required")
+        existing = idempotence.get((shop_id, idempotence_key))
+        if existing is not None:
+            return JSONResponse(payments[existing])
+        body = await request.json()
+        payment_id = str(uuid.uuid4())
+        payment = {
+            "id": payment_id,
+            "status": "pending",
+            "paid": False,
+            "amount": body["amount"],
+            "description": body.get("description"),
+            "metadata": body.get("metadata") or {},
+            "recipient": {"account_id": shop_id},
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "confirmation": {
+                "type": "redirect",
+                "return_url": (body.get("confirmation") or {}).get("return_url"),
+                "confirmation_url": f"{request.base_url}checkout/{payment_id}",
+            },
+            "test": True,
+        }
+        payments[payment_id] = payment
+        idempotence[(shop_id, idempotence_key)] = payment_id
+        return JSONResponse(payment)
+
+    @app.get("/v3/payments/{payment_id}")
+    async def get_payment(payment_id: str, request: Request) -> JSONResponse:
+        shop_from(request)
+        payment = payments.get(payment_id)
+        if payment is None:
+            return _error(404, "not_found", "Payment not found")
+        return JSONResponse(payment)
+
+    @app.post("/_stub/payments/{payment_id}/{status}")
+    async def set_status(payment_id: str, status: str) -> JSONResponse:
+        payment = payments.get(payment_id)
+        if payment is None or status not in {"succeeded", "canceled", "waiting_for_capture"}:
+            raise HTTPException(status_code=404)
+        payment["status"] = status
+        payment["paid"] = status == "succeeded"
+        if status == "succeeded":
+            payment["paid_at"] = datetime.now(timezone.utc).isoformat()
+        if webhook_url:
+            shop_id = payment["recipient"]["account_id"]
+            async with httpx.AsyncClient(timeout=10) as client:
+                await client.post(
+                    webhook_url,
+                    json={"type": "notification", "event": f"payment.{status}", "object": payment},
+                    auth=(shop_id, credentials.get(shop_id, "")),
+                )
+        return JSONResponse(payment)
+
+    @app.post("/_stub/faults")
+    async def set_faults(request: Request) -> JSONResponse:
+        """Следующие `count` запросов к API вернут `status` (по умолчанию 500)."""
+        body = await request.json()
+        faults["status"] = int(body.get("status", 500))
+        faults["count"] = int(body.get("count", 1))
+        return JSONResponse(faults)
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--webhook-url", default=None)
+    args = parser.parse_args()
+    asyncio.run(
+        uvicorn.Server(
+            uvicorn.Config(create_app(args.webhook_url), host=args.host, port=args.port)
+        ).serve()
+    )